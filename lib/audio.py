@@ -0,0 +1,287 @@
+"""
+Audio analysis for music reactive effects.
+
+An AudioAnalyzer thread reads PCM blocks from a source (ALSA, a WAV file or
+raw PCM on stdin), computes band energies and beat onsets with NumPy, and
+publishes them as an immutable AudioFeatures snapshot. Effects read the
+latest one with features() in tick(), which is a plain attribute read: the
+analyzer swaps the reference, nothing is locked and the render thread never
+waits for the analysis.
+"""
+
+import collections
+import logging
+import sys
+import threading
+import time
+import wave
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from lib import metrics
+
+logger = logging.getLogger(__name__)
+
+AudioFeatures = collections.namedtuple(
+    "AudioFeatures",
+    [
+        "bands",  # Band energies from bass to treble, 0.0 - 1.0 (auto gain)
+        "level",  # Loudness of the latest block, 0.0 - 1.0
+        "beat",  # Whether a beat onset was detected in the latest block
+        "beats",  # Beats detected so far, effects compare it to catch every one
+        "time",  # time.monotonic() of the snapshot
+    ],
+)
+
+BANDS = 8
+SILENCE = AudioFeatures(np.zeros(BANDS), 0.0, False, 0, 0.0)
+
+_latest = SILENCE
+
+
+def features():
+    """
+    Returns:
+        AudioFeatures: The latest analysis, SILENCE when there is no audio
+    """
+    return _latest
+
+
+def publish(snapshot: AudioFeatures):
+    global _latest
+    _latest = snapshot
+
+
+class WavSource(object):
+    """
+    Plays a WAV file in real time, looping by default. Meant for testing.
+    """
+
+    def __init__(self, path: str, block: int = 1024, loop: bool = True):
+        self.wav = wave.open(path, "rb")
+        self.sample_rate = self.wav.getframerate()
+        self.channels = self.wav.getnchannels()
+        self.dtype, self.offset = {
+            1: (np.uint8, 128),
+            2: (np.int16, 0),
+            4: (np.int32, 0),
+        }[self.wav.getsampwidth()]
+        self.scale = 1.0 / (np.iinfo(self.dtype).max - self.offset + 1)
+        self.block = block
+        self.loop = loop
+        self.next_block = time.monotonic()
+
+    def read(self):
+        data = self.wav.readframes(self.block)
+        if not data and self.loop:
+            self.wav.rewind()
+            data = self.wav.readframes(self.block)
+        if not data:
+            return None
+
+        samples = np.frombuffer(data, dtype=self.dtype).reshape(-1, self.channels)
+        block = (samples.mean(axis=1) - self.offset) * self.scale
+
+        # Pace reads like a live input
+        self.next_block += len(block) / self.sample_rate
+        delay = self.next_block - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self.next_block = time.monotonic()
+        return block
+
+    def close(self):
+        self.wav.close()
+
+
+class StdinSource(object):
+    """
+    Raw signed 16-bit little endian PCM on stdin, e.g.
+    `arecord -f S16_LE -r 44100 -c 1 | python -m lib.owner`.
+    """
+
+    def __init__(self, sample_rate: int = 44100, block: int = 1024, channels: int = 1):
+        self.sample_rate = sample_rate
+        self.block = block
+        self.channels = channels
+        self.stream = sys.stdin.buffer
+
+    def read(self):
+        data = self.stream.read(self.block * self.channels * 2)
+        if len(data) < self.channels * 2:
+            return None
+
+        data = data[: len(data) - len(data) % (self.channels * 2)]
+        samples = np.frombuffer(data, dtype="<i2").reshape(-1, self.channels)
+        return samples.mean(axis=1) * (1.0 / 32768.0)
+
+    def close(self):
+        pass
+
+
+class AlsaSource(object):
+    """
+    ALSA capture device (needs pyalsaaudio), e.g. a USB microphone on the Pi.
+    """
+
+    def __init__(
+        self, device: str = "default", sample_rate: int = 44100, block: int = 1024
+    ):
+        import alsaaudio
+
+        self.sample_rate = sample_rate
+        self.pcm = alsaaudio.PCM(
+            alsaaudio.PCM_CAPTURE,
+            alsaaudio.PCM_NORMAL,
+            device=device,
+            channels=1,
+            rate=sample_rate,
+            format=alsaaudio.PCM_FORMAT_S16_LE,
+            periodsize=block,
+        )
+
+    def read(self):
+        length, data = self.pcm.read()
+        if length < 0:
+            # Overrun, the next read starts a fresh period
+            return np.zeros(0)
+        return np.frombuffer(data, dtype="<i2") * (1.0 / 32768.0)
+
+    def close(self):
+        self.pcm.close()
+
+
+def create_source(spec: str, sample_rate: int = 44100, block: int = 1024):
+    """
+    Build an audio source from a spec: "alsa[:device]", "wav:<path>" or "stdin".
+    """
+    kind, _, arg = spec.partition(":")
+    if kind == "alsa":
+        return AlsaSource(arg or "default", sample_rate, block)
+    if kind == "wav":
+        return WavSource(arg, block)
+    if kind == "stdin":
+        return StdinSource(sample_rate, block)
+
+    raise ValueError(f"Unknown audio source {spec}")
+
+
+class AudioAnalyzer(threading.Thread):
+    """
+    Turns PCM blocks into AudioFeatures snapshots, off the render thread.
+
+    Each block is cut into overlapping Hann windows that are analyzed as one
+    batch: a single rfft over all of them, band energies through a matrix
+    product with log spaced band filters, and spectral flux onsets on the low
+    bands against their recent average.
+    """
+
+    def __init__(
+        self,
+        source,
+        window: int = 1024,
+        hop: int = 512,
+        bands: int = BANDS,
+        beat_threshold: float = 1.5,
+    ):
+        super().__init__(name="audio-analyzer", daemon=True)
+        self.source = source
+        self.window = window
+        self.hop = hop
+        self.beat_threshold = beat_threshold
+        self.running = True
+
+        rate = source.sample_rate
+        self.hann = np.hanning(window)
+        freqs = np.fft.rfftfreq(window, 1.0 / rate)
+        edges = np.geomspace(40.0, min(16000.0, rate / 2), bands + 1)
+        self.filters = np.zeros((bands, len(freqs)))
+        for band in range(bands):
+            inside = (freqs >= edges[band]) & (freqs < edges[band + 1])
+            if inside.any():
+                self.filters[band, inside] = 1.0 / inside.sum()
+
+        self.pending = np.zeros(0)
+        # Auto gain: slowly decaying per band peaks, time constant of ~10 s
+        self.peaks = np.full(bands, 1e-6)
+        self.peak_decay = 0.1 ** (hop / rate / 10.0)
+        # Low band energy of the last ~0.5 s for the onset threshold
+        self.history = collections.deque(maxlen=max(int(0.5 * rate / hop), 1))
+        self.previous = None
+        self.min_beat_interval = 0.1
+        self.last_beat = 0.0
+        self.beats = 0
+
+    def run(self):
+        try:
+            while self.running:
+                block = self.source.read()
+                if block is None:
+                    logger.info("Audio source ended")
+                    break
+                if len(block):
+                    self.analyze(block)
+        except Exception:
+            # Sources may fail a pending read when closed
+            if self.running:
+                logger.exception("Audio analysis failed")
+        finally:
+            publish(SILENCE)
+
+    def analyze(self, block):
+        samples = np.concatenate([self.pending, block])
+        if len(samples) < self.window:
+            self.pending = samples
+            return
+
+        windows = sliding_window_view(samples, self.window)[:: self.hop]
+        self.pending = samples[len(windows) * self.hop :]
+
+        spectrum = np.abs(np.fft.rfft(windows * self.hann, axis=1)) ** 2
+        energies = spectrum @ self.filters.T
+
+        now = time.monotonic()
+        beat = False
+        for energy in energies:
+            self.peaks = np.maximum(self.peaks * self.peak_decay, energy)
+            beat |= self._onset(energy[:2].sum(), now)
+
+        rms = np.sqrt(np.mean(np.square(block)))
+        # -60 dBFS (silence) .. 0 dBFS
+        level = float(np.clip(1.0 + np.log10(rms + 1e-9) / 3.0, 0.0, 1.0))
+
+        metrics.AUDIO_LEVEL.set(level)
+        publish(
+            AudioFeatures(
+                np.clip(energies[-1] / self.peaks, 0.0, 1.0),
+                level,
+                beat,
+                self.beats,
+                now,
+            )
+        )
+
+    def _onset(self, low: float, now: float):
+        previous = self.previous
+        self.previous = low
+        if previous is None:
+            return False
+
+        flux = max(low - previous, 0.0)
+        self.history.append(flux)
+        average = sum(self.history) / len(self.history)
+        if flux <= average * self.beat_threshold or flux < 1e-6:
+            return False
+        if now - self.last_beat < self.min_beat_interval:
+            return False
+
+        self.last_beat = now
+        self.beats += 1
+        metrics.AUDIO_BEATS.inc()
+        return True
+
+    def close(self):
+        self.running = False
+        self.source.close()
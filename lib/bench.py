@@ -0,0 +1,208 @@
+"""
+Headless effect benchmark.
+
+Drives every registered effect's render()/tick() against an in-memory LED,
+without the real-time wait, and reports throughput, per-frame latency and peak
+memory for a range of strip lengths.
+
+    python -m lib.bench
+    python -m lib.bench --effects Fire,Aurora --counts 300,1000 --json out.json
+    python -m lib.bench --baseline main.json --threshold 0.15
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from lib.led import LED, EffectRegistry, MockLed
+
+DEFAULT_COUNTS = (60, 300, 1000, 5000)
+SEED = 0
+
+
+def seed_effect(effect):
+    # Effects with random state get a fixed seed so runs are comparable
+    random.seed(SEED)
+    if isinstance(getattr(effect, "rng", None), np.random.Generator):
+        effect.rng = np.random.default_rng(SEED)
+
+
+def _drive(effect_class, led, frames: int, dt: float, timings: list = None):
+    effect = effect_class(led)
+    seed_effect(effect)
+
+    t = 0.0
+    for _ in range(frames):
+        t += dt
+        start = time.perf_counter()
+        led.write_frame(effect.render(t, dt))
+        if timings is not None:
+            timings.append(time.perf_counter() - start)
+
+
+def _percentile(sorted_values: list, q: float):
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def bench_effect(effect_class, count: int, frames: int, warmup: int, fps: float):
+    dt = 1.0 / fps
+    # Frames are committed to an in-memory strip, nothing is transmitted
+    led = LED(None, count, backend=MockLed(count, history=0))
+
+    # Warm caches, lazy allocations and the import machinery first
+    _drive(effect_class, led, warmup, dt)
+
+    timings = []
+    start = time.perf_counter()
+    _drive(effect_class, led, frames, dt, timings)
+    total = time.perf_counter() - start
+
+    # Memory is measured in a separate pass, tracemalloc skews the timings
+    tracemalloc.start()
+    try:
+        _drive(effect_class, led, min(frames, 60), dt)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "fps": round(frames / total, 1),
+        "p50_ms": round(_percentile(timings, 0.50) * 1000, 4),
+        "p99_ms": round(_percentile(timings, 0.99) * 1000, 4),
+        "mean_ms": round(statistics.fmean(timings) * 1000, 4),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(effects: list, counts: list, frames: int, warmup: int, fps: float):
+    registry = EffectRegistry()
+    names = effects or sorted(registry.get_names())
+
+    results = []
+    for name in names:
+        effect_class = registry.get(name)
+        for count in counts:
+            result = {"effect": name, "leds": count}
+            result.update(bench_effect(effect_class, count, frames, warmup, fps))
+            results.append(result)
+            print(_format_row(result), file=sys.stderr)
+
+    return {
+        "meta": {
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "frames": frames,
+            "fps": fps,
+            "seed": SEED,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float):
+    """
+    Compare fps against a baseline report, return the list of regressions.
+    """
+    previous = {(r["effect"], r["leds"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get((result["effect"], result["leds"]))
+        if not old or not old["fps"]:
+            continue
+
+        change = result["fps"] / old["fps"] - 1.0
+        result["fps_change"] = round(change, 3)
+        if change < -threshold:
+            regressions.append(result)
+
+    return regressions
+
+
+def _format_row(result: dict):
+    return (
+        f"{result['effect']:<20} {result['leds']:>6} LEDs "
+        f"{result['fps']:>10.1f} fps  p50 {result['p50_ms']:>8.3f} ms  "
+        f"p99 {result['p99_ms']:>8.3f} ms  peak {result['peak_kib']:>9.1f} KiB"
+    )
+
+
+def _csv(value: str):
+    return [item for item in value.split(",") if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m lib.bench", description="Benchmark LightWave effects"
+    )
+    parser.add_argument(
+        "--effects", type=_csv, default=[], help="Comma separated effect names"
+    )
+    parser.add_argument(
+        "--counts",
+        type=lambda v: [int(c) for c in _csv(v)],
+        default=list(DEFAULT_COUNTS),
+        help="Comma separated LED counts",
+    )
+    parser.add_argument("--frames", type=int, default=300, help="Frames per run")
+    parser.add_argument("--warmup", type=int, default=30, help="Warmup frames")
+    parser.add_argument("--fps", type=float, default=60.0, help="Simulated frame rate")
+    parser.add_argument("--json", help="Write the report to this file ('-' for stdout)")
+    parser.add_argument("--baseline", help="Report to compare fps against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Relative fps drop that counts as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    report = run(args.effects, args.counts, args.frames, args.warmup, args.fps)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    for result in regressions:
+        print(
+            f"REGRESSION {result['effect']} @ {result['leds']} LEDs: "
+            f"{result['fps_change']:+.1%} fps",
+            file=sys.stderr,
+        )
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import math
+
+import numpy as np
+
+# Color temperature (in Kelvin) that leaves white untouched
+NEUTRAL_TEMPERATURE = 6600.0
+
+# Offsets of the R, G and B tables in a flattened correction table
+CHANNEL_OFFSETS = np.array([0, 256, 512], dtype=np.int16)
+
+
+def check_correction(gamma: float = None, temperature: float = None):
+    """
+    Raises:
+        ValueError: The gamma or the color temperature is out of range
+    """
+    if gamma is not None and gamma <= 0:
+        raise ValueError("gamma must be positive")
+    if temperature is not None and not 1000 <= temperature <= 40000:
+        raise ValueError("temperature must be within 1000..40000 K")
+
+
+def white_point(temperature: float):
+    """
+    RGB gains (0.0 - 1.0) of a black body at `temperature` Kelvin.
+
+    Uses Tanner Helland's curve fit, accurate enough for white balancing LEDs
+    between 1000 K and 40000 K.
+    """
+    t = temperature / 100.0
+
+    if t <= 66:
+        r = 255.0
+        g = 99.4708025861 * math.log(t) - 161.1195681661
+    else:
+        r = 329.698727446 * (t - 60) ** -0.1332047592
+        g = 288.1221695283 * (t - 60) ** -0.0755148492
+
+    if t >= 66:
+        b = 255.0
+    elif t <= 19:
+        b = 0.0
+    else:
+        b = 138.5177312231 * math.log(t - 10) - 305.0447927307
+
+    return tuple(min(max(c, 0.0), 255.0) / 255.0 for c in (r, g, b))
+
+
+def correction_table(
+    gamma: float = 1.0,
+    temperature: float = NEUTRAL_TEMPERATURE,
+    brightness: float = 1.0,
+):
+    """
+    Per-channel lookup table combining gamma, white balance and brightness.
+
+    Returns:
+        np.ndarray: (3, 256) uint8 table, row c maps values of channel c,
+            None when it would leave every value unchanged
+    """
+    curve = (np.arange(256) / 255.0) ** gamma * 255.0
+    gains = np.array(white_point(temperature)) * brightness
+    table = np.rint(np.outer(gains, curve)).clip(0, 255).astype(np.uint8)
+
+    if (table == np.arange(256, dtype=np.uint8)).all():
+        return None
+    return table
+
+
+def apply_table(table, pixels, out):
+    """
+    Map an (N, 3) uint8 array through a correction table into `out` in one pass.
+    """
+    np.take(table.reshape(-1), pixels + CHANNEL_OFFSETS, out=out)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from lib.transitions import as_array
+
+
+def _add(below, above):
+    return below + above
+
+
+def _max(below, above):
+    return np.maximum(below, above)
+
+
+def _multiply(below, above):
+    return below * above * (1.0 / 255.0)
+
+
+def _alpha(below, above):
+    # LEDs have no alpha channel: black is transparent and a pixel covers what
+    # is below it in proportion to its brightest channel
+    alpha = above.max(axis=1, keepdims=True) * (1.0 / 255.0)
+    return below + (above - below) * alpha
+
+
+BLEND_MODES = {
+    "add": _add,
+    "max": _max,
+    "multiply": _multiply,
+    "alpha": _alpha,
+}
+
+DEFAULT_BLEND = "alpha"
+
+
+def composite(base, layers):
+    """
+    Stack layers over a base frame.
+
+    Args:
+        base: RGB frame of the bottom layer (bytes, memoryview or ndarray)
+        layers: (frame, blend mode, opacity) tuples, bottom to top
+
+    Returns:
+        np.ndarray: Flat uint8 RGB frame
+    """
+    out = as_array(base).reshape(-1, 3).astype(np.float32)
+    for frame, blend, opacity in layers:
+        if opacity <= 0.0:
+            continue
+
+        above = as_array(frame).reshape(-1, 3).astype(np.float32)
+        mixed = BLEND_MODES[blend](out, above)
+        if opacity < 1.0:
+            mixed = out + (mixed - out) * opacity
+        out = mixed
+
+    np.clip(out, 0.0, 255.0, out=out)
+    return out.astype(np.uint8).reshape(-1)
@@ -1,5 +1,78 @@
 import os
-import board
+
+try:
+    import board
+except (ImportError, NotImplementedError, RuntimeError):
+    # Not running on supported hardware (or Blinka isn't installed)
+    board = None
 
 LED_COUNT = int(os.getenv("LED_COUNT", 300))
-LED_PIN = getattr(board, os.getenv("LED_PIN", "D18"))
+LED_PIN = getattr(board, os.getenv("LED_PIN", "D18"), None)
+
+
+def _segments(value: str):
+    # "name:start:length[:reverse],..."
+    segments = []
+    for item in filter(None, value.split(",")):
+        name, start, length, *flags = item.strip().split(":")
+        segments.append((name, int(start), int(length), "reverse" in flags))
+    return segments
+
+
+# Named ranges of the strip that can run their own preset
+LED_SEGMENTS = _segments(os.getenv("LED_SEGMENTS", ""))
+
+# Color correction applied to every frame, 1.0 is linear and 6600 K leaves white untouched
+LED_GAMMA = float(os.getenv("LED_GAMMA", 1.0))
+LED_TEMPERATURE = float(os.getenv("LED_TEMPERATURE", 6600))
+
+# "auto" picks neopixel when the hardware libraries are available, otherwise "mock"
+LED_BACKEND = os.getenv("LED_BACKEND", "auto")
+
+# Cached data (effect manifest, ...) lives here
+CACHE_DIR = os.getenv(
+    "LIGHTWAVE_CACHE_DIR",
+    os.path.join(
+        os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "lightwave"
+    ),
+)
+
+# Re-import effect modules when their files change, and restart the running preset if its class changed
+EFFECTS_HOT_RELOAD = os.getenv("EFFECTS_HOT_RELOAD", "1") == "1"
+EFFECTS_RELOAD_RESTART = os.getenv("EFFECTS_RELOAD_RESTART", "1") == "1"
+
+# Default crossfade / fade out when switching or stopping presets
+TRANSITION_DURATION = float(os.getenv("TRANSITION_DURATION", 0.5))
+TRANSITION_EASING = os.getenv("TRANSITION_EASING", "ease_in_out")
+
+# Memory cap of the cycles of periodic presets (rainbow, ...) kept pre-rendered, 0 disables it
+FRAME_CACHE_SIZE = int(float(os.getenv("FRAME_CACHE_MB", 16)) * 1024 * 1024)
+
+# UDP ports sequencers (xLights, Hyperion, ...) can stream pixels to, 0 disables a
+# protocol. Off by default: anyone on the network can take over the strip with them
+# (DDP is usually 4048, E1.31 5568). Streamed frames pre-empt the presets until none
+# arrived for REALTIME_TIMEOUT seconds
+REALTIME_DDP_PORT = int(os.getenv("REALTIME_DDP_PORT", 0))
+REALTIME_E131_PORT = int(os.getenv("REALTIME_E131_PORT", 0))
+REALTIME_E131_UNIVERSE = int(os.getenv("REALTIME_E131_UNIVERSE", 1))
+REALTIME_TIMEOUT = float(os.getenv("REALTIME_TIMEOUT", 2.5))
+
+# Audio input for music reactive effects: "alsa[:device]", "wav:<path>" or "stdin"
+# (raw S16_LE PCM). Empty disables audio analysis
+AUDIO_SOURCE = os.getenv("AUDIO_SOURCE", "")
+AUDIO_SAMPLE_RATE = int(os.getenv("AUDIO_SAMPLE_RATE", 44100))
+AUDIO_BLOCK = int(os.getenv("AUDIO_BLOCK", 1024))
+
+# The running presets, layers, segments, color and color correction are saved here
+# (at most once per STATE_SAVE_DELAY seconds) and restored on startup, empty disables it
+STATE_FILE = os.getenv("LIGHTWAVE_STATE_FILE", os.path.join(CACHE_DIR, "state.json"))
+STATE_SAVE_DELAY = float(os.getenv("STATE_SAVE_DELAY", 1.0))
+
+# Rendered effect previews (GET /presets/{name}/preview) are cached here, the least
+# recently used are removed above PREVIEW_CACHE_MB, 0 disables the cache
+PREVIEW_CACHE_DIR = os.path.join(CACHE_DIR, "previews")
+PREVIEW_CACHE_SIZE = int(float(os.getenv("PREVIEW_CACHE_MB", 64)) * 1024 * 1024)
+
+# Control socket of the hardware owner process (python -m lib.owner). When set,
+# the API talks to that process instead of driving the strip itself
+ENGINE_SOCKET = os.getenv("LIGHTWAVE_ENGINE_SOCKET", "")
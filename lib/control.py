@@ -0,0 +1,678 @@
+import logging
+
+from lib import metrics
+from lib.audio import AudioAnalyzer, create_source
+from lib.color import check_correction
+from lib.compositor import BLEND_MODES, DEFAULT_BLEND
+from lib.engine import RenderEngine
+from lib.realtime import RealtimeServer
+from lib.schedule import Scheduler
+from lib.transitions import DEFAULT_EASING
+
+logger = logging.getLogger(__name__)
+
+
+def effect_info(effect):
+    """
+    JSON friendly summary of a running effect, None when nothing is running.
+    """
+    if effect is None:
+        return None
+
+    return {
+        "name": effect.__class__.__name__,
+        "start_time": effect.start_time.isoformat(),
+        "target_fps": effect.target_fps,
+        "frames_rendered": effect.frames_rendered,
+        "frames_dropped": effect.frames_dropped,
+        "fps": effect.fps,
+    }
+
+
+def layer_info(layer):
+    return {
+        "segment": layer["segment"],
+        "blend": layer["blend"],
+        "opacity": layer["opacity"],
+        "preset": effect_info(layer["effect"]),
+    }
+
+
+def segment_info(segment):
+    return {
+        "start": segment.start,
+        "length": segment.length,
+        "reverse": segment.reverse,
+    }
+
+
+class Controller(object):
+    """
+    Everything the API can do to the strip, on top of a RenderEngine.
+
+    Used directly by the server when it owns the hardware itself, or inside
+    the hardware owner process (lib.owner) where API workers reach it through
+    a RemoteController with the same methods.
+    """
+
+    def __init__(
+        self,
+        led,
+        effect_registry,
+        transition: float = 0.5,
+        easing: str = DEFAULT_EASING,
+        reload_restart: bool = True,
+        state=None,
+        frame_cache=None,
+        store=None,
+    ):
+        self.led = led
+        self.effect_registry = effect_registry
+        self.transition = transition
+        self.easing = easing
+        self.reload_restart = reload_restart
+        self.store = store
+        # What was asked for rather than what the engine shows right now, so
+        # a snapshot taken mid fade is the settled state
+        self.color = None
+        self.correction = {
+            "brightness": led.brightness,
+            "gamma": led.gamma,
+            "temperature": led.temperature,
+        }
+
+        self.engine = RenderEngine(led, state, frame_cache)
+        self.engine.start()
+        self.scheduler = Scheduler(self._start, self._stop, self._save)
+        self.scheduler.start()
+        self.realtime = None
+        self.audio = None
+
+    def start(
+        self,
+        preset_name: str,
+        args: dict = None,
+        transition: float = None,
+        easing: str = None,
+        segment: str = None,
+    ):
+        """
+        Start a preset, crossfading from the running one. Does not block, the
+        render engine performs the transition.
+
+        Args:
+            preset_name (str): Name of the preset to start
+            args (dict): Arguments to configure the effect
+            transition (float): Crossfade duration in seconds
+            easing (str): Crossfade easing curve
+            segment (str): Segment to run it on, defaults to the whole strip
+
+        Raises:
+            KeyError: The preset or the segment doesn't exist
+            TypeError, ValueError: The effect rejected its arguments
+        """
+        segment = segment or self.led.ALL
+        self._start(preset_name, args, transition, easing, segment)
+        self.scheduler.release(segment)
+        self._save()
+
+    def _start(self, preset_name, args, transition, easing, segment):
+        segment = self.led.segments[segment]
+        args = self.effect_registry.validate_config(preset_name, args)
+        effect = self.effect_registry.get(preset_name)(segment, **args)
+        self.engine.start_effect(
+            segment,
+            effect,
+            self.transition if transition is None else transition,
+            easing or self.easing,
+        )
+        if segment.name == self.led.ALL:
+            self.color = None
+
+    def update(self, args: dict, segment: str = None):
+        """
+        Change parameters of the running preset from its next frame on,
+        without restarting it. Only parameters that change are applied.
+
+        Args:
+            args (dict): Arguments to change (and/or target_fps)
+            segment (str): Segment the preset runs on, defaults to the whole strip
+
+        Raises:
+            KeyError: No preset is running on the segment
+            ValueError: Unknown arguments, or values that don't fit the effect's CONFIG_SCHEMA
+        """
+        segment = segment or self.led.ALL
+        effect = self.engine.effects[segment]
+        self.engine.update_effect(
+            segment,
+            self.effect_registry.validate_config(effect.__class__.__name__, args),
+        )
+        self._save()
+
+    def stop(self, transition: float = None, easing: str = None, segment: str = None):
+        """
+        Stop the running preset (if any). Does not block, the render engine
+        fades the LEDs out to black.
+
+        Args:
+            transition (float): Fade out duration in seconds
+            easing (str): Fade out easing curve
+            segment (str): Only stop the preset on this segment, defaults to all of them
+        """
+        self.scheduler.release(segment)
+        self._stop(transition, easing, segment)
+        self._save()
+
+    def _stop(self, transition, easing, segment):
+        self.engine.stop_effect(
+            segment,
+            self.transition if transition is None else transition,
+            easing or self.easing,
+        )
+        if segment is None:
+            self.color = None
+
+    def add_layer(
+        self,
+        name: str,
+        preset_name: str,
+        args: dict = None,
+        blend: str = DEFAULT_BLEND,
+        opacity: float = 1.0,
+        transition: float = None,
+        easing: str = None,
+        segment: str = None,
+    ):
+        """
+        Stack a preset over a segment as a named layer, replacing the layer
+        with that name if there is one. Does not block.
+
+        Args:
+            name (str): Name of the layer
+            preset_name (str): Name of the preset to render in the layer
+            args (dict): Arguments to configure the effect
+            blend (str): Blend mode (see lib.compositor.BLEND_MODES)
+            opacity (float): Opacity from 0.0 to 1.0
+            transition (float): Fade in duration in seconds
+            easing (str): Fade in easing curve
+            segment (str): Segment to stack it on, defaults to the whole strip
+
+        Raises:
+            KeyError: The preset or the segment doesn't exist
+            TypeError, ValueError: The effect rejected its arguments, or unknown blend mode
+        """
+        if blend not in BLEND_MODES:
+            raise ValueError(f"Unknown blend mode {blend}")
+
+        segment = self.led.segments[segment or self.led.ALL]
+        args = self.effect_registry.validate_config(preset_name, args)
+        effect = self.effect_registry.get(preset_name)(segment, **args)
+        self.engine.add_layer(
+            name,
+            segment,
+            effect,
+            blend,
+            opacity,
+            self.transition if transition is None else transition,
+            easing or self.easing,
+        )
+        self._save()
+
+    def update_layer(self, name: str, blend: str = None, opacity: float = None):
+        """
+        Change the blend mode and/or opacity of a layer.
+
+        Raises:
+            KeyError: The layer doesn't exist
+            ValueError: Unknown blend mode
+        """
+        if blend is not None and blend not in BLEND_MODES:
+            raise ValueError(f"Unknown blend mode {blend}")
+
+        self.engine.update_layer(name, blend, opacity)
+        self._save()
+
+    def remove_layer(self, name: str, transition: float = None, easing: str = None):
+        """
+        Fade a layer out and remove it. Does not block.
+
+        Raises:
+            KeyError: The layer doesn't exist
+        """
+        self.engine.remove_layer(
+            name,
+            self.transition if transition is None else transition,
+            easing or self.easing,
+        )
+        self._save()
+
+    def define_segment(self, name: str, start: int, length: int, reverse: bool = False):
+        """
+        Define or redefine a segment, a preset running on it is stopped.
+
+        Raises:
+            ValueError: The range is outside of the strip, or the name is reserved
+        """
+        self.led.add_segment(name, start, length, reverse)
+        self.engine.drop_segment(name)
+        self.scheduler.release(name)
+        self._save()
+
+    def remove_segment(self, name: str):
+        """
+        Remove a segment, a preset running on it is stopped.
+
+        Raises:
+            KeyError: The segment doesn't exist
+            ValueError: The segment is the whole strip
+        """
+        self.led.remove_segment(name)
+        self.engine.drop_segment(name)
+        self.scheduler.release(name)
+        self._save()
+
+    def set_color(self, color: tuple):
+        self.scheduler.release()
+        self.engine.set_color(tuple(color))
+        self.color = list(color)
+        self._save()
+
+    def clear(self):
+        self.scheduler.release()
+        self.engine.clear()
+        self.color = None
+        self._save()
+
+    def set_brightness(self, brightness: float):
+        self.set_correction(brightness=brightness)
+
+    def set_correction(
+        self, gamma: float = None, temperature: float = None, brightness: float = None
+    ):
+        """
+        Change the gamma, color temperature and/or brightness the strip is
+        corrected with. Does not block.
+
+        Raises:
+            ValueError: The gamma or the color temperature is out of range
+        """
+        check_correction(gamma, temperature)
+        self.engine.set_correction(gamma, temperature, brightness)
+        for key, value in (
+            ("gamma", gamma),
+            ("temperature", temperature),
+            ("brightness", brightness),
+        ):
+            if value is not None:
+                self.correction[key] = float(value)
+        self._save()
+
+    def set_playlist(self, name: str, entries: list, loop: bool = True):
+        """
+        Create or replace a playlist.
+
+        Args:
+            name (str): Name of the playlist
+            entries (list): Dicts with the "preset" to start, its "args", the
+                "duration" to play it for in seconds and an optional
+                "transition" and "easing"
+            loop (bool): Start over after the last entry, otherwise keep it running
+
+        Raises:
+            ValueError: The playlist has no entries
+        """
+        self.scheduler.set_playlist(name, {"entries": list(entries), "loop": loop})
+
+    def remove_playlist(self, name: str):
+        """
+        Remove a playlist, segments playing it keep their current preset.
+
+        Raises:
+            KeyError: The playlist doesn't exist
+        """
+        self.scheduler.remove_playlist(name)
+
+    def play_playlist(self, name: str, segment: str = None, index: int = 0):
+        """
+        Play a playlist on a segment, replacing its preset. Starting a preset,
+        a color or another playlist on the segment ends it.
+
+        Raises:
+            KeyError: The playlist or the segment doesn't exist
+        """
+        segment = segment or self.led.ALL
+        if segment not in self.led.segments:
+            raise KeyError(f"Segment {segment} not found")
+        self.scheduler.play(name, segment, index)
+
+    def stop_playlist(self, segment: str = None):
+        """
+        Stop advancing the playlist on a segment (all of them by default), its
+        current preset keeps running.
+        """
+        self.scheduler.release(segment)
+        self._save()
+
+    def set_rule(self, name: str, rule: dict):
+        """
+        Create or replace a schedule rule, see lib.schedule.Scheduler.
+
+        Raises:
+            ValueError: Invalid cron expression
+        """
+        if rule.get("playlist") or rule.get("preset"):
+            rule = dict(rule, segment=rule.get("segment") or self.led.ALL)
+        self.scheduler.set_rule(name, rule)
+
+    def remove_rule(self, name: str):
+        """
+        Raises:
+            KeyError: The rule doesn't exist
+        """
+        self.scheduler.remove_rule(name)
+
+    def schedule(self):
+        """
+        Returns:
+            dict: The playlists, the rules with their next run, the playlist
+                playing on each segment and the next scheduled change
+        """
+        state = self.scheduler.state()
+        next_runs = self.scheduler.next_runs()
+        for name, rule in state["rules"].items():
+            rule["next_run"] = next_runs.get(name)
+        state["next"] = self.scheduler.next_change()
+        return state
+
+    def state(self):
+        """
+        Returns:
+            dict: The running effects by segment (see effect_info), the
+                layers by name (see layer_info), the segments (see
+                segment_info) and the strip's color correction
+        """
+        return {
+            "effects": {
+                name: effect_info(effect)
+                for name, effect in self.engine.effects.items()
+            },
+            "layers": {
+                name: layer_info(layer) for name, layer in self.engine.layers.items()
+            },
+            "segments": {
+                name: segment_info(segment)
+                for name, segment in self.led.segments.items()
+            },
+            "brightness": self.led.brightness,
+            "gamma": self.led.gamma,
+            "temperature": self.led.temperature,
+        }
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: What is needed to bring the strip back to its current state
+                with restore(), JSON friendly
+        """
+        return {
+            "segments": {
+                name: segment_info(segment)
+                for name, segment in self.led.segments.items()
+                if name != self.led.ALL
+            },
+            "presets": {
+                name: {
+                    "preset": effect.__class__.__name__,
+                    "args": {**effect.config, "target_fps": effect.target_fps},
+                }
+                for name, effect in self.engine.effects.items()
+            },
+            "layers": {
+                name: {
+                    "preset": layer["effect"].__class__.__name__,
+                    "args": {
+                        **layer["effect"].config,
+                        "target_fps": layer["effect"].target_fps,
+                    },
+                    "segment": layer["segment"],
+                    "blend": layer["blend"],
+                    "opacity": layer["opacity"],
+                }
+                for name, layer in self.engine.layers.items()
+            },
+            "color": self.color,
+            **self.correction,
+            **self.scheduler.state(),
+        }
+
+    def restore(self):
+        """
+        Bring the strip back to the snapshot saved in the store (if any).
+
+        Only the effect modules of the restored presets get imported. Parts of
+        the snapshot that no longer apply (a removed preset, a segment past
+        the end of a shorter strip, arguments that don't validate, ...) are
+        skipped, and left out of the state file from then on.
+        """
+        if self.store is None:
+            return
+        snapshot = self.store.load()
+        if not snapshot:
+            return
+
+        logger.info("Restoring the saved state from %s", self.store.path)
+
+        def attempt(what, func, *args, **kwargs):
+            try:
+                func(*args, **kwargs)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning("Not restoring %s: %s", what, e)
+
+        def valid(what, preset, args):
+            # Stored arguments are checked like the API checks them before
+            # they get anywhere near the engine, a bad entry is dropped
+            try:
+                self.effect_registry.validate_config(preset, args)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning("Not restoring %s: %s", what, e)
+                return False
+            return True
+
+        segments = snapshot.get("segments", {})
+        for name in list(self.led.segments):
+            if name != self.led.ALL and name not in segments:
+                attempt(f"segment removal {name}", self.remove_segment, name)
+        for name, segment in segments.items():
+            attempt(f"segment {name}", self.define_segment, name, **segment)
+
+        attempt(
+            "color correction",
+            self.set_correction,
+            snapshot.get("gamma"),
+            snapshot.get("temperature"),
+            snapshot.get("brightness"),
+        )
+        if snapshot.get("color"):
+            attempt("color", self.set_color, snapshot["color"])
+
+        for name, playlist in snapshot.get("playlists", {}).items():
+            entries = [
+                entry
+                for entry in playlist.get("entries", [])
+                if valid(
+                    f"{entry['preset']} in playlist {name}",
+                    entry["preset"],
+                    entry.get("args"),
+                )
+            ]
+            attempt(
+                f"playlist {name}",
+                self.scheduler.set_playlist,
+                name,
+                dict(playlist, entries=entries),
+            )
+        for name, rule in snapshot.get("rules", {}).items():
+            if rule.get("preset") and not valid(
+                f"rule {name}", rule["preset"], rule.get("args")
+            ):
+                continue
+            attempt(f"rule {name}", self.scheduler.set_rule, name, rule)
+
+        playing = snapshot.get("playing", {})
+        for name, preset in snapshot.get("presets", {}).items():
+            if name in playing:
+                # Started by the playlist below
+                continue
+            # start() and add_layer() validate the arguments like the API
+            attempt(
+                f"preset {preset['preset']} on {name}",
+                self.start,
+                preset["preset"],
+                preset["args"],
+                segment=name,
+            )
+        for name, layer in snapshot.get("layers", {}).items():
+            attempt(
+                f"layer {name}",
+                self.add_layer,
+                name,
+                layer["preset"],
+                layer["args"],
+                blend=layer["blend"],
+                opacity=layer["opacity"],
+                segment=layer["segment"],
+            )
+        for name, resume in playing.items():
+            attempt(
+                f"playlist {resume['playlist']} on {name}",
+                self.play_playlist,
+                resume["playlist"],
+                name,
+                resume["index"],
+            )
+
+        # Whatever was dropped is left out of the next save
+        self._save()
+
+    def _save(self):
+        if self.store is not None:
+            self.store.save(self.snapshot)
+
+    def metrics(self):
+        return metrics.REGISTRY.expose()
+
+    def frame(self):
+        """
+        Returns:
+            bytes: The RGB frame last transmitted to the strip
+        """
+        return self.led.shown
+
+    def on_effects_reloaded(self, names: set):
+        """
+        Called from the effect watcher, restarts the running preset if its class changed
+
+        Args:
+            names (set): Names of the effects that were reloaded
+        """
+        if self.engine.frame_cache is not None:
+            self.engine.frame_cache.forget(names)
+
+        if not self.reload_restart:
+            return
+
+        for segment, running in self.engine.effects.items():
+            name = running.__class__.__name__
+            if name not in names:
+                continue
+
+            if not self.effect_registry.is_effect(name):
+                logger.info("Running preset %s was removed, stopping it", name)
+                self.stop(segment=segment)
+                continue
+
+            logger.info("Restarting preset %s after reload", name)
+            try:
+                self.start(
+                    name,
+                    {**running.config, "target_fps": running.target_fps},
+                    segment=segment,
+                )
+            except (TypeError, ValueError) as e:
+                logger.warning("Keeping the previous %s running: %s", name, e)
+
+        for layer_name, layer in self.engine.layers.items():
+            running = layer["effect"]
+            name = running.__class__.__name__
+            if name not in names:
+                continue
+
+            if not self.effect_registry.is_effect(name):
+                logger.info(
+                    "Layer %s preset %s was removed, removing it", layer_name, name
+                )
+                self.remove_layer(layer_name)
+                continue
+
+            logger.info("Restarting layer %s after reload", layer_name)
+            try:
+                self.add_layer(
+                    layer_name,
+                    name,
+                    {**running.config, "target_fps": running.target_fps},
+                    blend=layer["blend"],
+                    opacity=layer["opacity"],
+                    segment=layer["segment"],
+                )
+            except (TypeError, ValueError) as e:
+                logger.warning(
+                    "Keeping the previous %s in layer %s: %s", name, layer_name, e
+                )
+
+    def listen_realtime(
+        self, ddp_port: int, e131_port: int, universe: int = 1, timeout: float = 2.5
+    ):
+        """
+        Let sequencers drive the strip over DDP and E1.31 (see lib.realtime).
+
+        Args:
+            ddp_port (int): UDP port for DDP, 0 to disable it
+            e131_port (int): UDP port for E1.31, 0 to disable it
+            universe (int): First E1.31 universe of the strip
+            timeout (float): Seconds without frames before the presets take over again
+        """
+        if not ddp_port and not e131_port:
+            return
+
+        self.realtime = RealtimeServer(
+            self.engine, ddp_port, e131_port, universe, timeout
+        )
+        self.realtime.start()
+        self.realtime.ready.wait()
+
+    def listen_audio(self, source: str, sample_rate: int = 44100, block: int = 1024):
+        """
+        Analyze audio for music reactive effects (see lib.audio).
+
+        Args:
+            source (str): "alsa[:device]", "wav:<path>" or "stdin"
+            sample_rate (int): Sample rate of ALSA and stdin input
+            block (int): Samples read at a time
+        """
+        self.audio = AudioAnalyzer(create_source(source, sample_rate, block))
+        self.audio.start()
+
+    def close(self):
+        """
+        Fade out the running preset, clear the strip and stop the render engine.
+        """
+        if self.realtime is not None:
+            self.realtime.close()
+        if self.audio is not None:
+            self.audio.close()
+        self.scheduler.close()
+        if self.store is not None:
+            self.store.flush()
+        self.engine.shutdown(self.transition, self.easing)
+        self.engine.join(timeout=self.transition + 1.0)
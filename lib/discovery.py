@@ -0,0 +1,240 @@
+import ast
+import hashlib
+import json
+import logging
+import os
+from typing import Annotated, Any
+
+from pydantic import AfterValidator, ConfigDict, Field, create_model
+from pydantic_extra_types.color import Color
+
+logger = logging.getLogger(__name__)
+
+# Bump when the manifest layout or the parsing rules change
+MANIFEST_VERSION = 1
+
+# Classes that make a subclass an effect, more are added as effects are found
+EFFECT_BASES = ("EffectBase", "VectorEffectBase")
+
+
+# Any color pydantic_extra_types understands ("#ff0000", "red", [255, 0, 0],
+# "hsl(0, 100%, 50%)", ...), handed to effects as an (r, g, b) tuple
+RGB = Annotated[Color, AfterValidator(lambda color: color.as_rgb_tuple(alpha=False))]
+
+# CONFIG_SCHEMA types, anything else is passed through as is
+CONFIG_TYPES = {"int": int, "float": float, "bool": bool, "str": str, "color": RGB}
+
+
+def config_model(name: str, schema: list):
+    """
+    Compile an effect's CONFIG_SCHEMA into a pydantic model named
+    `<name>Args`. Unknown parameters are rejected.
+    """
+    fields = {
+        param["name"]: (
+            CONFIG_TYPES.get(param.get("type"), Any),
+            Field(param.get("default"), description=param.get("description")),
+        )
+        for param in schema
+    }
+    return create_model(f"{name}Args", __config__=ConfigDict(extra="forbid"), **fields)
+
+
+def _base_name(node: ast.expr):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def _class_schema(node: ast.ClassDef):
+    for statement in node.body:
+        if isinstance(statement, ast.Assign):
+            targets = [_base_name(target) for target in statement.targets]
+        elif isinstance(statement, ast.AnnAssign) and statement.value is not None:
+            targets = [_base_name(statement.target)]
+        else:
+            continue
+
+        if "CONFIG_SCHEMA" in targets:
+            try:
+                return ast.literal_eval(statement.value)
+            except ValueError:
+                # Computed at import time, can't be known statically
+                return None
+
+    return []
+
+
+def _is_abstract(node: ast.ClassDef):
+    for statement in node.body:
+        if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if "abstractmethod" in map(_base_name, statement.decorator_list):
+                return True
+    return False
+
+
+def parse_module(source: str, filename: str = "<effect>"):
+    """
+    Statically list the classes defined in an effect module.
+
+    Returns a list of {"name", "bases", "abstract", "description",
+    "config_schema"} dicts, "config_schema" is [] when not defined and None
+    when not a literal.
+    """
+    classes = []
+    for node in ast.parse(source, filename=filename).body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+
+        classes.append(
+            {
+                "name": node.name,
+                "bases": [b for b in map(_base_name, node.bases) if b],
+                "abstract": _is_abstract(node),
+                "description": ast.get_docstring(node, clean=False),
+                "config_schema": _class_schema(node),
+            }
+        )
+    return classes
+
+
+def _file_hash(path: str):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _load_manifest(manifest_path: str):
+    if not manifest_path:
+        return {}
+
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest.get("modules", {})
+
+
+def _save_manifest(manifest_path: str, modules: dict):
+    if not manifest_path:
+        return
+
+    try:
+        os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "modules": modules}, f)
+        os.replace(tmp_path, manifest_path)
+    except OSError as e:
+        logger.warning("Could not write effect manifest %s: %s", manifest_path, e)
+
+
+def scan_module(path: str, cached: dict = None):
+    """
+    Return the manifest entry for one effect file, reusing `cached` when the
+    file is unchanged (same mtime and size, or same content hash).
+    """
+    stat = os.stat(path)
+    if (
+        cached
+        and cached.get("mtime_ns") == stat.st_mtime_ns
+        and cached.get("size") == stat.st_size
+    ):
+        return cached
+
+    digest = _file_hash(path)
+    if cached and cached.get("sha1") == digest:
+        return dict(cached, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+
+    try:
+        classes = parse_module(source, path)
+    except SyntaxError as e:
+        logger.warning("Skipping effect module %s: %s", path, e)
+        classes = []
+
+    return {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha1": digest,
+        "classes": classes,
+    }
+
+
+def _source_hash(name: str, classes: dict, modules: dict):
+    # Hash of the modules defining the effect and the effects it derives from
+    digest = hashlib.sha1()
+    seen = set()
+    while name in classes and name not in seen:
+        seen.add(name)
+        cls = classes[name]
+        digest.update(modules[cls["module"]]["sha1"].encode())
+        name = cls["bases"][0] if cls["bases"] else None
+    return digest.hexdigest()
+
+
+def scan_effects(path: str, manifest_path: str = None):
+    """
+    Discover effects in `path` without importing them.
+
+    Returns {effect_name: {"module", "description", "config_schema",
+    "source"}}, "source" being a hash of the effect's code. Parse results are
+    cached per file in the JSON manifest at `manifest_path`.
+    """
+    cached = _load_manifest(manifest_path)
+    modules = {}
+
+    for filename in sorted(os.listdir(path)):
+        module, ext = os.path.splitext(filename)
+        if ext != ".py" or module.startswith("_"):
+            continue
+
+        modules[module] = scan_module(os.path.join(path, filename), cached.get(module))
+
+    if modules != cached:
+        _save_manifest(manifest_path, modules)
+
+    # Resolve effect classes across modules, including subclasses of effects
+    classes = {}
+    for module, entry in modules.items():
+        for cls in entry["classes"]:
+            classes.setdefault(cls["name"], dict(cls, module=module))
+
+    bases = set(EFFECT_BASES)
+    changed = True
+    while changed:
+        changed = False
+        for name, cls in classes.items():
+            if name not in bases and bases.intersection(cls["bases"]):
+                bases.add(name)
+                changed = True
+
+    effects = {}
+    for name, cls in classes.items():
+        if name in EFFECT_BASES or name not in bases or cls["abstract"]:
+            continue
+
+        schema = cls["config_schema"]
+        parent = cls
+        # Inherit the schema from the closest parent that defines one
+        while schema == [] and parent["bases"]:
+            parent = classes.get(parent["bases"][0])
+            if parent is None:
+                break
+            schema = parent["config_schema"]
+
+        effects[name] = {
+            "module": cls["module"],
+            "description": cls["description"],
+            "config_schema": schema,
+            "source": _source_hash(name, classes, modules),
+        }
+
+    return effects
@@ -1,8 +1,8 @@
-from lib.led import EffectBase
-import math
+from lib.led import VectorEffectBase
+import numpy as np
 
 
-class Aurora(EffectBase):
+class Aurora(VectorEffectBase):
     """
     Smooth, flowing waves of Green, Blue and Purple (Northern Lights).
     """
@@ -19,22 +19,21 @@ class Aurora(EffectBase):
     def __init__(self, led, **kwargs):
         super().__init__(led, **kwargs)
         self.t = 0.0
-        self.speed = float(self.config.get("speed", 0.04))  # Adjusted for 60 FPS
+        self.configure()
 
-    def tick(self):
-        self.t += self.speed
+        # Per-channel phase and amplitude of the color waves
+        self.phase = np.array([0.0, 2.0, 4.0])
+        self.amplitude = np.array([30.0, 100.0, 100.0])
+        self.x1 = self.index * 0.1
+        self.x2 = self.index * 0.05
 
-        for i in range(self.led.count):
-            wave1 = math.sin(i * 0.1 + self.t)
-            wave2 = math.sin(i * 0.05 - self.t * 0.5)
-            combined = wave1 + wave2
+    def configure(self):
+        self.speed = float(self.config.get("speed", 0.04))  # Adjusted for 60 FPS
 
-            r = int((math.sin(combined) + 1) * 30)
-            g = int((math.sin(combined + 2) + 1) * 100)
-            b = int((math.sin(combined + 4) + 1) * 100)
+    def tick(self, t, dt):
+        self.t += self.speed * self.frames(dt)
 
-            r = max(0, min(255, r))
-            g = max(0, min(255, g))
-            b = max(0, min(255, b))
+        combined = np.sin(self.x1 + self.t) + np.sin(self.x2 - self.t * 0.5)
+        rgb = (np.sin(combined[:, None] + self.phase) + 1) * self.amplitude
 
-            self.led.set_pixel(i, (r, g, b))
+        return np.clip(rgb, 0, 255).astype(np.uint8)
@@ -1,5 +1,4 @@
 from lib.led import EffectBase
-import time
 
 
 class BouncingBalls(EffectBase):
@@ -30,26 +29,36 @@ class BouncingBalls(EffectBase):
 
     def __init__(self, led, **kwargs):
         super().__init__(led, **kwargs)
+        self.start_height = 1
+        self.colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
+
+        # Start times are relative to the effect's clock
+        self.start_times = []
+        self.velocities = []
+        self.heights = []
+
+        self.configure()
+
+    def configure(self):
         # Physics Constants
         self.gravity = float(self.config.get("gravity", -5.81))
-        self.start_height = 1
         self.dampening = float(self.config.get("dampening", 0.90))
-
         self.num_balls = int(self.config.get("ball_count", 3))
-        self.colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
 
-        self.start_times = [0.0] * self.num_balls
-        self.velocities = [0.0] * self.num_balls
-        self.heights = [self.start_height] * self.num_balls
-
-        now = time.time()
-        for i in range(self.num_balls):
-            self.start_times[i] = now + (i * 0.5)
-            self.velocities[i] = 0.0
+        # Balls added while running are dropped half a second apart, the
+        # others keep bouncing
+        running = len(self.start_times)
+        for i in range(self.num_balls - running):
+            self.start_times.append(self.clock + i * 0.5)
+            self.velocities.append(0.0)
+            self.heights.append(self.start_height)
+        del self.start_times[self.num_balls :]
+        del self.velocities[self.num_balls :]
+        del self.heights[self.num_balls :]
 
-    def tick(self):
-        now = time.time()
-        self.led.clear()
+    def tick(self, t, dt):
+        now = t
+        self.fill((0, 0, 0))
 
         for i in range(self.num_balls):
             t = now - self.start_times[i]
@@ -79,4 +88,4 @@ class BouncingBalls(EffectBase):
             position = int(h * (self.led.count - 1))
 
             if 0 <= position < self.led.count:
-                self.led.set_pixel(position, self.colors[i % len(self.colors)])
+                self.set_pixel(position, self.colors[i % len(self.colors)])
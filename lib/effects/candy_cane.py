@@ -1,7 +1,8 @@
-from lib.led import EffectBase
+from lib.led import VectorEffectBase
+import numpy as np
 
 
-class CandyCane(EffectBase):
+class CandyCane(VectorEffectBase):
     """
 
     Rotating Red and White stripes resembling a candy cane.
@@ -39,7 +40,9 @@ class CandyCane(EffectBase):
         super().__init__(led, **kwargs)
 
         self.offset = 0.0
+        self.configure()
 
+    def configure(self):
         self.stripe_width = int(self.config.get("stripe_width", 5))
 
         # Original speed 0.05 (20 FPS). Moves 1 pixel per frame. 20 px/sec.
@@ -52,17 +55,22 @@ class CandyCane(EffectBase):
 
         self.color2 = self.config.get("color2", (255, 255, 255))
 
-    def tick(self):
-        current_offset = int(self.offset)
+        self.colors = np.array([self.color1, self.color2], dtype=np.uint8)
+        self.offset %= self.stripe_width * 2
+
+    def period(self):
+        if self.speed == 0:
+            return None
+        return self.stripe_width * 2 / abs(self.speed * self.REFERENCE_FPS)
 
-        for i in range(self.led.count):
-            if ((i + current_offset) // self.stripe_width) % 2 == 0:
-                self.led.set_pixel(i, self.color1)
+    def tick(self, t, dt):
+        current_offset = int(self.offset)
 
-            else:
-                self.led.set_pixel(i, self.color2)
+        stripe = ((self.index + current_offset) // self.stripe_width) % 2
+        np.take(self.colors, stripe, axis=0, out=self.pixels)
 
-        self.offset += self.speed
+        self.offset = (self.offset + self.speed * self.frames(dt)) % (
+            self.stripe_width * 2
+        )
 
-        if self.offset >= (self.stripe_width * 2):
-            self.offset -= self.stripe_width * 2
+        return self.pixels
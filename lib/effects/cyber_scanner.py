@@ -1,7 +1,9 @@
-from lib.led import EffectBase
+from lib import audio
+from lib.led import VectorEffectBase
+import numpy as np
 
 
-class CyberScanner(EffectBase):
+class CyberScanner(VectorEffectBase):
     """
     A moving 'eye' that leaves a fading trail behind it.
     """
@@ -25,24 +27,36 @@ class CyberScanner(EffectBase):
             "default": 0.55,
             "description": "Movement speed (pixels per frame)",
         },
+        {
+            "name": "audio",
+            "type": "bool",
+            "default": False,
+            "description": "Move faster the louder the music is",
+        },
     ]
 
     def __init__(self, led, **kwargs):
         super().__init__(led, **kwargs)
+        self.configure()
+
+        self.heat = np.zeros(self.led.count)
+        self.position = 0.0
+        self.direction = 1
+
+    def configure(self):
         self.eye_color = self.config.get("eye_color", (255, 0, 255))
         self.decay = float(self.config.get("decay", 0.97))
         # Original speed 0.03 (33 FPS). 1 pixel/frame. 33 px/sec.
         # 60 FPS. 33 px/sec => 0.55 px/frame.
         self.speed = float(self.config.get("speed", 0.55))
+        self.audio = bool(self.config.get("audio", False))
+        self.color = np.array(self.eye_color, dtype=np.float64)
 
-        self.heat = [0.0] * self.led.count
-        self.position = 0.0
-        self.direction = 1
+    def tick(self, t, dt):
+        frames = self.frames(dt)
 
-    def tick(self):
         # Fade out
-        for i in range(self.led.count):
-            self.heat[i] = self.heat[i] * self.decay
+        self.heat *= self.decay**frames
 
         # Set head
         pos_idx = int(self.position)
@@ -50,14 +64,13 @@ class CyberScanner(EffectBase):
             self.heat[pos_idx] = 1.0
 
         # Render
-        for i in range(self.led.count):
-            pixel_r = int(self.eye_color[0] * self.heat[i])
-            pixel_g = int(self.eye_color[1] * self.heat[i])
-            pixel_b = int(self.eye_color[2] * self.heat[i])
-            self.led.set_pixel(i, (pixel_r, pixel_g, pixel_b))
+        self.pixels[:] = self.color * self.heat[:, None]
 
-        # Move
-        self.position += self.direction * self.speed
+        # Move, `speed` is the speed at half loudness when reacting to audio
+        speed = self.speed
+        if self.audio:
+            speed *= 0.25 + 1.5 * audio.features().level
+        self.position += self.direction * speed * frames
 
         if self.position >= self.led.count - 1:
             self.position = self.led.count - 1
@@ -65,3 +78,5 @@ class CyberScanner(EffectBase):
         elif self.position <= 0:
             self.position = 0
             self.direction = 1
+
+        return self.pixels
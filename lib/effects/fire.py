@@ -1,12 +1,16 @@
-from lib.led import EffectBase
-import random
+from lib import audio
+from lib.led import VectorEffectBase
+import numpy as np
 
 
-class Fire(EffectBase):
+class Fire(VectorEffectBase):
     """
     Simulates fire rising up the LED strip.
     """
 
+    # Most simulation steps per frame when catching up, time beyond is dropped
+    MAX_STEPS = 4
+
     CONFIG_SCHEMA = [
         {
             "name": "cooling",
@@ -20,57 +24,87 @@ class Fire(EffectBase):
             "default": 120,
             "description": "Chance of a spark igniting (0-255)",
         },
+        {
+            "name": "audio",
+            "type": "bool",
+            "default": False,
+            "description": "Spark with the bass and flare up on beats",
+        },
     ]
 
     def __init__(self, led, **kwargs):
         super().__init__(led, **kwargs)
-        self.cooling = int(self.config.get("cooling", 55))
-        self.sparking = int(self.config.get("sparking", 120))
-        self.heat = [0] * self.led.count
-
-        self.palette = []
-        for i in range(256):
-            if i < 85:
-                self.palette.append((i * 3, 0, 0))
-            elif i < 170:
-                self.palette.append((255, (i - 85) * 3, 0))
-            else:
-                self.palette.append((255, 255, (i - 170) * 3))
-
-        # To maintain original speed (~30 FPS) on 60 FPS loop
+        self.configure()
+        self.beats = audio.features().beats
+        self.heat = np.zeros(self.led.count, dtype=np.int16)
+        self.rng = np.random.default_rng()
+
+        # Heat (0-255) to color lookup table: black -> red -> yellow -> white
+        ramp = np.arange(85, dtype=np.uint8) * 3
+        self.palette = np.zeros((256, 3), dtype=np.uint8)
+        self.palette[:85, 0] = ramp
+        self.palette[85:170, 0] = 255
+        self.palette[85:170, 1] = ramp
+        self.palette[170:, :2] = 255
+        self.palette[170:255, 2] = ramp
+        self.palette[255, 2] = 255
+
+        # Step the simulation at ~33 Hz, down to MAX_STEPS times fewer frames
         self.accum = 0.0
         self.update_interval = 0.03
 
-    def tick(self):
-        # We can either skip frames or scale logic.
-        # Fire simulation is sensitive to steps. Skipping frames is safer for look.
-        self.accum += 1.0 / 60.0  # Assuming 60 FPS from EffectBase
+    def configure(self):
+        self.cooling = int(self.config.get("cooling", 55))
+        self.sparking = int(self.config.get("sparking", 120))
+        self.audio = bool(self.config.get("audio", False))
+        self.max_cooldown = ((self.cooling * 10) // self.led.count) + 2
+
+    def tick(self, t, dt):
+        # Fire simulation is sensitive to step size, so it runs whole steps
+        # at a fixed rate, as many as the elapsed time calls for
+        self.accum += dt
         if self.accum < self.update_interval:
-            # Just redraw existing heat? Or do nothing?
-            # EffectBase calls show(). If we do nothing, it shows same frame.
-            # But we need to render heat to pixels every frame if we want smooth?
-            # No, if heat doesn't change, pixels don't change.
-            return
+            # Heat didn't change, so the last rendered frame is still valid
+            return self.pixels
+
+        steps = int(self.accum // self.update_interval)
+        if steps > self.MAX_STEPS:
+            # Too far behind (a stall), drop the time instead of catching up
+            steps = self.MAX_STEPS
+            self.accum = 0.0
+        else:
+            self.accum -= steps * self.update_interval
 
-        self.accum -= self.update_interval
+        for _ in range(steps):
+            self._step()
 
+        # Step 4: Map to color
+        return np.take(self.palette, self.heat, axis=0, out=self.pixels)
+
+    def _step(self):
         # Step 1: Cool down
-        for i in range(self.led.count):
-            cooldown = random.randint(0, ((self.cooling * 10) // self.led.count) + 2)
-            self.heat[i] = max(0, self.heat[i] - cooldown)
+        cooldown = self.rng.integers(
+            0, self.max_cooldown, size=self.led.count, endpoint=True, dtype=np.int16
+        )
+        np.subtract(self.heat, cooldown, out=self.heat)
+        np.maximum(self.heat, 0, out=self.heat)
 
-        # Step 2: Drift
-        for i in range(self.led.count - 1, 1, -1):
-            self.heat[i] = (self.heat[i - 1] + self.heat[i - 2] + self.heat[i - 2]) // 3
+        # Step 2: Drift (the right hand side is evaluated before assignment,
+        # which matches updating from the top of the strip downwards)
+        self.heat[2:] = (self.heat[1:-1] + 2 * self.heat[:-2]) // 3
 
         # Step 3: Spark
-        if random.randint(0, 255) < self.sparking:
-            y = random.randint(0, 7)
-            self.heat[y] = min(255, self.heat[y] + random.randint(160, 255))
+        sparking = self.sparking
+        if self.audio:
+            sound = audio.features()
+            # `sparking` is the chance at half bass, silence leaves embers only
+            sparking = min(sparking * 2.0 * sound.bands[:2].mean(), 255)
+            if sound.beats != self.beats:
+                self.beats = sound.beats
+                self.heat[self.rng.integers(0, min(8, self.led.count))] = 255
 
-        # Step 4: Map to color
-        for i in range(self.led.count):
-            color_index = self.heat[i]
-            if color_index >= 256:
-                color_index = 255
-            self.led.set_pixel(i, self.palette[color_index])
+        if self.rng.integers(0, 255, endpoint=True) < sparking:
+            y = self.rng.integers(0, min(8, self.led.count))
+            self.heat[y] = min(
+                255, self.heat[y] + self.rng.integers(160, 255, endpoint=True)
+            )
@@ -12,7 +12,7 @@ class MatrixRain(EffectBase):
             "name": "spawn_rate",
             "type": "float",
             "default": 0.05,
-            "description": "Probability of a new drop spawning per frame",
+            "description": "Chance of a new drop spawning every 1/50 s (0.05 is about 2.5 drops per second)",
         },
         {
             "name": "trail_length",
@@ -36,21 +36,25 @@ class MatrixRain(EffectBase):
 
     def __init__(self, led, **kwargs):
         super().__init__(led, **kwargs)
-        # Adjust spawn rate for 60 FPS (was 50 FPS)
+        self.min_speed = 0.2 * 50  # Pixels per second
+        self.max_speed = 0.8 * 50
+        self.configure()
+
+        self.drops = []
+
+    def configure(self):
+        # spawn_rate and drop speeds were tuned per frame at 50 FPS,
+        # convert them to per second so they don't depend on the frame rate
         base_spawn_rate = float(self.config.get("spawn_rate", 0.05))
-        self.spawn_rate = base_spawn_rate * (50 / 60)
-        self.min_speed = 0.2 * (50 / 60)  # Scale speed per frame
-        self.max_speed = 0.8 * (50 / 60)
+        self.spawn_rate = base_spawn_rate * 50
         self.trail_length = int(self.config.get("trail_length", 20))
 
         self.head_color = self.config.get("head_color", (180, 255, 180))
         self.tail_color = self.config.get("tail_color", (0, 255, 0))
 
-        self.drops = []
-
-    def tick(self):
+    def tick(self, t, dt):
         # Spawn
-        if random.random() < self.spawn_rate:
+        if random.random() < self.spawn_rate * dt:
             self.drops.append([0.0, random.uniform(self.min_speed, self.max_speed)])
 
         pixel_buffer = {}
@@ -58,7 +62,7 @@ class MatrixRain(EffectBase):
 
         for drop in self.drops:
             pos, speed = drop
-            pos += speed
+            pos += speed * dt
 
             head_pixel = int(pos)
 
@@ -85,6 +89,6 @@ class MatrixRain(EffectBase):
                     r = int(self.tail_color[0] * intensity)
                     g = int(self.tail_color[1] * intensity)
                     b = int(self.tail_color[2] * intensity)
-                self.led.set_pixel(i, (r, g, b))
+                self.set_pixel(i, (r, g, b))
             else:
-                self.led.set_pixel(i, (0, 0, 0))
+                self.set_pixel(i, (0, 0, 0))
@@ -1,7 +1,8 @@
-from lib.led import EffectBase
+from lib.led import VectorEffectBase
+import numpy as np
 
 
-class RainbowCycle(EffectBase):
+class RainbowCycle(VectorEffectBase):
     """
     Draw rainbow that uniformly distributes itself across all pixels on the strip.
     """
@@ -13,6 +14,13 @@ class RainbowCycle(EffectBase):
     def __init__(self, led, **kwargs):
         super().__init__(led, **kwargs)
         self.pos = 0
+        self.configure()
+
+        # The wheel only has 256 entries, so map it once and gather per frame
+        self.wheel_lut = np.array([self.wheel(i) for i in range(256)], dtype=np.uint8)
+        self.base = self.index * 256 // self.led.count
+
+    def configure(self):
         self.speed = float(self.config.get("speed", 1.0))
 
     def wheel(self, pos):
@@ -26,13 +34,14 @@ class RainbowCycle(EffectBase):
             pos -= 170
             return (0, pos * 3, 255 - pos * 3)
 
-    def tick(self):
+    def period(self):
+        if self.speed == 0:
+            return None
+        return 256 / abs(self.speed * self.REFERENCE_FPS)
+
+    def tick(self, t, dt):
         # Increment position
-        self.pos += self.speed
-        if self.pos >= 256:
-            self.pos -= 256
+        self.pos = (self.pos + self.speed * self.frames(dt)) % 256
 
         j = int(self.pos)
-        for i in range(self.led.count):
-            pixel_index = (i * 256 // self.led.count) + j
-            self.led.set_pixel(i, self.wheel(pixel_index & 255))
+        return np.take(self.wheel_lut, (self.base + j) & 255, axis=0, out=self.pixels)
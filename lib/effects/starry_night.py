@@ -1,8 +1,8 @@
-from lib.led import EffectBase
-import random
+from lib.led import VectorEffectBase
+import numpy as np
 
 
-class StarryNight(EffectBase):
+class StarryNight(VectorEffectBase):
     """
     Randomly fades stars in and out smoothly.
     """
@@ -30,44 +30,45 @@ class StarryNight(EffectBase):
 
     def __init__(self, led, **kwargs):
         super().__init__(led, **kwargs)
+        self.STATE_OFF = 0
+        self.STATE_IN = 1
+        self.STATE_OUT = 2
+
+        self.rng = np.random.default_rng()
+        self.states = np.full(self.led.count, self.STATE_OFF, dtype=np.uint8)
+        self.brightness = np.zeros(self.led.count)
+        self.configure()
+
+    def configure(self):
         self.density = float(self.config.get("density", 0.02))
         # Original 15 per frame at 20 FPS (0.05s).
         # At 60 FPS, we need 1/3rd speed => 5.
         self.fade_speed = int(self.config.get("speed", 5))
+        self.color = self.config.get("color", (255, 255, 255))
+        self.color_array = np.array(self.color, dtype=np.float64)
 
-        self.STATE_OFF = 0
-        self.STATE_IN = 1
-        self.STATE_OUT = 2
+    def tick(self, t, dt):
+        frames = self.frames(dt)
 
-        self.states = [self.STATE_OFF] * self.led.count
-        self.brightness = [0] * self.led.count
-        self.color = self.config.get("color", (255, 255, 255))
+        # Masks are taken up front so a star only changes state once per frame
+        off = self.states == self.STATE_OFF
+        fading_in = self.states == self.STATE_IN
+        fading_out = self.states == self.STATE_OUT
 
-    def tick(self):
-        for i in range(self.led.count):
-            if self.states[i] == self.STATE_OFF:
-                if random.random() < (
-                    self.density / 3.0
-                ):  # Adjust density for higher FPS check rate
-                    self.states[i] = self.STATE_IN
+        # Adjust density for higher FPS check rate
+        spawn = off & (self.rng.random(self.led.count) < (self.density / 3.0) * frames)
+        self.states[spawn] = self.STATE_IN
 
-            elif self.states[i] == self.STATE_IN:
-                self.brightness[i] += self.fade_speed
-                if self.brightness[i] >= 255:
-                    self.brightness[i] = 255
-                    self.states[i] = self.STATE_OUT
+        self.brightness[fading_in] += self.fade_speed * frames
+        peaked = fading_in & (self.brightness >= 255)
+        self.brightness[peaked] = 255
+        self.states[peaked] = self.STATE_OUT
 
-            elif self.states[i] == self.STATE_OUT:
-                self.brightness[i] -= self.fade_speed
-                if self.brightness[i] <= 0:
-                    self.brightness[i] = 0
-                    self.states[i] = self.STATE_OFF
+        self.brightness[fading_out] -= self.fade_speed * frames
+        faded = fading_out & (self.brightness <= 0)
+        self.brightness[faded] = 0
+        self.states[faded] = self.STATE_OFF
 
-            if self.brightness[i] > 0:
-                b_factor = self.brightness[i] / 255.0
-                r = int(self.color[0] * b_factor)
-                g = int(self.color[1] * b_factor)
-                b = int(self.color[2] * b_factor)
-                self.led.set_pixel(i, (r, g, b))
-            else:
-                self.led.set_pixel(i, (0, 0, 0))
+        b_factor = self.brightness / 255.0
+        self.pixels[:] = self.color_array * b_factor[:, None]
+        return self.pixels
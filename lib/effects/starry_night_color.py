@@ -1,8 +1,8 @@
-from lib.led import EffectBase
-import random
+from lib.led import VectorEffectBase
+import numpy as np
 
 
-class StarryNightColor(EffectBase):
+class StarryNightColor(VectorEffectBase):
     """
     Randomly fades multi-colored stars in and out smoothly.
     """
@@ -24,55 +24,59 @@ class StarryNightColor(EffectBase):
 
     def __init__(self, led, **kwargs):
         super().__init__(led, **kwargs)
-        self.density = float(self.config.get("density", 0.02))
-        # Original 10 per frame at 20 FPS.
-        # 60 FPS => 3.33. Let's use 3.
-        self.fade_speed = int(self.config.get("speed", 3))
+        self.configure()
 
-        self.palette = [
-            (255, 255, 255),
-            (200, 200, 255),
-            (255, 240, 150),
-            (255, 200, 100),
-            (150, 150, 255),
-            (255, 180, 220),
-        ]
+        self.palette = np.array(
+            [
+                (255, 255, 255),
+                (200, 200, 255),
+                (255, 240, 150),
+                (255, 200, 100),
+                (150, 150, 255),
+                (255, 180, 220),
+            ],
+            dtype=np.uint8,
+        )
 
         self.STATE_OFF = 0
         self.STATE_IN = 1
         self.STATE_OUT = 2
 
-        self.states = [self.STATE_OFF] * self.led.count
-        self.brightness = [0] * self.led.count
-        self.pixel_colors = [(0, 0, 0)] * self.led.count
+        self.rng = np.random.default_rng()
+        self.states = np.full(self.led.count, self.STATE_OFF, dtype=np.uint8)
+        self.brightness = np.zeros(self.led.count)
+        self.pixel_colors = np.zeros((self.led.count, 3), dtype=np.uint8)
 
-    def tick(self):
-        for i in range(self.led.count):
-            if self.states[i] == self.STATE_OFF:
-                if random.random() < (self.density / 3.0):
-                    self.states[i] = self.STATE_IN
-                    self.pixel_colors[i] = random.choice(self.palette)
+    def configure(self):
+        self.density = float(self.config.get("density", 0.02))
+        # Original 10 per frame at 20 FPS.
+        # 60 FPS => 3.33. Let's use 3.
+        self.fade_speed = int(self.config.get("speed", 3))
 
-            elif self.states[i] == self.STATE_IN:
-                self.brightness[i] += self.fade_speed
-                if self.brightness[i] >= 255:
-                    self.brightness[i] = 255
-                    self.states[i] = self.STATE_OUT
+    def tick(self, t, dt):
+        frames = self.frames(dt)
 
-            elif self.states[i] == self.STATE_OUT:
-                self.brightness[i] -= self.fade_speed
-                if self.brightness[i] <= 0:
-                    self.brightness[i] = 0
-                    self.states[i] = self.STATE_OFF
+        # Masks are taken up front so a star only changes state once per frame
+        off = self.states == self.STATE_OFF
+        fading_in = self.states == self.STATE_IN
+        fading_out = self.states == self.STATE_OUT
+
+        spawn = off & (self.rng.random(self.led.count) < (self.density / 3.0) * frames)
+        self.states[spawn] = self.STATE_IN
+        self.pixel_colors[spawn] = self.palette[
+            self.rng.integers(len(self.palette), size=np.count_nonzero(spawn))
+        ]
 
-            if self.brightness[i] > 0:
-                current_color = self.pixel_colors[i]
-                b_factor = self.brightness[i] / 255.0
+        self.brightness[fading_in] += self.fade_speed * frames
+        peaked = fading_in & (self.brightness >= 255)
+        self.brightness[peaked] = 255
+        self.states[peaked] = self.STATE_OUT
 
-                r = int(current_color[0] * b_factor)
-                g = int(current_color[1] * b_factor)
-                b = int(current_color[2] * b_factor)
+        self.brightness[fading_out] -= self.fade_speed * frames
+        faded = fading_out & (self.brightness <= 0)
+        self.brightness[faded] = 0
+        self.states[faded] = self.STATE_OFF
 
-                self.led.set_pixel(i, (r, g, b))
-            else:
-                self.led.set_pixel(i, (0, 0, 0))
+        b_factor = self.brightness / 255.0
+        self.pixels[:] = self.pixel_colors * b_factor[:, None]
+        return self.pixels
@@ -0,0 +1,820 @@
+import logging
+import queue
+import threading
+import time
+
+from lib import metrics
+from lib.compositor import composite, DEFAULT_BLEND
+from lib.frame_cache import FrameCache
+from lib.led import EffectBase
+from lib.transitions import Crossfade, FadeOut, DEFAULT_EASING
+
+logger = logging.getLogger(__name__)
+
+
+class Slot(object):
+    """
+    An effect running on a segment, with its transitions and frame clock.
+
+    Segment presets are slots, and so are the layers stacked over them
+    (`name`, `blend` and `opacity` are only used by layers).
+    """
+
+    def __init__(
+        self,
+        segment,
+        effect,
+        crossfade: Crossfade,
+        name: str = None,
+        blend: str = DEFAULT_BLEND,
+        opacity: float = 1.0,
+        frame_cache: FrameCache = None,
+    ):
+        self.segment = segment
+        self.effect = effect
+        self.crossfade = crossfade
+        self.fade = None
+        self.name = name
+        self.blend = blend
+        self.opacity = opacity
+
+        # Last rendered frame, layers that are not due keep showing it
+        self.frame = None
+
+        self.frame_time = 1.0 / effect.target_fps
+        self.started_at = time.monotonic()
+        self.last = self.started_at - self.frame_time
+        self.next_frame = self.started_at
+
+        # Periodic effects switch to replaying their cycle once it is cached.
+        # `cached` is the (key, period, fps) of the cycle, `offset` shifts
+        # replay so a cycle taking over from another one continues its phase
+        self.frame_cache = frame_cache
+        self.cached = self._request()
+        self.cycle = None
+        self.offset = 0
+        self.pending = None
+
+    @property
+    def clock(self):
+        return self.effect.clock
+
+    @clock.setter
+    def clock(self, clock: float):
+        self.effect.clock = clock
+
+    def _request(self):
+        if self.frame_cache is None:
+            return None
+        key = self.frame_cache.request(self.effect)
+        if key is None:
+            return None
+        return key, self.effect.period(), self.effect.target_fps
+
+    def update(self, changed: dict):
+        """
+        Apply parameters changed with EffectBase.update(), keeping the
+        animation going.
+        """
+        if any(name != "target_fps" for name in changed):
+            self.effect.configure()
+
+        self.frame_time = 1.0 / self.effect.target_fps
+        if self.cycle is None:
+            # Rendering live, the effect's state has moved on from the start
+            # of a cycle and replaying one would jump
+            self.cached = None
+            return
+
+        # Keep replaying the current cycle until the new one is ready
+        self.pending = self._request()
+        if self.pending is None:
+            self.cached = None
+            self.cycle = None
+
+    def _replay_index(self, t: float):
+        _, _, fps = self.cached
+        return round(t * fps) + self.offset
+
+    def render(self, t: float, dt: float):
+        """
+        The effect's frame at t, from the frame cache when possible.
+        """
+        if self.pending is not None:
+            cycle = self.frame_cache.get(self.pending[0])
+            if cycle is not None:
+                # Start the new cycle where the current one is in its period
+                _, period, fps = self.cached
+                phase = (self._replay_index(t) / fps / period) % 1.0
+                self.cached, self.cycle, self.pending = self.pending, cycle, None
+                _, period, fps = self.cached
+                self.offset = round(phase * period * fps) - round(t * fps)
+            elif self.frame_cache.lost(self.pending[0]):
+                self.cached = self.cycle = self.pending = None
+        elif self.cycle is None and self.cached is not None:
+            self.cycle = self.frame_cache.get(self.cached[0])
+
+        if self.cycle is not None:
+            return self.cycle[self._replay_index(t) % len(self.cycle)]
+        return self.effect.render(t, dt)
+
+
+class RenderEngine(threading.Thread):
+    """
+    Single long-lived thread that owns the LED and the frame clock.
+
+    Everything that changes what the strip shows goes through the command
+    queue: the public methods only enqueue and return immediately, so they are
+    safe to call from async handlers and other threads. Effects are plain
+    objects whose render() is called by this thread, switching presets doesn't
+    spawn or join anything.
+
+    Every segment of the LED can run its own preset, with any number of layers
+    stacked over it, each at its own frame rate. Whenever one of them is due,
+    the segment's layers are composited over its preset and the result is
+    drawn into the strip's frame buffer (in segment order), followed by a
+    single show().
+
+    `state` (optional, see lib.owner.SharedState) is kept up to date with the
+    running effects and the color correction for readers in other processes.
+    It is published when they change, and every STATE_INTERVAL seconds while
+    rendering to refresh the frame counters.
+
+    Frames from an external source (show_frame(), see lib.realtime) pre-empt
+    all of it: while they keep coming nothing else is drawn, and the presets
+    take over again once they stop.
+
+    `frame_cache` (optional) replays periodic effects from pre-rendered cycles
+    instead of rendering them every frame.
+    """
+
+    # Seconds between publishes of the frame counters to `state`
+    STATE_INTERVAL = 0.5
+
+    def __init__(self, led, state=None, frame_cache: FrameCache = None):
+        super().__init__(name="render-engine", daemon=True)
+        self.led = led
+        self.state = state
+        self.frame_cache = frame_cache
+        self.commands = queue.SimpleQueue()
+
+        # Serializes enqueuers so the views below and the queue order always agree
+        self.lock = threading.Lock()
+
+        # Most recently requested preset per segment and layers by name, what
+        # the API reports as running. Replaced as a whole on every change.
+        self.effects = {}
+        self.layers = {}
+
+        # State below is only touched by the engine thread
+        self.slots = {}
+        self.overlays = {}
+        self.shutting_down = False
+        # Realtime frames (see lib.realtime) pre-empt the slots until then
+        self.realtime_until = 0.0
+        self.preempted = None
+        # Latest (frame, timeout) received and not shown yet, see show_frame()
+        self.realtime_frame = None
+        self.realtime_lock = threading.Lock()
+        self.last = time.monotonic()
+        self.fps = 0.0
+        self.published = 0.0
+        self.publish()
+        if state is not None:
+            state.set_correction(led.gamma, led.temperature, led.brightness)
+
+    def start_effect(
+        self,
+        segment,
+        effect,
+        transition: float = 0.0,
+        easing: str = DEFAULT_EASING,
+    ):
+        """
+        Switch `segment` to `effect`, crossfading from what it currently shows.
+
+        Args:
+            segment (Segment): The LED segment the effect was constructed for
+            effect (EffectBase): The effect to render
+            transition (float): Crossfade duration in seconds
+            easing (str): Crossfade easing curve
+        """
+        with self.lock:
+            self.effects = {**self.effects, segment.name: effect}
+            self._enqueue(self._start_effect, segment, effect, transition, easing)
+
+    def update_effect(self, segment: str, changes: dict):
+        """
+        Apply new parameters to the preset running on `segment` before its
+        next frame, without restarting it. The effect itself is only changed
+        by the engine thread.
+
+        Raises:
+            KeyError: No preset is running on the segment
+            TypeError, ValueError: target_fps is out of range (EffectBase.check_target_fps)
+        """
+        if changes.get("target_fps") is not None:
+            target_fps = EffectBase.check_target_fps(changes["target_fps"])
+            changes = {**changes, "target_fps": target_fps}
+
+        with self.lock:
+            effect = self.effects[segment]
+            self._enqueue(self._update_effect, segment, effect, changes)
+
+    def stop_effect(
+        self, segment: str = None, transition: float = 0.0, easing: str = DEFAULT_EASING
+    ):
+        """
+        Fade the preset on `segment` out to black. When None, every preset and
+        layer is faded out.
+
+        Args:
+            segment (str): Name of the LED segment
+            transition (float): Fade out duration in seconds
+            easing (str): Fade out easing curve
+        """
+        with self.lock:
+            self.effects = {
+                name: effect
+                for name, effect in self.effects.items()
+                if segment is not None and name != segment
+            }
+            if segment is None:
+                self.layers = {}
+            self._enqueue(self._stop_effect, segment, transition, easing)
+
+    def add_layer(
+        self,
+        name: str,
+        segment,
+        effect,
+        blend: str = DEFAULT_BLEND,
+        opacity: float = 1.0,
+        transition: float = 0.0,
+        easing: str = DEFAULT_EASING,
+    ):
+        """
+        Stack `effect` on top of `segment` as layer `name`, fading it in. An
+        existing layer with that name is replaced in place.
+
+        Args:
+            name (str): Name of the layer
+            segment (Segment): The LED segment the effect was constructed for
+            effect (EffectBase): The effect to render
+            blend (str): Blend mode (see lib.compositor.BLEND_MODES)
+            opacity (float): Opacity from 0.0 to 1.0
+            transition (float): Fade in duration in seconds
+            easing (str): Fade in easing curve
+        """
+        layer = {
+            "segment": segment.name,
+            "effect": effect,
+            "blend": blend,
+            "opacity": opacity,
+        }
+        with self.lock:
+            self.layers = {**self.layers, name: layer}
+            self._enqueue(
+                self._add_layer,
+                name,
+                segment,
+                effect,
+                blend,
+                opacity,
+                transition,
+                easing,
+            )
+
+    def update_layer(self, name: str, blend: str = None, opacity: float = None):
+        """
+        Change the blend mode and/or opacity of a layer from the next frame on.
+        """
+        with self.lock:
+            layer = dict(self.layers[name])
+            if blend is not None:
+                layer["blend"] = blend
+            if opacity is not None:
+                layer["opacity"] = opacity
+            self.layers = {**self.layers, name: layer}
+            self._enqueue(self._update_layer, name, layer["blend"], layer["opacity"])
+
+    def remove_layer(
+        self, name: str, transition: float = 0.0, easing: str = DEFAULT_EASING
+    ):
+        """
+        Fade a layer out and remove it.
+        """
+        with self.lock:
+            if name not in self.layers:
+                raise KeyError(f"Layer {name} not found")
+            self.layers = {k: v for k, v in self.layers.items() if k != name}
+            self._enqueue(self._remove_layer, name, transition, easing)
+
+    def drop_segment(self, segment: str):
+        """
+        Stop the preset and the layers on `segment` right away, e.g. because
+        it was redefined.
+        """
+        with self.lock:
+            self.effects = {
+                name: effect for name, effect in self.effects.items() if name != segment
+            }
+            self.layers = {
+                name: layer
+                for name, layer in self.layers.items()
+                if layer["segment"] != segment
+            }
+            self._enqueue(self._drop_segment, segment)
+
+    def set_color(self, color: tuple):
+        """
+        Show a static color on the whole strip, finishing any pending fade out first.
+        """
+        with self.lock:
+            self._enqueue(self._show_color, color)
+
+    def clear(self):
+        self.set_color((0, 0, 0))
+
+    def show_frame(self, frame, timeout: float):
+        """
+        Show a whole RGB frame from an external source, pre-empting the
+        running presets until no frame arrived for `timeout` seconds.
+
+        Frames are not queued: a frame that arrives before the previous one
+        was shown replaces it, so a sender faster than the strip can't hold
+        up the other commands.
+        """
+        with self.realtime_lock:
+            superseded = self.realtime_frame is not None
+            self.realtime_frame = (frame, timeout)
+        if superseded:
+            metrics.REALTIME_FRAMES_SUPERSEDED.inc()
+        else:
+            # One wake up per frame shown, it takes whichever frame is latest
+            self.commands.put((self._show_realtime, ()))
+
+    def end_realtime(self):
+        """
+        Hand the strip back to the presets right away.
+        """
+        self.commands.put((self._end_realtime, ()))
+
+    def set_correction(
+        self, gamma: float = None, temperature: float = None, brightness: float = None
+    ):
+        """
+        Change the strip's color correction (see LED.set_correction), values
+        left to None are kept.
+        """
+        with self.lock:
+            if self.state is not None:
+                self.state.set_correction(gamma, temperature, brightness)
+            self.commands.put(
+                (self.led.set_correction, (gamma, temperature, brightness))
+            )
+
+    def shutdown(self, transition: float = 0.0, easing: str = DEFAULT_EASING):
+        """
+        Fade out the running effects, clear the strip and exit the thread.
+        """
+        with self.lock:
+            self.effects = {}
+            self.layers = {}
+            self._enqueue(self._shut_down, transition, easing)
+
+    def publish(self):
+        """
+        Push the running effects, layers and segments to `state`, if any.
+        """
+        if self.state is not None:
+            self.state.publish(self.effects, self.layers, self.led.segments)
+            self.published = time.monotonic()
+
+    def _enqueue(self, command, *args):
+        # Called with the lock held. Queued first, the view was already changed
+        # and the engine has to follow it whatever happens while publishing
+        self.commands.put((command, args))
+        self.publish()
+
+    def _all_slots(self):
+        return [*self.slots.values(), *self.overlays.values()]
+
+    def run(self):
+        while True:
+            if self.realtime_until:
+                wait_time = self.realtime_until - time.monotonic()
+                if wait_time <= 0:
+                    self._end_realtime()
+                    continue
+
+                # Pre-empted, only commands (and realtime frames) until the timeout
+                try:
+                    command, args = self.commands.get(timeout=wait_time)
+                except queue.Empty:
+                    pass
+                else:
+                    self._dispatch(command, args)
+                continue
+
+            if not self.slots and not self.overlays:
+                if self.shutting_down:
+                    break
+
+                # Nothing animating, sleep until the next command
+                command, args = self.commands.get()
+                self._dispatch(command, args)
+                continue
+
+            next_frame = min(slot.next_frame for slot in self._all_slots())
+            wait_time = next_frame - time.monotonic()
+            if wait_time > 0:
+                try:
+                    command, args = self.commands.get(timeout=wait_time)
+                except queue.Empty:
+                    pass
+                else:
+                    self._dispatch(command, args)
+                    continue
+
+            self._render_frame()
+
+        self.led.clear()
+
+    def _dispatch(self, command, args: tuple):
+        # A failing command must not take the render thread down with it
+        try:
+            command(*args)
+        except Exception:
+            logger.exception("Render engine command %s failed", command.__name__)
+
+    def _start_effect(self, segment, effect, transition: float, easing: str):
+        previous = self.slots.get(segment.name)
+        if previous is not None and previous.fade is None:
+            # Keep animating the outgoing effect underneath the crossfade
+            source = previous
+        elif segment.name in self.slots or not self._segment_overlays(segment):
+            # Static color or an effect that was already fading out, continue
+            # from what the segment shows now
+            source = segment.read(self.led)
+        else:
+            # The segment shows layers over black, fade the preset in under them
+            source = bytes(segment.count * 3)
+
+        try:
+            slot = Slot(
+                segment,
+                effect,
+                Crossfade(source, transition, easing),
+                frame_cache=self.frame_cache,
+            )
+        except Exception:
+            logger.exception(
+                "Could not start %s on segment %s",
+                effect.__class__.__name__,
+                segment.name,
+            )
+            self._forget(effect, segment=segment.name)
+            # The preset it replaces is gone from the API view, fade it out
+            if previous is not None and previous.fade is None:
+                previous.fade = FadeOut(transition, easing)
+            return
+
+        self.slots[segment.name] = slot
+        self._update_gauges()
+
+    def _stop_effect(self, segment: str, transition: float, easing: str):
+        if segment is None:
+            slots = self._all_slots()
+        else:
+            slots = [self.slots[segment]] if segment in self.slots else []
+
+        for slot in slots:
+            if slot.fade is None:
+                slot.fade = FadeOut(transition, easing)
+        self._update_gauges()
+
+    def _add_layer(
+        self,
+        name: str,
+        segment,
+        effect,
+        blend: str,
+        opacity: float,
+        transition: float,
+        easing: str,
+    ):
+        previous = self.overlays.get(name)
+        if (
+            previous is not None
+            and previous.fade is None
+            and previous.segment is segment
+        ):
+            source = previous
+        else:
+            # Fade in from transparent
+            source = bytes(segment.count * 3)
+
+        try:
+            slot = Slot(
+                segment,
+                effect,
+                Crossfade(source, transition, easing),
+                name=name,
+                blend=blend,
+                opacity=opacity,
+                frame_cache=self.frame_cache,
+            )
+        except Exception:
+            logger.exception(
+                "Could not start %s in layer %s", effect.__class__.__name__, name
+            )
+            self._forget(effect, layer=name)
+            if previous is not None and previous.fade is None:
+                previous.fade = FadeOut(transition, easing)
+            return
+
+        self.overlays[name] = slot
+
+    def _update_effect(self, segment: str, effect, changes: dict):
+        slot = self.slots.get(segment)
+        if slot is None or slot.effect is not effect:
+            # Replaced or stopped since
+            return
+        try:
+            changed = effect.update(changes)
+            if not changed:
+                return
+            slot.update(changed)
+        except Exception:
+            logger.exception(
+                "Could not update %s on segment %s", effect.__class__.__name__, segment
+            )
+        self._update_gauges()
+        # The state published when the update was queued had the previous rate
+        with self.lock:
+            self.publish()
+
+    def _update_layer(self, name: str, blend: str, opacity: float):
+        slot = self.overlays.get(name)
+        if slot is not None:
+            slot.blend = blend
+            slot.opacity = opacity
+
+    def _remove_layer(self, name: str, transition: float, easing: str):
+        slot = self.overlays.get(name)
+        if slot is not None and slot.fade is None:
+            slot.fade = FadeOut(transition, easing)
+
+    def _drop_segment(self, segment: str):
+        dropped = [slot for slot in self._all_slots() if slot.segment.name == segment]
+        self.slots.pop(segment, None)
+        for slot in dropped:
+            self.overlays.pop(slot.name, None)
+
+        for slot in dropped:
+            # Blank the range the effect was drawing, the segment may have moved
+            slot.segment.write(self.led, bytes(slot.segment.count * 3))
+        if dropped:
+            self.led.show()
+        self._update_gauges()
+
+    def _show_realtime(self):
+        with self.realtime_lock:
+            latest, self.realtime_frame = self.realtime_frame, None
+        if latest is None:
+            return
+
+        frame, timeout = latest
+        if not self.realtime_until:
+            # Put back when the stream ends and no preset takes over
+            self.preempted = bytes(self.led.frame)
+        self.realtime_until = time.monotonic() + timeout
+        self.led.write_frame(frame)
+        self.led.show()
+
+    def _end_realtime(self):
+        if not self.realtime_until:
+            return
+
+        self.realtime_until = 0.0
+        self.led.write_frame(self.preempted)
+        self.led.show()
+        self.preempted = None
+
+        # The presets kept their clocks, but the frames they missed while
+        # pre-empted aren't dropped frames
+        now = time.monotonic()
+        for slot in self._all_slots():
+            slot.next_frame = now
+            slot.last = now - slot.frame_time
+
+    def _show_color(self, color: tuple):
+        self.slots = {}
+        self.overlays = {}
+        self._update_gauges()
+        if self.realtime_until:
+            # Shown once the realtime stream ends
+            self.preempted = bytes(color) * self.led.count
+            return
+        self.led.set_color(color)
+
+    def _shut_down(self, transition: float, easing: str):
+        self._end_realtime()
+        self._stop_effect(None, transition, easing)
+        self.shutting_down = True
+
+    def _update_gauges(self):
+        metrics.PRESET_RUNNING.clear()
+        target_fps = 0.0
+        for slot in self._all_slots():
+            target_fps = max(target_fps, slot.effect.target_fps)
+        for name, slot in self.slots.items():
+            if slot.fade is None:
+                preset = slot.effect.__class__.__name__
+                metrics.PRESET_RUNNING.labels(preset, name).set(1)
+        metrics.TARGET_FPS.set(target_fps)
+
+    def _segment_overlays(self, segment):
+        return [slot for slot in self.overlays.values() if slot.segment is segment]
+
+    def _render_slot(self, slot: Slot, now: float):
+        effect = slot.effect
+        dt = now - slot.last
+        slot.clock = now - slot.started_at
+
+        frame = slot.render(slot.clock, dt)
+        if slot.crossfade is not None:
+            frame = slot.crossfade.apply(frame, dt)
+            if slot.crossfade.done:
+                slot.crossfade = None
+        if slot.fade is not None:
+            frame = slot.fade.apply(frame, dt)
+        slot.frame = frame
+
+        effect.frames_rendered += 1
+        if dt > 0:
+            # Exponential moving average to smooth out scheduler jitter
+            effect.fps += (1.0 / dt - effect.fps) * 0.1
+        slot.last = now
+
+    def _schedule(self, slot: Slot):
+        # Frames are scheduled on a fixed grid. When we are behind, the slots
+        # that have fully passed are dropped instead of rendered late.
+        frame_time = slot.frame_time
+        slot.next_frame += frame_time
+        behind = time.monotonic() - slot.next_frame
+        if behind > 0:
+            metrics.FRAMES_LATE.inc()
+        if behind >= frame_time:
+            missed = int(behind // frame_time)
+            slot.effect.frames_dropped += missed
+            metrics.FRAMES_DROPPED.inc(missed)
+            slot.next_frame += missed * frame_time
+
+    def _render_segment(self, segment, now: float):
+        """
+        Render the due slots of a segment and draw its composite, returns the
+        slots that were rendered.
+
+        Segments are drawn even when none of their slots is due (from the
+        slots' last frames): segments overlap, and one drawn because it is
+        due would otherwise cover the ones after it that aren't.
+        """
+        base = self.slots.get(segment.name)
+        layers = self._segment_overlays(segment)
+        if base is None and not layers:
+            return []
+
+        due = [
+            slot for slot in ([base] if base else []) + layers if slot.next_frame <= now
+        ]
+
+        for slot in due:
+            try:
+                self._render_slot(slot, now)
+            except Exception:
+                logger.exception(
+                    "Effect %s on segment %s failed, stopping it",
+                    slot.effect.__class__.__name__,
+                    segment.name,
+                )
+                self._fail(slot)
+
+        base = self.slots.get(segment.name)
+        layers = self._segment_overlays(segment)
+        if base is not None and base.frame is not None:
+            base_frame = base.frame
+        else:
+            base_frame = bytes(segment.count * 3)
+        layers = [slot for slot in layers if slot.frame is not None]
+        try:
+            if layers:
+                frame = composite(
+                    base_frame,
+                    [(slot.frame, slot.blend, slot.opacity) for slot in layers],
+                )
+            else:
+                frame = base_frame
+            segment.write(self.led, frame)
+        except Exception:
+            # A frame of the wrong size or type, from one of the slots that
+            # just rendered (or any of them when none did)
+            broken = [slot for slot in due if self._is_live(slot)] or [
+                slot for slot in [base, *layers] if slot is not None
+            ]
+            logger.exception(
+                "Could not draw segment %s, stopping %s",
+                segment.name,
+                ", ".join(slot.effect.__class__.__name__ for slot in broken),
+            )
+            for slot in broken:
+                self._fail(slot)
+            return [slot for slot in due if self._is_live(slot)]
+        return due
+
+    def _render_frame(self):
+        now = time.monotonic()
+        segments = self.led.segments
+
+        # Segments removed or redefined since their effects were started
+        for slot in self._all_slots():
+            if segments.get(slot.segment.name) is not slot.segment:
+                self._remove(slot)
+
+        tick_start = time.perf_counter()
+        # Every segment is redrawn in segment order ("all" first), so
+        # overlapping segments stack the same way whichever of them are due
+        rendered = []
+        for segment in segments.values():
+            rendered.extend(self._render_segment(segment, now))
+
+        show_start = time.perf_counter()
+        shown = self.led.show()
+        show_end = time.perf_counter()
+
+        metrics.TICK_SECONDS.observe(show_start - tick_start)
+        if shown:
+            metrics.SHOW_SECONDS.observe(show_end - show_start)
+        else:
+            metrics.FRAMES_UNCHANGED.inc()
+        metrics.FRAMES_RENDERED.inc()
+        dt = now - self.last
+        if dt > 0:
+            self.fps += (1.0 / dt - self.fps) * 0.1
+            metrics.FPS.set(self.fps)
+        self.last = now
+
+        for slot in rendered:
+            if not self._is_live(slot):
+                continue
+            if slot.fade is not None and slot.fade.done:
+                self._remove(slot)
+                continue
+            try:
+                self._schedule(slot)
+            except Exception:
+                logger.exception(
+                    "Could not schedule %s on segment %s, stopping it",
+                    slot.effect.__class__.__name__,
+                    slot.segment.name,
+                )
+                self._fail(slot)
+
+        if self.state is not None and now - self.published >= self.STATE_INTERVAL:
+            with self.lock:
+                self.publish()
+
+    def _is_live(self, slot: Slot):
+        if slot.name is None:
+            return self.slots.get(slot.segment.name) is slot
+        return self.overlays.get(slot.name) is slot
+
+    def _remove(self, slot: Slot):
+        if not self._is_live(slot):
+            return
+        if slot.name is None:
+            del self.slots[slot.segment.name]
+        else:
+            del self.overlays[slot.name]
+
+    def _forget(self, effect, segment: str = None, layer: str = None):
+        # Take an effect the engine can't run out of the API view, unless it
+        # was replaced since
+        with self.lock:
+            if layer is None:
+                if self.effects.get(segment) is effect:
+                    self.effects = {
+                        k: v for k, v in self.effects.items() if k != segment
+                    }
+            elif (self.layers.get(layer) or {}).get("effect") is effect:
+                self.layers = {k: v for k, v in self.layers.items() if k != layer}
+            self.publish()
+
+    def _fail(self, slot: Slot):
+        if slot.name is None:
+            self._forget(slot.effect, segment=slot.segment.name)
+        else:
+            self._forget(slot.effect, layer=slot.name)
+        self._remove(slot)
+        self._update_gauges()
@@ -0,0 +1,145 @@
+import collections
+import concurrent.futures
+import json
+import logging
+import threading
+
+import numpy as np
+
+from lib import metrics
+from lib.transitions import as_array
+
+logger = logging.getLogger(__name__)
+
+# Cycles that aren't a whole number of frames are repeated up to this many
+# times to get closer to one
+MAX_REPEATS = 8
+
+
+class FrameCache(object):
+    """
+    LRU cache holding one rendered cycle of periodic effects.
+
+    Effects that return a period from period() are rendered for one cycle in
+    a background thread, keyed by (class, params, pixel count, fps). Once the
+    cycle is ready the engine replays it instead of calling tick(). Cycles
+    are evicted least recently used first to stay under `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.pending = set()
+        self.failed = set()
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="frame-cache"
+        )
+
+    @staticmethod
+    def frame_count(effect):
+        """
+        Number of frames to cache so that replaying them in a loop stays in step.
+        """
+        frames = effect.period() * effect.target_fps
+        repeats = min(
+            range(1, MAX_REPEATS + 1), key=lambda n: abs(n * frames - round(n * frames))
+        )
+        return max(round(repeats * frames), 1)
+
+    def request(self, effect):
+        """
+        Look up the cycle of `effect`, starting to render it on a miss.
+
+        Returns:
+            tuple: Key to poll get() with, None if the effect can't be cached
+        """
+        period = effect.period()
+        if period is None or period <= 0:
+            return None
+
+        if self.frame_count(effect) * effect.led.count * 3 > self.max_bytes:
+            return None
+
+        try:
+            params = json.dumps(effect.config, sort_keys=True)
+        except TypeError:
+            return None
+
+        key = (effect.__class__, params, effect.led.count, effect.target_fps)
+        with self.lock:
+            if key in self.failed:
+                return None
+            if key in self.entries or key in self.pending:
+                return key
+            self.pending.add(key)
+
+        metrics.FRAME_CACHE_MISSES.inc()
+        self.executor.submit(self._render, key, effect)
+        return key
+
+    def get(self, key):
+        """
+        Returns:
+            np.ndarray: (frames, count * 3) uint8 cycle, None while still rendering.
+                Frame i is the one at i / target_fps seconds (modulo the length).
+        """
+        with self.lock:
+            frames = self.entries.get(key)
+            if frames is not None:
+                self.entries.move_to_end(key)
+                metrics.FRAME_CACHE_HITS.inc()
+            return frames
+
+    def lost(self, key):
+        """
+        Returns:
+            bool: Whether get(key) will never return the cycle (its rendering
+                failed, or it was evicted)
+        """
+        with self.lock:
+            return key not in self.entries and key not in self.pending
+
+    def forget(self, names: set):
+        """
+        Drop the cycles and failures of effect classes that were reloaded, the
+        new code gets a fresh chance to be cached.
+
+        Args:
+            names (set): Names of the effect classes
+        """
+        with self.lock:
+            for key in [key for key in self.entries if key[0].__name__ in names]:
+                self.size -= self.entries.pop(key).nbytes
+            self.failed = {key for key in self.failed if key[0].__name__ not in names}
+            metrics.FRAME_CACHE_BYTES.set(self.size)
+
+    def _render(self, key, effect):
+        try:
+            # Render from a fresh instance, the running one keeps its own state
+            source = effect.__class__(
+                effect.led, target_fps=effect.target_fps, **effect.config
+            )
+            dt = 1.0 / source.target_fps
+            frames = np.empty(
+                (self.frame_count(source), source.led.count * 3), np.uint8
+            )
+            for i in range(len(frames)):
+                frames[i] = as_array(source.render(i * dt, dt))
+        except Exception:
+            logger.exception("Could not render %s for the frame cache", key[0].__name__)
+            with self.lock:
+                # Not retried
+                self.pending.discard(key)
+                self.failed.add(key)
+            return
+
+        with self.lock:
+            self.pending.discard(key)
+            self.entries[key] = frames
+            self.size += frames.nbytes
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.nbytes
+            metrics.FRAME_CACHE_BYTES.set(self.size)
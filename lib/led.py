@@ -1,135 +1,695 @@
 import abc
-import neopixel
+import logging
+import numpy as np
 import threading
-import pkgutil
+import importlib
 import inspect
 import datetime
+import json
+import math
+import os
+import sys
 import time
 
+from pydantic import ValidationError
+
+from lib import metrics
+from lib.color import (
+    NEUTRAL_TEMPERATURE,
+    apply_table,
+    check_correction,
+    correction_table,
+)
+from lib.discovery import config_model, scan_effects
+
+logger = logging.getLogger(__name__)
+
+
+class EffectBase(abc.ABC):
+    """
+    An animation rendered by the RenderEngine, one tick() per frame.
+    """
 
-class EffectBase(abc.ABC, threading.Thread):
     CONFIG_SCHEMA = []
 
-    def __init__(self, led, **kwargs):
-        super().__init__()
+    # Default frame rate, can be overridden per effect or per request (target_fps=...)
+    TARGET_FPS = 60
+
+    # Per-frame config values (speeds, fade steps, ...) are expressed at this rate
+    REFERENCE_FPS = 60
+
+    # Accepted target_fps range, slower frames would overflow the engine's waits
+    MIN_TARGET_FPS = 0.1
+    MAX_TARGET_FPS = 240.0
+
+    def __init__(self, led, target_fps: float = None, **kwargs):
         self.led = led
         self.config = kwargs
 
-        # Event to stop the threads
-        self.stopped = threading.Event()
+        # Effects render into their own RGB frame, committed to the LED once per frame
+        self.frame = memoryview(bytearray(self.led.count * 3))
 
         # Store start time to keep track of how long the effect has been running
         self.start_time = datetime.datetime.now()
-        self.target_fps = 60
+        self.target_fps = self.check_target_fps(
+            self.TARGET_FPS if target_fps is None else target_fps
+        )
+
+        # Maintained by the render engine
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+        self.fps = 0.0
+
+        # Seconds on the effect's own clock, the t of the last rendered frame
+        self.clock = 0.0
+
+    def configure(self):
+        """
+        (Re)compute everything derived from `self.config`. Effects call it
+        from their constructor, and the render engine calls it again between
+        two frames after update() changed parameters of the running effect,
+        so it must leave the animation state (positions, heat, ...) alone.
+        """
+        pass
+
+    @staticmethod
+    def check_target_fps(target_fps):
+        """
+        Returns:
+            float: target_fps as a float
+
+        Raises:
+            TypeError, ValueError: Not a number between MIN_TARGET_FPS and MAX_TARGET_FPS
+        """
+        target_fps = float(target_fps)
+        if not (
+            math.isfinite(target_fps)
+            and EffectBase.MIN_TARGET_FPS <= target_fps <= EffectBase.MAX_TARGET_FPS
+        ):
+            raise ValueError(
+                f"target_fps must be between {EffectBase.MIN_TARGET_FPS:g} "
+                f"and {EffectBase.MAX_TARGET_FPS:g}"
+            )
+        return target_fps
+
+    def update(self, changes: dict):
+        """
+        Record new parameters of the running effect, configure() applies them.
+        Called by the render engine between two frames.
+
+        Returns:
+            dict: The parameters whose value actually changed
+        """
+        defaults = {param["name"]: param.get("default") for param in self.CONFIG_SCHEMA}
+        changed = {
+            name: value
+            for name, value in changes.items()
+            if name != "target_fps"
+            and self.config.get(name, defaults.get(name)) != value
+        }
+        target_fps = changes.get("target_fps")
+        if target_fps is not None:
+            target_fps = self.check_target_fps(target_fps)
+            if target_fps != self.target_fps:
+                self.target_fps = target_fps
+                changed["target_fps"] = target_fps
+
+        config = {**self.config, **changed}
+        config.pop("target_fps", None)
+        self.config = config
+        return changed
+
+    def render(self, t: float, dt: float):
+        """
+        Advance the effect by dt seconds and return the RGB buffer to commit.
+        """
+        self.tick(t, dt)
+        return self.frame
+
+    @abc.abstractmethod
+    def tick(self, t: float, dt: float):
+        """
+        Render the frame at t seconds since start, dt seconds after the previous one.
+        """
+        pass
+
+    def period(self):
+        """
+        Seconds after which the animation repeats itself exactly, None when it
+        doesn't (random, stateful, ...). Periodic effects are rendered for one
+        cycle and then replayed from the engine's frame cache.
+        """
+        return None
+
+    def frames(self, dt: float):
+        """
+        Convert dt to a (fractional) number of REFERENCE_FPS frames.
+        """
+        return dt * self.REFERENCE_FPS
+
+    def set_pixel(self, pixel: int, color: tuple):
+        offset = pixel * 3
+        self.frame[offset : offset + 3] = bytes(color)
+
+    def fill(self, color: tuple):
+        self.frame[:] = bytes(color) * self.led.count
+
+
+class VectorEffectBase(EffectBase):
+    """
+    Base for effects that render the whole strip at once with NumPy.
 
-    def run(self):
-        frame_time = 1.0 / self.target_fps
-        while not self.stopped.is_set():
-            start_loop = time.time()
+    tick(t, dt) receives the seconds elapsed since the effect started and since
+    the previous frame, and returns an (N, 3) uint8 array. `self.pixels` is an (N, 3) view over `self.frame`
+    that can be used as an output array to avoid per-frame allocations.
+    """
 
-            self.tick()
-            self.led.show()
+    def __init__(self, led, **kwargs):
+        super().__init__(led, **kwargs)
+        self.index = np.arange(self.led.count)
+        self.pixels = np.frombuffer(self.frame, dtype=np.uint8).reshape(-1, 3)
 
-            # Enforce FPS
-            elapsed = time.time() - start_loop
-            wait_time = frame_time - elapsed
-            if wait_time > 0:
-                if self.stopped.wait(wait_time):
-                    break
+    def render(self, t: float, dt: float):
+        return np.ascontiguousarray(self.tick(t, dt), dtype=np.uint8)
 
     @abc.abstractmethod
-    def tick(self):
+    def tick(self, t: float, dt: float):
         pass
 
-    def stop(self):
-        self.stopped.set()
-        # self.led.clear() # Moved responsibility to caller/fade_out logic
-
 
 class EffectRegistry(object):
-    def __init__(self):
+    """
+    Effect plugins found in lib/effects.
+
+    Names, descriptions and config schemas come from a static scan of the
+    effect sources (cached in an on-disk manifest), modules are only imported
+    the first time an effect class is requested. watch() re-imports modules
+    as they change on disk.
+    """
+
+    def __init__(self, path: str = None, manifest_path: str = None):
+        self.path = path or os.path.join(os.path.dirname(__file__), "effects")
+        self.manifest_path = manifest_path
         self.effects = {}
-
-        # Look for effects in the effects folder and register them if they are valid
-        self._load_effects()
+        self.lock = threading.Lock()
+        self.watcher = None
+        self.watcher_stopped = threading.Event()
+
+        # Look for effects in the effects folder without importing them
+        self.manifest = scan_effects(self.path, self.manifest_path)
+
+        # Pydantic models of the effects' arguments, compiled once per schema
+        self.model_cache = {}
+        self.models = self._compile(self.manifest)
+
+    def _model(self, name: str, schema: list):
+        key = (name, json.dumps(schema, sort_keys=True))
+        model = self.model_cache.get(key)
+        if model is None:
+            model = self.model_cache[key] = config_model(name, schema)
+        return model
+
+    def _compile(self, manifest: dict):
+        # Schemas that aren't literals are compiled when their class is imported
+        return {
+            name: self._model(name, entry["config_schema"])
+            for name, entry in manifest.items()
+            if entry["config_schema"] is not None
+        }
+
+    @staticmethod
+    def _is_valid(effect: object):
+        return issubclass(effect, EffectBase) and not inspect.isabstract(effect)
 
     def _register(self, effect: object):
-        if issubclass(effect, EffectBase) and effect != EffectBase:
+        if self._is_valid(effect):
             self.effects[effect.__name__] = effect
+            if effect.__name__ not in self.models:
+                self.models = {
+                    **self.models,
+                    effect.__name__: self._model(effect.__name__, effect.CONFIG_SCHEMA),
+                }
 
-    def _load_effects(self):
-        for _, name, _ in pkgutil.iter_modules(["lib/effects"]):
-            self.import_effect(name)
+    def _module_name(self, name: str):
+        return f"{__package__}.effects.{name}"
 
     def import_effect(self, name: str):
-        effect = pkgutil.find_loader(f"{__package__}.effects.{name}")
-
-        if not effect:
+        try:
+            module = importlib.import_module(self._module_name(name))
+        except ModuleNotFoundError:
             raise ImportError(f"Effect {name} not found")
 
-        for _, obj in inspect.getmembers(effect.load_module(), inspect.isclass):
+        for _, obj in inspect.getmembers(module, inspect.isclass):
             self._register(obj)
 
+    def reload(self, modules):
+        """
+        Rescan the effects folder and re-import the given (already imported)
+        modules. Modules that were never imported are left to the next get().
+
+        Returns:
+            set: Names of the effects whose class was replaced or removed
+        """
+        changed = set()
+
+        with self.lock:
+            manifest = scan_effects(self.path, self.manifest_path)
+            effects = dict(self.effects)
+
+            for name in modules:
+                qualified = self._module_name(name)
+                module = sys.modules.get(qualified)
+                if module is None:
+                    continue
+
+                if os.path.exists(os.path.join(self.path, f"{name}.py")):
+                    try:
+                        module = importlib.reload(module)
+                    except Exception:
+                        # Keep serving the previous version until the file is fixed
+                        logger.exception("Failed to reload effect module %s", name)
+                        continue
+                    classes = {
+                        obj.__name__: obj
+                        for _, obj in inspect.getmembers(module, inspect.isclass)
+                        if obj.__module__ == qualified and self._is_valid(obj)
+                    }
+                else:
+                    del sys.modules[qualified]
+                    classes = {}
+
+                for effect_name, effect in list(effects.items()):
+                    if effect.__module__ == qualified:
+                        del effects[effect_name]
+                        changed.add(effect_name)
+
+                effects.update(classes)
+                changed.update(classes)
+
+            models = self._compile(manifest)
+            for name, effect in effects.items():
+                if name not in models:
+                    models[name] = self._model(name, effect.CONFIG_SCHEMA)
+
+            # Swap the tables at once, readers never see a half updated registry
+            self.manifest = manifest
+            self.effects = effects
+            self.models = models
+
+        if changed:
+            logger.info("Reloaded effects: %s", ", ".join(sorted(changed)))
+        return changed
+
+    def watch(self, on_reload=None):
+        """
+        Watch the effects folder in a background thread and reload modules as
+        they change. `on_reload(names)` is called with the changed effect names.
+        Uses OS change notifications (inotify, FSEvents, ...) via watchfiles.
+        """
+        try:
+            import watchfiles
+        except ImportError:
+            logger.warning("watchfiles is not installed, effect hot reload disabled")
+            return
+
+        if self.watcher is not None:
+            return
+
+        def run():
+            for changes in watchfiles.watch(
+                self.path,
+                watch_filter=watchfiles.PythonFilter(),
+                stop_event=self.watcher_stopped,
+                recursive=False,
+                debounce=300,
+            ):
+                modules = {
+                    os.path.splitext(os.path.basename(path))[0]
+                    for _, path in changes
+                    if os.path.dirname(os.path.abspath(path))
+                    == os.path.abspath(self.path)
+                }
+                try:
+                    changed = self.reload(modules)
+                    if changed and on_reload is not None:
+                        on_reload(changed)
+                except Exception:
+                    logger.exception("Effect reload failed")
+
+        self.watcher_stopped.clear()
+        self.watcher = threading.Thread(target=run, name="effect-watcher", daemon=True)
+        self.watcher.start()
+
+    def stop_watching(self):
+        if self.watcher is None:
+            return
+
+        self.watcher_stopped.set()
+        self.watcher.join(timeout=1.0)
+        self.watcher = None
+
     def get(self, name: str):
         if not self.is_effect(name):
             raise KeyError(f"Effect {name} not found")
 
+        if name not in self.effects:
+            with self.lock:
+                if name not in self.effects:
+                    self.import_effect(self.manifest[name]["module"])
+
+        if name not in self.effects:
+            raise KeyError(f"Effect {name} could not be loaded")
+
         return self.effects[name]
 
     def get_all(self):
-        return self.effects
+        return {name: self.get(name) for name in self.get_names()}
 
     def get_names(self):
-        return self.effects.keys()
+        return self.manifest.keys()
 
     def get_description(self, name: str):
         if not self.is_effect(name):
             raise KeyError(f"Effect {name} not found")
 
-        return self.effects[name].__doc__
+        return self.manifest[name]["description"]
+
+    def get_source_hash(self, name: str):
+        """
+        Returns:
+            str: Hash of the effect's source, changes whenever its code does
+        """
+        if not self.is_effect(name):
+            raise KeyError(f"Effect {name} not found")
+
+        return self.manifest[name]["source"]
 
     def get_config_schema(self, name: str):
         if not self.is_effect(name):
             raise KeyError(f"Effect {name} not found")
 
-        return self.effects[name].CONFIG_SCHEMA
+        schema = self.manifest[name]["config_schema"]
+        if schema is None:
+            # Not a literal in the source, ask the class itself
+            return self.get(name).CONFIG_SCHEMA
+
+        return schema
+
+    def get_config_model(self, name: str):
+        """
+        Returns:
+            type: The pydantic model of the effect's arguments (see discovery.config_model)
+        """
+        if not self.is_effect(name):
+            raise KeyError(f"Effect {name} not found")
+
+        if name not in self.models:
+            # Its schema is computed, import the class to compile it
+            self.get(name)
+        return self.models[name]
+
+    def validate_config(self, name: str, args: dict):
+        """
+        Validate effect arguments against the effect's compiled model.
+
+        Returns:
+            dict: The given arguments converted to their schema type, colors
+                as (r, g, b) tuples, target_fps as a float
+
+        Raises:
+            KeyError: The effect doesn't exist
+            pydantic.ValidationError: Unknown arguments, or invalid values
+        """
+        args = dict(args or {})
+        target_fps = args.pop("target_fps", None)
+
+        model = self.get_config_model(name)
+        config = model.model_validate(args)
+        valid = {field: getattr(config, field) for field in config.model_fields_set}
+        if target_fps is not None:
+            try:
+                valid["target_fps"] = EffectBase.check_target_fps(target_fps)
+            except (TypeError, ValueError) as e:
+                raise ValidationError.from_exception_data(
+                    model.__name__,
+                    [
+                        {
+                            "type": "value_error",
+                            "loc": ("target_fps",),
+                            "input": target_fps,
+                            "ctx": {"error": e},
+                        }
+                    ],
+                )
+        return valid
 
     def is_effect(self, name: str):
-        if name not in self.effects:
+        if name not in self.manifest:
             return False
 
         return True
 
 
+class Segment(object):
+    """
+    Named range of pixels that runs its own preset.
+
+    Effects are constructed with the segment in place of the LED, so
+    `self.led.count` is the segment length and pixel 0 is its first pixel
+    (its last one on the strip when reversed).
+    """
+
+    def __init__(self, name: str, start: int, length: int, reverse: bool = False):
+        self.name = name
+        self.start = int(start)
+        self.length = int(length)
+        self.reverse = bool(reverse)
+
+    @property
+    def count(self):
+        return self.length
+
+    @property
+    def end(self):
+        return self.start + self.length
+
+    def write(self, led, frame):
+        """
+        Commit an RGB frame in segment order to its range of the strip.
+        """
+        if self.reverse:
+            frame = np.ascontiguousarray(
+                np.frombuffer(memoryview(frame).cast("B"), dtype=np.uint8).reshape(
+                    -1, 3
+                )[::-1]
+            )
+        led.write_range(self.start, frame)
+
+    def read(self, led):
+        """
+        Copy of what the strip shows in this range, in segment order.
+        """
+        frame = bytes(led.frame[self.start * 3 : self.end * 3])
+        if self.reverse:
+            frame = np.frombuffer(frame, dtype=np.uint8).reshape(-1, 3)[::-1].tobytes()
+        return frame
+
+
 class LED(object):
-    def __init__(self, pin, num_pixels: int, auto_write: bool = False):
+    # Segment covering the whole strip, always defined
+    ALL = "all"
+
+    def __init__(
+        self,
+        pin,
+        num_pixels: int,
+        auto_write: bool = False,
+        backend="auto",
+        frame=None,
+        segments=(),
+        gamma: float = 1.0,
+        temperature: float = NEUTRAL_TEMPERATURE,
+    ):
         self.auto_write = auto_write
-        self.led = neopixel.NeoPixel(pin, num_pixels, auto_write=self.auto_write)
-        self.lock = threading.Lock()
+        if isinstance(backend, str):
+            backend = create_backend(backend, pin, num_pixels, auto_write)
+        self.led = backend
+        self.lock = metrics.TimedLock(metrics.LOCK_WAIT_SECONDS)
+
+        # Contiguous RGB copy of what has been committed to the strip, callers
+        # can provide the buffer (e.g. shared memory read by other processes)
+        if frame is None:
+            frame = bytearray(num_pixels * 3)
+        self.frame = memoryview(frame).cast("B")[: num_pixels * 3]
+
+        # Immutable copy of the frame as it was last transmitted, for readers
+        # that must not see one being drawn (see Controller.frame)
+        self.shown = bytes(self.frame)
+
+        # Whether the frame changed since it was last shown, unchanged frames
+        # aren't transmitted again
+        self.dirty = False
+
+        # Color correction applied to the frame on its way to the backend
+        # (see set_correction), the frame itself stays uncorrected
+        check_correction(gamma, temperature)
+        self.gamma = float(gamma)
+        self.temperature = float(temperature)
+        self.brightness = 1.0
+        self.table = correction_table(self.gamma, self.temperature, self.brightness)
+        self.output = np.zeros((num_pixels, 3), dtype=np.uint8)
+
+        # Rendered in this order, later segments are drawn over earlier ones
+        self.segments = {self.ALL: Segment(self.ALL, 0, num_pixels)}
+        for segment in segments:
+            self.add_segment(*segment)
 
     @property
     def count(self):
         return self.led.n
 
+    def add_segment(self, name: str, start: int, length: int, reverse: bool = False):
+        """
+        Define (or redefine) a named segment of the strip.
+
+        Returns:
+            Segment: The new segment
+        """
+        if name == self.ALL:
+            raise ValueError(f"Segment {self.ALL} can't be redefined")
+        if length <= 0 or start < 0 or start + length > self.count:
+            raise ValueError(f"Segment {name} must be within 0..{self.count}")
+
+        segment = Segment(name, start, length, reverse)
+        # Replaced as a whole so the render thread never sees a half updated table
+        segments = dict(self.segments)
+        segments[name] = segment
+        self.segments = segments
+        return segment
+
+    def remove_segment(self, name: str):
+        if name == self.ALL:
+            raise ValueError(f"Segment {self.ALL} can't be removed")
+
+        segments = dict(self.segments)
+        del segments[name]
+        self.segments = segments
+
     def set_color(self, color: tuple):
         with self.lock:
-            self.led.fill(color)
+            self.frame[:] = bytes(color) * self.count
+            self._write(0, self.count)
             if not self.auto_write:
                 self.led.show()
+            self.shown = bytes(self.frame)
+            self.dirty = False
 
     def set_brightness(self, brightness: float):
+        self.set_correction(brightness=brightness)
+
+    def set_correction(
+        self, gamma: float = None, temperature: float = None, brightness: float = None
+    ):
+        """
+        Change the color correction and re-send the whole strip with it.
+
+        Every value going to the backend is mapped through one per-channel
+        lookup table combining them, rebuilt only here.
+
+        Args:
+            gamma (float): Gamma exponent, 1.0 is linear
+            temperature (float): White point in Kelvin, 6600 is neutral
+            brightness (float): Global brightness from 0.0 to 1.0
+
+        Raises:
+            ValueError: A value is out of range
+        """
+        check_correction(gamma, temperature)
+        gamma = self.gamma if gamma is None else float(gamma)
+        temperature = self.temperature if temperature is None else float(temperature)
+        brightness = self.brightness if brightness is None else float(brightness)
+        brightness = min(max(brightness, 0.0), 1.0)
+
+        table = correction_table(gamma, temperature, brightness)
         with self.lock:
-            self.led.brightness = brightness
+            self.gamma = gamma
+            self.temperature = temperature
+            self.brightness = brightness
+            self.table = table
+            self._write(0, self.count)
             if not self.auto_write:
                 self.led.show()
+            self.shown = bytes(self.frame)
+            self.dirty = False
 
     def set_pixel(self, pixel: int, color: tuple):
         with self.lock:
-            self.led[pixel] = color
+            self.frame[pixel * 3 : pixel * 3 + 3] = bytes(color)
+            self._write(pixel, pixel + 1)
+            self.dirty = True
+
+    def _write(self, start: int, end: int):
+        # Called with the lock held, hands pixels start..end to the backend
+        if self.table is None:
+            self.led.write(self.frame, start, end)
+            return
+
+        pixels = np.frombuffer(self.frame, dtype=np.uint8).reshape(-1, 3)
+        apply_table(self.table, pixels[start:end], self.output[start:end])
+        self.led.write(memoryview(self.output).cast("B"), start, end)
+
+    def write_frame(self, buffer):
+        """
+        Commit a whole RGB frame (count * 3 bytes) to the strip buffer under a single lock.
+        """
+        self.write_range(0, buffer)
+
+    def write_range(self, start: int, buffer):
+        """
+        Commit consecutive RGB pixels starting at pixel `start` under a single
+        lock. Pixels that already show these colors are left alone.
+        """
+        data = memoryview(buffer).cast("B")
+        if len(data) % 3:
+            raise ValueError("Buffer length must be a multiple of 3 (RGB)")
+
+        end = start + len(data) // 3
+        if start < 0 or end > self.count:
+            raise IndexError(f"Pixels {start}..{end} out of range")
+
+        with self.lock:
+            current = self.frame[start * 3 : end * 3]
+            if np.array_equal(
+                np.frombuffer(current, dtype=np.uint8),
+                np.frombuffer(data, dtype=np.uint8),
+            ):
+                return
+
+            current[:] = data
+            self._write(start, end)
+            if self.auto_write:
+                self._show()
+            else:
+                self.dirty = True
 
     def show(self):
+        """
+        Transmit the frame if it changed since it was last shown.
+
+        Returns:
+            bool: Whether anything was transmitted
+        """
         with self.lock:
-            self.led.show()
+            if not self.dirty:
+                return False
+            self._show()
+            self.dirty = False
+            return True
+
+    def _show(self):
+        # Called with the lock held
+        self.led.show()
+        self.shown = bytes(self.frame)
 
     def clear(self):
         self.set_color((0, 0, 0))
@@ -141,10 +701,7 @@ class LED(object):
             self.clear()
             return
 
-        # We use get brightness from the neopixel object
-        # Note: reading brightness might not need lock if it's just a property,
-        # but modifying it does.
-        current_brightness = self.led.brightness
+        current_brightness = self.brightness
 
         for i in range(steps):
             # Linear fade
@@ -156,20 +713,124 @@ class LED(object):
         self.clear()
 
 
+def create_backend(name: str, pin, num_pixels: int, auto_write: bool = False):
+    """
+    Build an LED backend by name: "neopixel", "mock" or "auto" (neopixel when
+    the hardware libraries are available, MockLed otherwise).
+    """
+    if name == "mock":
+        return MockLed(num_pixels)
+
+    if name == "neopixel":
+        return NeoPixelBackend(pin, num_pixels, auto_write=auto_write)
+
+    if name == "auto":
+        if pin is None:
+            logger.warning("No GPIO pin available, using the MockLed backend")
+            return MockLed(num_pixels)
+
+        try:
+            return NeoPixelBackend(pin, num_pixels, auto_write=auto_write)
+        except (ImportError, NotImplementedError, RuntimeError) as e:
+            logger.warning("neopixel unavailable (%s), using the MockLed backend", e)
+            return MockLed(num_pixels)
+
+    raise ValueError(f"Unknown LED backend {name}")
+
+
+class NeoPixelBackend(object):
+    """
+    ws281x strip driven through adafruit-circuitpython-neopixel.
+    """
+
+    def __init__(self, pin, num_pixels: int, auto_write: bool = False):
+        import neopixel
+
+        # Brightness is part of the LED's color correction, the driver would
+        # otherwise scale every pixel again in Python on each show()
+        self.pixels = neopixel.NeoPixel(
+            pin, num_pixels, brightness=1.0, auto_write=auto_write
+        )
+
+    @property
+    def n(self):
+        return self.pixels.n
+
+    def write(self, frame, start: int, end: int):
+        # Copy RGB frame pixels start..end into the neopixel driver buffer
+        post = getattr(self.pixels, "_post_brightness_buffer", None)
+        if post is None:
+            for i in range(start, end):
+                self.pixels[i] = tuple(frame[i * 3 : i * 3 + 3])
+            return
+
+        pre = self.pixels._pre_brightness_buffer
+        bpp = self.pixels._bpp
+        first = self.pixels._offset + start * bpp
+        last = self.pixels._offset + end * bpp
+        target = post if pre is None else pre
+
+        # Strided slice copies reorder RGB into the strip byte order (e.g. GRB) in C
+        for channel, index in enumerate(self.pixels._byteorder[:3]):
+            target[first + index : last : bpp] = frame[
+                start * 3 + channel : end * 3 : 3
+            ]
+
+        if pre is not None:
+            post[first:last] = pre[first:last]
+
+    def show(self):
+        self.pixels.show()
+
+
 class MockLed(object):
-    def __init__(self, num_pixels: int):
-        self.pixels = [0] * num_pixels
-        self.brightness = 1.0
-        self.n = len(self.pixels)
+    """
+    In-memory backend for development and CI.
 
-    def __getitem__(self, key):
-        return self.pixels[key]
+    Keeps a real RGB pixel buffer and copies every shown frame (with color
+    correction applied, as it would go on the wire) into a preallocated ring
+    buffer holding the last `history` frames.
+    """
 
-    def fill(self, color: tuple):
-        print(f"fill: {color}")
+    def __init__(self, num_pixels: int, history: int = 120):
+        self.n = num_pixels
+        self.history = history
+        self.frames_shown = 0
+
+        self._pixels = bytearray(num_pixels * 3)
+        self.pixels = memoryview(self._pixels)
+        self._frames = memoryview(bytearray(history * num_pixels * 3))
+
+    def __getitem__(self, key: int):
+        return tuple(self.pixels[key * 3 : key * 3 + 3])
+
+    def write(self, frame, start: int, end: int):
+        self.pixels[start * 3 : end * 3] = frame[start * 3 : end * 3]
 
     def show(self):
-        print("show")
+        if not self.history:
+            self.frames_shown += 1
+            return
 
-    def set_color(self, color: tuple):
-        print(f"set_color: {color}")
+        size = self.n * 3
+        offset = (self.frames_shown % self.history) * size
+        self._frames[offset : offset + size] = self.pixels
+        self.frames_shown += 1
+
+    def get_frame(self, age: int = 0):
+        """
+        Return the frame shown `age` frames ago (0 is the latest) as RGB bytes.
+        """
+        if age < 0 or age >= min(self.history, self.frames_shown):
+            raise IndexError(f"Frame {age} not in history")
+
+        size = self.n * 3
+        offset = ((self.frames_shown - 1 - age) % self.history) * size
+        return bytes(self._frames[offset : offset + size])
+
+    def get_frames(self):
+        """
+        Return the captured frames, oldest first.
+        """
+        count = min(self.history, self.frames_shown)
+        return [self.get_frame(age) for age in range(count - 1, -1, -1)]
@@ -0,0 +1,268 @@
+import bisect
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds, dense around a 60 FPS frame budget (16.7ms)
+LATENCY_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.0075,
+    0.01,
+    0.0125,
+    0.015,
+    0.0167,
+    0.02,
+    0.025,
+    0.033,
+    0.05,
+    0.1,
+    0.25,
+)
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self):
+        """
+        Render every registered metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Metric(object):
+    """
+    Minimal Prometheus style metric.
+
+    Updates are plain attribute writes with no locking: they are made almost
+    exclusively by the render thread and only read when /metrics is scraped,
+    so recording a value costs next to nothing.
+    """
+
+    TYPE = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.labelvalues = ()
+
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"Expected labels {self.labelnames}")
+
+        values = tuple(str(v) for v in values)
+        child = self.children.get(values)
+        if child is None:
+            child = self._child()
+            child.labelvalues = values
+            self.children[values] = child
+        return child
+
+    def clear(self):
+        self.children = {}
+
+    def samples(self):
+        if not self.labelnames:
+            return list(self._samples(""))
+
+        lines = []
+        for child in list(self.children.values()):
+            labels = ",".join(
+                f'{name}="{_escape(value)}"'
+                for name, value in zip(self.labelnames, child.labelvalues)
+            )
+            lines.extend(child._samples(labels))
+        return lines
+
+    def _child(self):
+        raise NotImplementedError
+
+    def _samples(self, labels: str):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def _child(self):
+        return Counter(self.name, self.documentation, registry=None)
+
+    def _samples(self, labels: str):
+        yield f"{self.name}{_braces(labels)} {_format(self.value)}"
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def _child(self):
+        return Gauge(self.name, self.documentation, registry=None)
+
+    def _samples(self, labels: str):
+        yield f"{self.name}{_braces(labels)} {_format(self.value)}"
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, *args, buckets=LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upper_bounds = tuple(sorted(buckets))
+        # Last slot counts observations above the largest bucket (+Inf)
+        self.counts = [0] * (len(self.upper_bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    def _child(self):
+        return Histogram(
+            self.name, self.documentation, buckets=self.upper_bounds, registry=None
+        )
+
+    def _samples(self, labels: str):
+        sep = "," if labels else ""
+        cumulative = 0
+        for bound, count in zip(self.upper_bounds, self.counts):
+            cumulative += count
+            yield f'{self.name}_bucket{{{labels}{sep}le="{_format(bound)}"}} {cumulative}'
+        cumulative += self.counts[-1]
+        yield f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {cumulative}'
+        yield f"{self.name}_sum{_braces(labels)} {_format(self.sum)}"
+        yield f"{self.name}_count{_braces(labels)} {cumulative}"
+
+
+class TimedLock(object):
+    """
+    threading.Lock wrapper that records how long callers waited to acquire it.
+    """
+
+    def __init__(self, histogram: Histogram):
+        self._lock = threading.Lock()
+        self.histogram = histogram
+
+    def acquire(self, *args, **kwargs):
+        start = time.perf_counter()
+        acquired = self._lock.acquire(*args, **kwargs)
+        self.histogram.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _braces(labels: str):
+    return f"{{{labels}}}" if labels else ""
+
+
+def _escape(value: str):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float):
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+TICK_SECONDS = Histogram(
+    "lightwave_tick_seconds",
+    "Time spent rendering, compositing and committing a frame of every due "
+    "preset and layer, before it is transmitted",
+)
+SHOW_SECONDS = Histogram(
+    "lightwave_show_seconds", "Time spent committing and transmitting a frame"
+)
+LOCK_WAIT_SECONDS = Histogram(
+    "lightwave_lock_wait_seconds", "Time spent waiting for the LED lock"
+)
+FRAMES_RENDERED = Counter("lightwave_frames_rendered_total", "Frames rendered")
+FRAMES_LATE = Counter(
+    "lightwave_frames_late_total", "Frames that finished after their deadline"
+)
+FRAMES_DROPPED = Counter(
+    "lightwave_frames_dropped_total", "Frame slots skipped to catch up"
+)
+FRAMES_UNCHANGED = Counter(
+    "lightwave_frames_unchanged_total",
+    "Frames not transmitted because the strip already showed them",
+)
+FPS = Gauge("lightwave_fps", "Measured frames per second of the render loop")
+TARGET_FPS = Gauge("lightwave_target_fps", "Target frames per second")
+PRESET_RUNNING = Gauge(
+    "lightwave_preset_running",
+    "Currently running presets",
+    labelnames=("preset", "segment"),
+)
+FRAME_CACHE_BYTES = Gauge(
+    "lightwave_frame_cache_bytes", "Memory used by cached cycles of periodic presets"
+)
+FRAME_CACHE_HITS = Counter(
+    "lightwave_frame_cache_hits_total", "Periodic presets replayed from the frame cache"
+)
+FRAME_CACHE_MISSES = Counter(
+    "lightwave_frame_cache_misses_total",
+    "Periodic preset cycles rendered for the cache",
+)
+REALTIME_PACKETS = Counter(
+    "lightwave_realtime_packets_total",
+    "Realtime pixel packets received",
+    labelnames=("protocol",),
+)
+REALTIME_FRAMES = Counter(
+    "lightwave_realtime_frames_total", "Realtime frames pushed to the strip"
+)
+REALTIME_FRAMES_SUPERSEDED = Counter(
+    "lightwave_realtime_frames_superseded_total",
+    "Realtime frames replaced by a newer one before they were shown",
+)
+AUDIO_LEVEL = Gauge("lightwave_audio_level", "Loudness of the audio input (0-1)")
+AUDIO_BEATS = Counter(
+    "lightwave_audio_beats_total", "Beat onsets detected in the audio input"
+)
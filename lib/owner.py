@@ -0,0 +1,578 @@
+"""
+Hardware owner process.
+
+Runs the render engine and the LED driver in a process of its own, so API
+traffic never competes with rendering for the GIL and uvicorn can run several
+workers without each one opening the strip:
+
+    python -m lib.owner --socket /run/lightwave/engine.sock
+    LIGHTWAVE_ENGINE_SOCKET=/run/lightwave/engine.sock uvicorn main:app --workers 4
+
+The committed frame and the engine state live in shared memory, API workers
+read them without a round trip. Commands go over a Unix socket.
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import struct
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+from lib.color import NEUTRAL_TEMPERATURE
+from lib.compositor import DEFAULT_BLEND
+from lib.control import Controller, effect_info, layer_info, segment_info
+
+logger = logging.getLogger(__name__)
+
+
+class SharedState(object):
+    """
+    Committed RGB frame and engine state in a multiprocessing.shared_memory block.
+
+    Written by the owner process only and read lock-free by any number of
+    processes. The header is guarded by a sequence counter that is odd while a
+    write is in progress; readers retry until they see the same even value
+    before and after copying. Frame reads are not guarded, a reader may see a
+    frame that is being committed.
+    """
+
+    # seq, open, pixel count, info length, brightness, gamma, temperature
+    HEADER = struct.Struct("<IIIIddd")
+    SEQ = struct.Struct("<I")
+
+    # JSON with the running effects and the segments (see lib.control)
+    INFO_SIZE = 16384
+
+    # Seconds readers retry for while a write is in progress, an owner that
+    # died in the middle of one leaves the counter odd for good
+    READ_TIMEOUT = 1.0
+    FRAME_OFFSET = HEADER.size + INFO_SIZE
+
+    def __init__(self, num_pixels: int = None, name: str = None):
+        if name is None:
+            self.shm = SharedMemory(
+                create=True, size=self.FRAME_OFFSET + num_pixels * 3
+            )
+            self.owner = True
+        else:
+            self.shm = SharedMemory(name=name)
+            self.owner = False
+            # Python < 3.13 tracks attached blocks too and would unlink the
+            # owner's block when this process exits
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+
+        self.buf = self.shm.buf
+        self.lock = threading.Lock()
+        self.truncated = False
+
+        if self.owner:
+            self.seq = 0
+            self.count = num_pixels
+            self.info = b"{}"
+            self.brightness = 1.0
+            self.gamma = 1.0
+            self.temperature = NEUTRAL_TEMPERATURE
+            self.open = 1
+            self._commit()
+        else:
+            self.count = self.HEADER.unpack_from(self.buf)[2]
+
+        self.frame = self.buf[self.FRAME_OFFSET : self.FRAME_OFFSET + self.count * 3]
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _commit(self, info: bytes = None):
+        self.seq += 1
+        self.SEQ.pack_into(self.buf, 0, self.seq)
+        if info is not None:
+            self.info = info
+            offset = self.HEADER.size
+            self.buf[offset : offset + len(info)] = info
+
+        self.seq += 1
+        self.HEADER.pack_into(
+            self.buf,
+            0,
+            self.seq,
+            self.open,
+            self.count,
+            len(self.info),
+            self.brightness,
+            self.gamma,
+            self.temperature,
+        )
+
+    def publish(self, effects: dict, layers: dict, segments: dict):
+        """
+        Commit the running effects, layers and segments. When they don't fit
+        in INFO_SIZE, the layers that do are published with "truncated" set,
+        and if even that doesn't fit the previous state is kept.
+        """
+        state = {
+            "effects": {name: effect_info(effect) for name, effect in effects.items()},
+            "layers": {name: layer_info(layer) for name, layer in layers.items()},
+            "segments": {
+                name: segment_info(segment) for name, segment in segments.items()
+            },
+        }
+        info = json.dumps(state).encode()
+
+        if len(info) > self.INFO_SIZE:
+            room = self.INFO_SIZE - len(
+                json.dumps(dict(state, layers={}, truncated=True)).encode()
+            )
+            kept = {}
+            for name, layer in state["layers"].items():
+                # Separator included
+                size = len(json.dumps({name: layer}).encode())
+                if size > room:
+                    break
+                kept[name] = layer
+                room -= size
+            info = json.dumps(dict(state, layers=kept, truncated=True)).encode()
+
+            if not self.truncated:
+                logger.warning(
+                    "Engine state is larger than %d bytes, listing %d of %d layers",
+                    self.INFO_SIZE,
+                    len(kept),
+                    len(layers),
+                )
+            self.truncated = True
+            if len(info) > self.INFO_SIZE:
+                return
+        else:
+            self.truncated = False
+
+        with self.lock:
+            self._commit(info)
+
+    def set_correction(
+        self, gamma: float = None, temperature: float = None, brightness: float = None
+    ):
+        with self.lock:
+            if gamma is not None:
+                self.gamma = gamma
+            if temperature is not None:
+                self.temperature = temperature
+            if brightness is not None:
+                self.brightness = brightness
+            self._commit()
+
+    def read(self):
+        """
+        Returns:
+            dict: Same layout as Controller.state(), None once the owner closed the block
+
+        Raises:
+            ConnectionError: A write never finished (the owner died during it)
+        """
+        deadline = None
+        while True:
+            seq = self.SEQ.unpack_from(self.buf)[0]
+            if not seq & 1:
+                header = self.HEADER.unpack_from(self.buf)
+                offset = self.HEADER.size
+                info = bytes(self.buf[offset : offset + header[3]])
+                if self.SEQ.unpack_from(self.buf)[0] == seq:
+                    break
+
+            if deadline is None:
+                deadline = time.monotonic() + self.READ_TIMEOUT
+            elif time.monotonic() > deadline:
+                raise ConnectionError("Render engine state is not readable")
+            # Let the writer finish
+            time.sleep(0)
+
+        _, open_, _, _, brightness, gamma, temperature = header
+        if not open_:
+            return None
+
+        return dict(
+            json.loads(info),
+            brightness=brightness,
+            gamma=gamma,
+            temperature=temperature,
+        )
+
+    def read_frame(self):
+        """
+        Returns:
+            bytes: Copy of the committed RGB frame, None once the owner closed the block
+        """
+        if not self.HEADER.unpack_from(self.buf)[1]:
+            return None
+        return bytes(self.frame)
+
+    def close(self):
+        if self.owner:
+            with self.lock:
+                self.open = 0
+                self._commit()
+
+        self.buf = None
+        try:
+            self.frame.release()
+            self.shm.close()
+        except BufferError:
+            # Views handed out (e.g. the LED's frame) still exist, the mapping
+            # goes away with the process
+            pass
+
+        if self.owner:
+            self.shm.unlink()
+
+
+class OwnerServer(object):
+    """
+    Serves a Controller to API worker processes over a Unix socket.
+
+    Each connection gets a thread. Requests are (method, args, kwargs) tuples,
+    replies ("ok", result) or ("error", exception name, message).
+    """
+
+    COMMANDS = {
+        "start",
+        "update",
+        "stop",
+        "add_layer",
+        "update_layer",
+        "remove_layer",
+        "define_segment",
+        "remove_segment",
+        "set_color",
+        "clear",
+        "set_brightness",
+        "set_correction",
+        "set_playlist",
+        "remove_playlist",
+        "play_playlist",
+        "stop_playlist",
+        "set_rule",
+        "remove_rule",
+        "schedule",
+        "metrics",
+    }
+
+    def __init__(self, controller, state: SharedState, address: str):
+        self.controller = controller
+        self.state = state
+        self.address = address
+        self.listener = None
+
+    def _claim_address(self):
+        if not os.path.exists(self.address):
+            os.makedirs(os.path.dirname(self.address) or ".", exist_ok=True)
+            return
+
+        try:
+            Client(self.address, family="AF_UNIX").close()
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Left behind by an owner that didn't exit cleanly
+            os.unlink(self.address)
+        else:
+            raise RuntimeError(f"Another owner is already serving {self.address}")
+
+    def serve_forever(self):
+        self._claim_address()
+        self.listener = Listener(self.address, family="AF_UNIX")
+        os.chmod(self.address, 0o660)
+        logger.info("Serving the render engine on %s", self.address)
+
+        try:
+            while True:
+                conn = self.listener.accept()
+                threading.Thread(
+                    target=self.handle, args=(conn,), name="owner-client", daemon=True
+                ).start()
+        finally:
+            self.listener.close()
+
+    def handle(self, conn):
+        with conn:
+            try:
+                conn.send(("hello", self.state.name))
+                while True:
+                    method, args, kwargs = conn.recv()
+                    if method not in self.COMMANDS:
+                        conn.send(("error", "ValueError", f"Unknown command {method}"))
+                        continue
+
+                    try:
+                        result = getattr(self.controller, method)(*args, **kwargs)
+                    except Exception as e:
+                        conn.send(("error", type(e).__name__, str(e)))
+                    else:
+                        conn.send(("ok", result))
+            except (EOFError, OSError):
+                pass
+
+
+class RemoteController(object):
+    """
+    Same methods as lib.control.Controller, forwarded to the owner process.
+
+    Commands are a short round trip over the control socket, state() reads
+    shared memory directly. Connects on first use and reconnects when the
+    owner restarts.
+    """
+
+    ERRORS = {
+        "KeyError": KeyError,
+        "TypeError": TypeError,
+        "ValueError": ValueError,
+        # Effect arguments rejected by their pydantic model
+        "ValidationError": ValueError,
+    }
+
+    def __init__(self, address: str):
+        self.address = address
+        self.conn = None
+        self.shared = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        try:
+            conn = Client(self.address, family="AF_UNIX")
+            _, name = conn.recv()
+        except (OSError, EOFError) as e:
+            raise ConnectionError(f"Render engine at {self.address} unavailable: {e}")
+
+        if self.shared is None or self.shared.name != name:
+            if self.shared is not None:
+                self.shared.close()
+            self.shared = SharedState(name=name)
+        self.conn = conn
+
+    def _disconnect(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def call(self, method: str, *args, **kwargs):
+        with self.lock:
+            for retry in (False, True):
+                if self.conn is None:
+                    self._connect()
+
+                try:
+                    self.conn.send((method, args, kwargs))
+                    reply = self.conn.recv()
+                    break
+                except (OSError, EOFError) as e:
+                    # The owner may have restarted since the last call
+                    self._disconnect()
+                    if retry:
+                        raise ConnectionError(f"Lost the render engine: {e}")
+
+        if reply[0] == "error":
+            _, name, message = reply
+            raise self.ERRORS.get(name, RuntimeError)(message)
+        return reply[1]
+
+    def start(self, preset_name, args=None, transition=None, easing=None, segment=None):
+        self.call("start", preset_name, args, transition, easing, segment)
+
+    def update(self, args, segment=None):
+        self.call("update", args, segment)
+
+    def stop(self, transition=None, easing=None, segment=None):
+        self.call("stop", transition, easing, segment)
+
+    def add_layer(
+        self,
+        name,
+        preset_name,
+        args=None,
+        blend=DEFAULT_BLEND,
+        opacity=1.0,
+        transition=None,
+        easing=None,
+        segment=None,
+    ):
+        self.call(
+            "add_layer",
+            name,
+            preset_name,
+            args,
+            blend,
+            opacity,
+            transition,
+            easing,
+            segment,
+        )
+
+    def update_layer(self, name, blend=None, opacity=None):
+        self.call("update_layer", name, blend, opacity)
+
+    def remove_layer(self, name, transition=None, easing=None):
+        self.call("remove_layer", name, transition, easing)
+
+    def define_segment(self, name, start, length, reverse=False):
+        self.call("define_segment", name, start, length, reverse)
+
+    def remove_segment(self, name):
+        self.call("remove_segment", name)
+
+    def set_color(self, color: tuple):
+        self.call("set_color", tuple(color))
+
+    def clear(self):
+        self.call("clear")
+
+    def set_brightness(self, brightness: float):
+        self.call("set_brightness", brightness)
+
+    def set_correction(self, gamma=None, temperature=None, brightness=None):
+        self.call("set_correction", gamma, temperature, brightness)
+
+    def set_playlist(self, name, entries, loop=True):
+        self.call("set_playlist", name, entries, loop)
+
+    def remove_playlist(self, name):
+        self.call("remove_playlist", name)
+
+    def play_playlist(self, name, segment=None, index=0):
+        self.call("play_playlist", name, segment, index)
+
+    def stop_playlist(self, segment=None):
+        self.call("stop_playlist", segment)
+
+    def set_rule(self, name, rule):
+        self.call("set_rule", name, rule)
+
+    def remove_rule(self, name):
+        self.call("remove_rule", name)
+
+    def schedule(self):
+        return self.call("schedule")
+
+    def metrics(self):
+        return self.call("metrics")
+
+    def state(self):
+        state = self.shared.read() if self.shared is not None else None
+        if state is None:
+            # Not connected yet, or the owner went away: reconnect and retry
+            with self.lock:
+                self._disconnect()
+                self._connect()
+            state = self.shared.read()
+        return state
+
+    def frame(self):
+        frame = self.shared.read_frame() if self.shared is not None else None
+        if frame is None:
+            with self.lock:
+                self._disconnect()
+                self._connect()
+            frame = self.shared.read_frame()
+        return frame
+
+    def on_effects_reloaded(self, names: set):
+        # The owner process watches the effects itself and restarts presets
+        pass
+
+    def close(self):
+        with self.lock:
+            self._disconnect()
+
+
+def main(argv=None):
+    from lib.config import (
+        LED_COUNT,
+        LED_PIN,
+        LED_BACKEND,
+        LED_SEGMENTS,
+        LED_GAMMA,
+        LED_TEMPERATURE,
+        CACHE_DIR,
+        ENGINE_SOCKET,
+        EFFECTS_HOT_RELOAD,
+        EFFECTS_RELOAD_RESTART,
+        TRANSITION_DURATION,
+        TRANSITION_EASING,
+        FRAME_CACHE_SIZE,
+        REALTIME_DDP_PORT,
+        REALTIME_E131_PORT,
+        REALTIME_E131_UNIVERSE,
+        REALTIME_TIMEOUT,
+        AUDIO_SOURCE,
+        AUDIO_SAMPLE_RATE,
+        AUDIO_BLOCK,
+        STATE_FILE,
+        STATE_SAVE_DELAY,
+    )
+    from lib.frame_cache import FrameCache
+    from lib.snapshot import StateStore
+    from lib.led import LED, EffectRegistry
+
+    parser = argparse.ArgumentParser(
+        prog="python -m lib.owner", description="Run the LightWave hardware owner"
+    )
+    parser.add_argument(
+        "--socket",
+        default=ENGINE_SOCKET or os.path.join(CACHE_DIR, "engine.sock"),
+        help="Control socket API workers connect to",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    # SIGTERM unwinds like Ctrl+C so the strip is faded out and cleared
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    state = SharedState(LED_COUNT)
+    registry = EffectRegistry(manifest_path=os.path.join(CACHE_DIR, "effects.json"))
+    led = LED(
+        LED_PIN,
+        LED_COUNT,
+        backend=LED_BACKEND,
+        segments=LED_SEGMENTS,
+        frame=state.frame,
+        gamma=LED_GAMMA,
+        temperature=LED_TEMPERATURE,
+    )
+    controller = Controller(
+        led,
+        registry,
+        transition=TRANSITION_DURATION,
+        easing=TRANSITION_EASING,
+        reload_restart=EFFECTS_RELOAD_RESTART,
+        frame_cache=FrameCache(FRAME_CACHE_SIZE) if FRAME_CACHE_SIZE else None,
+        store=StateStore(STATE_FILE, STATE_SAVE_DELAY) if STATE_FILE else None,
+        state=state,
+    )
+    # Before the API is up, so the strip resumes right away
+    controller.restore()
+    controller.listen_realtime(
+        REALTIME_DDP_PORT, REALTIME_E131_PORT, REALTIME_E131_UNIVERSE, REALTIME_TIMEOUT
+    )
+    if AUDIO_SOURCE:
+        controller.listen_audio(AUDIO_SOURCE, AUDIO_SAMPLE_RATE, AUDIO_BLOCK)
+    if EFFECTS_HOT_RELOAD:
+        registry.watch(controller.on_effects_reloaded)
+
+    try:
+        OwnerServer(controller, state, args.socket).serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        registry.stop_watching()
+        controller.close()
+        state.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""
+Rendered previews of effects, for dashboards and effect pickers.
+
+Effects are rendered headless against an in-memory strip, as fast as they
+can tick rather than in real time, in a worker process so the render engine
+never competes with them for the GIL. The result is encoded as an animated
+WebP or GIF (needs Pillow) or as a PNG with one row per frame, and kept in a
+content addressed disk cache: the key covers the effect's source hash, the
+lib modules it is rendered with and every parameter, so repeated requests
+cost a file read and editing an effect never serves a stale preview.
+"""
+
+import concurrent.futures
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from lib.transitions import as_array
+
+logger = logging.getLogger(__name__)
+
+# Media type of each preview format
+FORMATS = {"webp": "image/webp", "gif": "image/gif", "png": "image/png"}
+
+# Bump when the rendering or the encoding changes, to drop previous previews
+PREVIEW_VERSION = 1
+
+# Effect registry of the worker process
+_registry = None
+
+
+def code_version():
+    """
+    Returns:
+        str: Hash of the lib modules (effect base classes, colors,
+            transitions, ...), previews rendered with other versions of them
+            are not reused
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".py"):
+            with open(os.path.join(directory, filename), "rb") as f:
+                digest.update(filename.encode())
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def encode_png(image: np.ndarray):
+    """
+    Encode an (height, width, 3) uint8 image as an RGB PNG, without Pillow.
+    """
+    height, width, _ = image.shape
+    # Each scanline starts with its filter type, 0 (none)
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(kind: bytes, data: bytes):
+        crc = zlib.crc32(kind + data)
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"".join(
+        (
+            b"\x89PNG\r\n\x1a\n",
+            chunk(b"IHDR", header),
+            chunk(b"IDAT", zlib.compress(raw.tobytes(), 9)),
+            chunk(b"IEND", b""),
+        )
+    )
+
+
+def encode_animation(frames: np.ndarray, fps: float, image_format: str, scale: int):
+    """
+    Encode (frames, leds, 3) uint8 frames as a looping animation, each LED a
+    `scale` pixels wide square.
+    """
+    from PIL import Image
+
+    images = [
+        Image.fromarray(np.repeat(np.repeat(frame[np.newaxis], scale, 0), scale, 1))
+        for frame in frames
+    ]
+    output = io.BytesIO()
+    images[0].save(
+        output,
+        format=image_format.upper(),
+        save_all=True,
+        append_images=images[1:],
+        duration=round(1000 / fps),
+        loop=0,
+        **({"lossless": True} if image_format == "webp" else {}),
+    )
+    return output.getvalue()
+
+
+def _effect_class(name: str, source: str):
+    global _registry
+
+    from lib.led import EffectRegistry
+
+    if _registry is None:
+        _registry = EffectRegistry()
+    elif _registry.manifest.get(name, {}).get("source") != source:
+        # The effects changed since they were imported, pick the new code up
+        _registry.reload({entry["module"] for entry in _registry.manifest.values()})
+    return _registry.get(name)
+
+
+def render_frames(effect_class, args: dict, leds: int, seconds: float, fps: float):
+    """
+    Returns:
+        np.ndarray: (frames, leds, 3) uint8 frames of the effect, rendered
+            from its start with a fixed random seed
+    """
+    from lib.bench import seed_effect
+    from lib.led import LED, MockLed
+
+    led = LED(None, leds, backend=MockLed(leds, history=0))
+    effect = effect_class(led, **args)
+    seed_effect(effect)
+
+    dt = 1.0 / fps
+    frames = np.empty((max(round(seconds * fps), 1), leds, 3), dtype=np.uint8)
+    for i in range(len(frames)):
+        frames[i] = as_array(effect.render((i + 1) * dt, dt)).reshape(leds, 3)
+    return frames
+
+
+def render_preview(
+    name: str,
+    source: str,
+    args: dict,
+    leds: int,
+    seconds: float,
+    fps: float,
+    image_format: str,
+    scale: int,
+    version: int = PREVIEW_VERSION,
+):
+    """
+    Render and encode a preview, runs in the worker process.
+
+    Returns:
+        bytes: The encoded image
+    """
+    if image_format != "png":
+        # Fail before rendering when Pillow is missing
+        import PIL  # noqa: F401
+
+    frames = render_frames(_effect_class(name, source), args, leds, seconds, fps)
+    if image_format == "png":
+        return encode_png(frames)
+    return encode_animation(frames, fps, image_format, scale)
+
+
+class PreviewCache(object):
+    """
+    Content addressed disk cache of encoded previews.
+
+    Files are named after their key. Hits touch the file, and the least
+    recently touched ones are removed to stay under `max_bytes`, so processes
+    sharing the folder (uvicorn workers) share one LRU order.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _file(self, key: str, image_format: str):
+        return os.path.join(self.path, f"{key}.{image_format}")
+
+    def get(self, key: str, image_format: str):
+        """
+        Returns:
+            bytes: The cached preview, None on a miss
+        """
+        path = self._file(key, image_format)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("Could not read preview %s: %s", path, e)
+            return None
+        return data
+
+    def put(self, key: str, image_format: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._file(key, image_format)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self._evict()
+        except OSError as e:
+            logger.warning("Could not cache preview %s: %s", path, e)
+
+    def _evict(self):
+        files = []
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name.endswith(".tmp") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, path in sorted(files):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Evicted by another process
+                pass
+            size -= file_size
+
+
+class Previewer(object):
+    """
+    Renders effect previews in a worker process and caches them.
+
+    The worker is spawned on the first miss and imports the effects on its
+    own, concurrent requests for the same preview share one render. A worker
+    that dies takes its pool down, the next preview starts a new one.
+
+    Args:
+        cache (PreviewCache): Where to keep the previews, None to render every time
+        workers (int): Number of worker processes
+    """
+
+    def __init__(self, cache: PreviewCache = None, workers: int = 1):
+        self.cache = cache
+        self.workers = workers
+        self.executor = None
+        self.pending = {}
+        self.lock = threading.Lock()
+        # The lib modules can't change under a running server
+        self.code = code_version()
+
+    def render(
+        self,
+        name: str,
+        source: str,
+        args: dict,
+        leds: int,
+        seconds: float,
+        fps: float,
+        image_format: str,
+        scale: int,
+    ):
+        """
+        Blocks until the preview is rendered, or read from the cache.
+
+        Args:
+            name (str): Name of the effect
+            source (str): Hash of the effect's source (EffectRegistry.get_source_hash)
+            args (dict): Validated arguments for the effect
+            leds (int): Number of LEDs to render
+            seconds (float): Length of the preview
+            fps (float): Frames per second
+            image_format (str): One of FORMATS
+            scale (int): Pixels per LED of animated formats
+
+        Returns:
+            bytes: The encoded preview
+
+        Raises:
+            KeyError: The effect doesn't exist (anymore)
+            ImportError: Pillow is needed for animated formats
+            TypeError, ValueError: The effect rejected its arguments
+            ConnectionError: The worker crashed while rendering
+        """
+        params = {
+            "name": name,
+            "source": source,
+            "args": args,
+            "leds": leds,
+            "seconds": seconds,
+            "fps": fps,
+            "image_format": image_format,
+            "scale": scale if image_format != "png" else 1,
+            "version": PREVIEW_VERSION,
+        }
+        key = hashlib.sha256(
+            json.dumps(dict(params, code=self.code), sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+        if self.cache is not None:
+            data = self.cache.get(key, image_format)
+            if data is not None:
+                return data
+
+        with self.lock:
+            rendering = key not in self.pending
+            if rendering:
+                try:
+                    future = self._executor().submit(render_preview, **params)
+                except concurrent.futures.process.BrokenProcessPool:
+                    # A worker died while idle (killed, ...)
+                    self._discard(self.executor)
+                    future = self._executor().submit(render_preview, **params)
+                self.pending[key] = (future, self.executor)
+            future, executor = self.pending[key]
+
+        try:
+            data = future.result()
+            if rendering and self.cache is not None:
+                self.cache.put(key, image_format, data)
+        except concurrent.futures.process.BrokenProcessPool:
+            # The worker died rendering (out of memory, ...), the next
+            # preview gets a new pool
+            with self.lock:
+                self._discard(executor)
+            raise ConnectionError("Preview worker crashed, try again")
+        finally:
+            if rendering:
+                with self.lock:
+                    del self.pending[key]
+        return data
+
+    def _executor(self):
+        # Called with the lock held
+        if self.executor is None:
+            # Spawned, forking would copy the render engine's threads and locks
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self.executor
+
+    def _discard(self, executor):
+        # Called with the lock held, once per broken pool
+        if executor is not None and self.executor is executor:
+            self.executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
@@ -0,0 +1,369 @@
+"""
+Realtime pixel ingest over UDP, for sequencers such as xLights or Hyperion.
+
+Supports DDP (Distributed Display Protocol) and E1.31 (sACN, unicast or
+multicast). Pixel data is copied from the datagrams into an ingest buffer as
+it arrives and handed to the render engine as a whole frame when the sender
+pushes it, pre-empting the running presets until the stream times out.
+
+Run as a module it is a minimal sender, to test the listeners without a
+sequencer:
+
+    python -m lib.realtime --protocol ddp --host 127.0.0.1 --count 60
+"""
+
+import argparse
+import asyncio
+import colorsys
+import logging
+import socket
+import struct
+import sys
+import threading
+import time
+import uuid
+
+from lib import metrics
+
+logger = logging.getLogger(__name__)
+
+DDP_PORT = 4048
+E131_PORT = 5568
+
+# DDP header: flags, sequence, data type, destination id, offset, length
+DDP_HEADER = struct.Struct(">BBBBIH")
+DDP_VERSION_MASK = 0xC0
+DDP_VERSION_1 = 0x40
+DDP_TIMECODE = 0x10
+DDP_QUERY = 0x02
+DDP_PUSH = 0x01
+DDP_DISPLAY = 1
+DDP_ALL = 255
+# RGB, 8 bits per channel
+DDP_RGB8 = 0x0B
+# Pixel bytes per DDP packet, a multiple of 3 that fits an Ethernet frame
+DDP_MAX_DATA = 1440
+
+E131_ACN_ID = b"ASC-E1.17\x00\x00\x00"
+E131_ROOT_DATA = 0x00000004
+E131_ROOT_EXTENDED = 0x00000008
+E131_FRAMING_SYNC = 0x00000001
+E131_PREVIEW = 0x80
+E131_TERMINATED = 0x40
+E131_VECTOR = struct.Struct(">I")
+E131_UINT16 = struct.Struct(">H")
+# Offsets of the fields used in data and sync packets
+E131_ROOT_VECTOR = 18
+E131_FRAMING_VECTOR = 40
+E131_SYNC_ADDRESS = 109
+E131_OPTIONS = 112
+E131_UNIVERSE = 113
+E131_PROPERTY_COUNT = 123
+E131_START_CODE = 125
+E131_DATA = 126
+E131_SYNC_SIZE = 49
+E131_FRAMING_DATA = 0x00000002
+E131_DMP_SET_PROPERTY = 0x02
+E131_PRIORITY = 100
+# Channels used per universe, 170 RGB pixels
+E131_CHANNELS = 510
+
+
+class RealtimeReceiver(object):
+    """
+    Assembles frames from packets and hands them to the render engine.
+    """
+
+    def __init__(self, engine, count: int, timeout: float):
+        self.engine = engine
+        self.timeout = timeout
+        self.buffer = bytearray(count * 3)
+        self.view = memoryview(self.buffer)
+
+    def write(self, offset: int, data: memoryview):
+        """
+        Copy RGB bytes into the frame at byte `offset`, clipped to the strip.
+        """
+        end = min(offset + len(data), len(self.buffer))
+        if offset < end:
+            self.view[offset:end] = data[: end - offset]
+
+    def push(self):
+        metrics.REALTIME_FRAMES.inc()
+        self.engine.show_frame(bytes(self.buffer), self.timeout)
+
+    def terminate(self):
+        self.engine.end_realtime()
+
+
+class DDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, receiver: RealtimeReceiver):
+        self.receiver = receiver
+
+    def datagram_received(self, data: bytes, addr):
+        if len(data) < DDP_HEADER.size:
+            return
+
+        flags, _, _, destination, offset, length = DDP_HEADER.unpack_from(data)
+        if flags & DDP_VERSION_MASK != DDP_VERSION_1 or flags & DDP_QUERY:
+            return
+        if destination not in (DDP_DISPLAY, DDP_ALL):
+            return
+
+        metrics.REALTIME_PACKETS.labels("ddp").inc()
+        start = DDP_HEADER.size + (4 if flags & DDP_TIMECODE else 0)
+        self.receiver.write(offset, memoryview(data)[start : start + length])
+        if flags & DDP_PUSH:
+            self.receiver.push()
+
+
+class E131Protocol(asyncio.DatagramProtocol):
+    """
+    E1.31 universes `universe` onwards map to consecutive ranges of 170 pixels.
+
+    A frame is pushed on a sync packet when the sender synchronizes its
+    universes, otherwise when the strip's last universe arrives or a universe
+    repeats before it.
+    """
+
+    def __init__(self, receiver: RealtimeReceiver, universe: int, universes: int):
+        self.receiver = receiver
+        self.first = universe
+        self.last = universe + universes - 1
+        self.received = set()
+
+    def datagram_received(self, data: bytes, addr):
+        if len(data) < E131_SYNC_SIZE or data[4:16] != E131_ACN_ID:
+            return
+
+        vector = E131_VECTOR.unpack_from(data, E131_ROOT_VECTOR)[0]
+        if vector == E131_ROOT_EXTENDED:
+            framing = E131_VECTOR.unpack_from(data, E131_FRAMING_VECTOR)[0]
+            if framing == E131_FRAMING_SYNC:
+                metrics.REALTIME_PACKETS.labels("e131").inc()
+                self.received.clear()
+                self.receiver.push()
+            return
+        if vector != E131_ROOT_DATA or len(data) < E131_DATA:
+            return
+
+        options = data[E131_OPTIONS]
+        universe = E131_UINT16.unpack_from(data, E131_UNIVERSE)[0]
+        if options & E131_PREVIEW or data[E131_START_CODE] != 0:
+            return
+        if options & E131_TERMINATED:
+            self.received.clear()
+            self.receiver.terminate()
+            return
+        if not self.first <= universe <= self.last:
+            return
+
+        metrics.REALTIME_PACKETS.labels("e131").inc()
+        synchronized = E131_UINT16.unpack_from(data, E131_SYNC_ADDRESS)[0] != 0
+        if not synchronized and universe in self.received:
+            # A new frame started before the previous one was complete
+            self.received.clear()
+            self.receiver.push()
+
+        # The property values are the start code and the channels
+        channels = E131_UINT16.unpack_from(data, E131_PROPERTY_COUNT)[0] - 1
+        length = min(channels, E131_CHANNELS)
+        self.receiver.write(
+            (universe - self.first) * E131_CHANNELS,
+            memoryview(data)[E131_DATA : E131_DATA + length],
+        )
+
+        self.received.add(universe)
+        if not synchronized and universe == self.last:
+            self.received.clear()
+            self.receiver.push()
+
+
+def _e131_socket(port: int, universes: range):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", port))
+    for universe in universes:
+        group = socket.inet_aton(f"239.255.{universe >> 8}.{universe & 0xFF}")
+        try:
+            sock.setsockopt(
+                socket.IPPROTO_IP,
+                socket.IP_ADD_MEMBERSHIP,
+                group + socket.inet_aton("0.0.0.0"),
+            )
+        except OSError as e:
+            logger.warning("Can't join the sACN multicast group of %d: %s", universe, e)
+            break
+    return sock
+
+
+class RealtimeServer(threading.Thread):
+    """
+    Listens for DDP and E1.31 on its own asyncio loop, next to the render
+    engine it feeds (in the API process or the hardware owner process).
+    """
+
+    def __init__(
+        self,
+        engine,
+        ddp_port: int = DDP_PORT,
+        e131_port: int = E131_PORT,
+        universe: int = 1,
+        timeout: float = 2.5,
+    ):
+        super().__init__(name="realtime-ingest", daemon=True)
+        self.engine = engine
+        self.ddp_port = ddp_port
+        self.e131_port = e131_port
+        self.universe = universe
+        self.timeout = timeout
+        self.loop = None
+        self.transports = []
+        self.ready = threading.Event()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._listen())
+            self.ready.set()
+            self.loop.run_forever()
+        finally:
+            self.ready.set()
+            self.loop.close()
+
+    async def _listen(self):
+        count = self.engine.led.count
+        receiver = RealtimeReceiver(self.engine, count, self.timeout)
+        universes = -(-count * 3 // E131_CHANNELS)
+
+        if self.ddp_port:
+            try:
+                transport, _ = await self.loop.create_datagram_endpoint(
+                    lambda: DDPProtocol(receiver), local_addr=("0.0.0.0", self.ddp_port)
+                )
+                self.transports.append(transport)
+                logger.info("Listening for DDP on port %d", self.ddp_port)
+            except OSError as e:
+                logger.error("Can't listen for DDP on port %d: %s", self.ddp_port, e)
+
+        if self.e131_port:
+            universe_range = range(self.universe, self.universe + universes)
+            try:
+                sock = _e131_socket(self.e131_port, universe_range)
+                transport, _ = await self.loop.create_datagram_endpoint(
+                    lambda: E131Protocol(receiver, self.universe, universes), sock=sock
+                )
+                self.transports.append(transport)
+                logger.info(
+                    "Listening for E1.31 universes %d-%d on port %d",
+                    universe_range.start,
+                    universe_range.stop - 1,
+                    self.e131_port,
+                )
+            except OSError as e:
+                logger.error("Can't listen for E1.31 on port %d: %s", self.e131_port, e)
+
+    def _stop(self):
+        for transport in self.transports:
+            transport.close()
+        self.loop.stop()
+
+    def close(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._stop)
+        self.join(timeout=1.0)
+
+
+def ddp_packets(frame: bytes, sequence: int):
+    """
+    Split an RGB frame into DDP packets, the last one pushes it.
+    """
+    packets = []
+    for offset in range(0, len(frame), DDP_MAX_DATA):
+        data = frame[offset : offset + DDP_MAX_DATA]
+        flags = DDP_VERSION_1
+        if offset + DDP_MAX_DATA >= len(frame):
+            flags |= DDP_PUSH
+        header = DDP_HEADER.pack(
+            flags, sequence & 0x0F, DDP_RGB8, DDP_DISPLAY, offset, len(data)
+        )
+        packets.append(header + data)
+    return packets
+
+
+def e131_packets(frame: bytes, universe: int, sequence: int, cid: bytes):
+    """
+    Split an RGB frame into E1.31 data packets, one per universe from `universe` on.
+    """
+    packets = []
+    for index, offset in enumerate(range(0, len(frame), E131_CHANNELS)):
+        data = frame[offset : offset + E131_CHANNELS]
+        size = E131_DATA + len(data)
+        packet = bytearray(size)
+        struct.pack_into(">HH", packet, 0, 0x0010, 0)
+        packet[4:16] = E131_ACN_ID
+        struct.pack_into(">H", packet, 16, 0x7000 | (size - 16))
+        E131_VECTOR.pack_into(packet, E131_ROOT_VECTOR, E131_ROOT_DATA)
+        packet[22:38] = cid
+        struct.pack_into(">H", packet, 38, 0x7000 | (size - 38))
+        E131_VECTOR.pack_into(packet, E131_FRAMING_VECTOR, E131_FRAMING_DATA)
+        packet[44:56] = b"lib.realtime"
+        packet[108] = E131_PRIORITY
+        packet[111] = sequence & 0xFF
+        E131_UINT16.pack_into(packet, E131_UNIVERSE, universe + index)
+        struct.pack_into(">H", packet, 115, 0x7000 | (size - 115))
+        struct.pack_into(
+            ">BBHHH", packet, 117, E131_DMP_SET_PROPERTY, 0xA1, 0, 1, len(data) + 1
+        )
+        packet[E131_DATA:] = data
+        packets.append(bytes(packet))
+    return packets
+
+
+def test_pattern(count: int, t: float):
+    """
+    A rainbow scrolling along `count` pixels, one turn every 5 seconds.
+    """
+    frame = bytearray()
+    for i in range(count):
+        r, g, b = colorsys.hsv_to_rgb((i / count + t / 5.0) % 1.0, 1.0, 1.0)
+        frame += bytes((int(r * 255), int(g * 255), int(b * 255)))
+    return bytes(frame)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m lib.realtime",
+        description="Stream a test pattern to a DDP or E1.31 listener",
+    )
+    parser.add_argument("--protocol", choices=("ddp", "e131"), default="ddp")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to send to")
+    parser.add_argument("--port", type=int, help="Defaults to the protocol's port")
+    parser.add_argument("--universe", type=int, default=1, help="First E1.31 universe")
+    parser.add_argument("--count", type=int, default=60, help="Number of pixels")
+    parser.add_argument("--fps", type=float, default=30.0, help="Frames per second")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Stream length")
+    args = parser.parse_args(argv)
+
+    port = args.port or (DDP_PORT if args.protocol == "ddp" else E131_PORT)
+    cid = uuid.uuid4().bytes
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    start = time.monotonic()
+    frames = int(args.seconds * args.fps)
+    for sequence in range(frames):
+        frame = test_pattern(args.count, sequence / args.fps)
+        if args.protocol == "ddp":
+            packets = ddp_packets(frame, sequence + 1)
+        else:
+            packets = e131_packets(frame, args.universe, sequence, cid)
+        for packet in packets:
+            sock.sendto(packet, (args.host, port))
+        time.sleep(max(start + (sequence + 1) / args.fps - time.monotonic(), 0.0))
+
+    print(f"Sent {frames} frames to {args.host}:{port}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
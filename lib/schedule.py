@@ -0,0 +1,467 @@
+"""
+Playlists and time of day rules for unattended preset rotation.
+
+A single Scheduler thread keeps every pending change, the next step of each
+playing playlist and the next run of each rule, in one heap ordered by
+deadline and sleeps until the earliest one, however many playlists and rules
+there are. Changes only enqueue commands to the render engine, transitions
+never block the scheduler.
+
+Deadlines are on the monotonic clock, so playlist entries last their duration
+whatever happens to the wall clock. Rules match wall clock times: their
+deadlines are computed from it, and again whenever it is stepped.
+"""
+
+import datetime
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Longest sleep between deadline checks, so a wall clock step (NTP syncing
+# after boot on a Pi without RTC) is noticed within this many seconds
+MAX_WAIT = 30.0
+
+# Seconds the wall clock has to move against the monotonic clock to count as
+# stepped, smaller corrections are left to the next run of each rule
+CLOCK_STEP = 2.0
+
+
+class CronRule(object):
+    """
+    A cron expression, "minute hour day month weekday" (0 or 7 is Sunday) with
+    "*", lists, ranges and steps, or "HH:MM" for every day at that time.
+
+    Like cron, a restricted day and weekday match either one.
+    """
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        match = re.fullmatch(r"(\d{1,2}):(\d{2})", self.expression)
+        if match:
+            fields = [str(int(match[2])), str(int(match[1])), "*", "*", "*"]
+        else:
+            fields = self.expression.split()
+        if len(fields) != 5:
+            raise ValueError(
+                f"Invalid schedule {expression}, expected 5 cron fields or HH:MM"
+            )
+
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(field, low, high)
+            for field, (low, high) in zip(fields, self.FIELDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+        # Rejects dates that never come, e.g. "0 0 30 2 *"
+        self.next_after(datetime.datetime.now())
+
+    def _parse(self, field: str, low: int, high: int):
+        values = set()
+        for part in field.split(","):
+            spec, slash, step = part.partition("/")
+            try:
+                step = int(step) if slash else 1
+                if spec == "*":
+                    start, end = low, high
+                elif "-" in spec:
+                    start, end = (int(value) for value in spec.split("-", 1))
+                else:
+                    start = int(spec)
+                    end = high if slash else start
+            except ValueError:
+                raise ValueError(f"Invalid cron field {field}")
+
+            if step < 1 or not low <= start <= end <= high:
+                raise ValueError(f"Cron field {field} must be within {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, date: datetime.datetime):
+        day = date.day in self.days
+        weekday = (date.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, after: datetime.datetime):
+        """
+        Returns:
+            datetime: The first matching minute after `after` (local time)
+        """
+        t = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        # Every date comes around within 4 years (Feb 29)
+        limit = t + datetime.timedelta(days=4 * 366)
+        while t < limit:
+            if t.month not in self.months:
+                t = t.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)
+                t = t.replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + datetime.timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += datetime.timedelta(minutes=1)
+            else:
+                return t
+
+        raise ValueError(f"Schedule {self.expression} never matches")
+
+
+class Scheduler(threading.Thread):
+    """
+    Plays playlists and runs rules through a Controller.
+
+    Playlists are {"entries": [...], "loop": bool}, each entry a preset with
+    its "args", a "duration" in seconds and an optional "transition" and
+    "easing". Rules are {"when": cron expression, ...} with one action: a
+    "playlist" to play, a "preset" (and "args") to start or "stop".
+
+    Args:
+        start (callable): start(preset, args, transition, easing, segment)
+        stop (callable): stop(transition, easing, segment)
+        changed (callable): Called after the playlists, rules or playback changed
+    """
+
+    def __init__(self, start, stop, changed=None):
+        super().__init__(name="scheduler", daemon=True)
+        self.start_preset = start
+        self.stop_preset = stop
+        self.changed = changed or (lambda: None)
+
+        self.condition = threading.Condition()
+        self.running = True
+        # Set under the condition, changed() is called once it's released: it
+        # saves the state, which takes the store's lock and reads state() back
+        self.dirty = False
+        self.playlists = {}
+        self.rules = {}
+        self.crons = {}
+        # Rule name: wall clock time of its next run
+        self.runs = {}
+        # Segment name: {"playlist": name, "index": entry}
+        self.playing = {}
+
+        # Heap of (deadline, sequence, key) and the live timer of each key,
+        # heap entries of replaced or cancelled timers are skipped
+        self.heap = []
+        self.timers = {}
+        self.sequence = itertools.count()
+        self.clock_offset = time.time() - time.monotonic()
+
+    def _set_timer(self, key: tuple, deadline: float):
+        sequence = next(self.sequence)
+        self.timers[key] = (deadline, sequence)
+        heapq.heappush(self.heap, (deadline, sequence, key))
+        self.condition.notify()
+
+    def _cancel_timer(self, key: tuple):
+        self.timers.pop(key, None)
+
+    def _pop_due(self, now: float):
+        while self.heap:
+            deadline, sequence, key = self.heap[0]
+            if self.timers.get(key) != (deadline, sequence):
+                heapq.heappop(self.heap)
+            elif deadline <= now:
+                heapq.heappop(self.heap)
+                del self.timers[key]
+                return key
+            else:
+                return None
+        return None
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+
+                self._check_clock()
+                now = time.monotonic()
+                key = self._pop_due(now)
+                if key is None:
+                    timeout = self.heap[0][0] - now if self.heap else MAX_WAIT
+                    self.condition.wait(min(timeout, MAX_WAIT))
+                    continue
+
+                kind, name = key
+                try:
+                    if kind == "playlist":
+                        self._advance(name)
+                    else:
+                        self._run_rule(name)
+                except Exception:
+                    logger.exception("Scheduled %s %s failed", kind, name)
+
+            self._notify_changed()
+
+    def _notify_changed(self):
+        with self.condition:
+            dirty, self.dirty = self.dirty, False
+        if dirty:
+            self.changed()
+
+    def _play_entry(self, segment: str):
+        """
+        Start the current entry of the playlist playing on `segment`, skipping
+        entries that can't be started.
+        """
+        playing = self.playing[segment]
+        entries = self.playlists[playing["playlist"]]["entries"]
+        for _ in entries:
+            entry = entries[playing["index"]]
+            try:
+                self.start_preset(
+                    entry["preset"],
+                    entry.get("args"),
+                    entry.get("transition"),
+                    entry.get("easing"),
+                    segment,
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(
+                    "Skipping %s in playlist %s: %s",
+                    entry["preset"],
+                    playing["playlist"],
+                    e,
+                )
+                if not self._next_index(segment):
+                    return
+                continue
+
+            self._set_timer(("playlist", segment), time.monotonic() + entry["duration"])
+            return
+
+        logger.warning("Nothing in playlist %s can be played", playing["playlist"])
+        self.release(segment)
+
+    def _next_index(self, segment: str):
+        """
+        Returns:
+            bool: Whether the playlist moved on, False when it ended
+        """
+        playing = self.playing[segment]
+        playlist = self.playlists[playing["playlist"]]
+        index = playing["index"] + 1
+        if index >= len(playlist["entries"]):
+            if not playlist.get("loop", True):
+                logger.info("Playlist %s ended", playing["playlist"])
+                self.release(segment)
+                return False
+            index = 0
+
+        playing["index"] = index
+        return True
+
+    def _advance(self, segment: str):
+        if segment in self.playing and self._next_index(segment):
+            self._play_entry(segment)
+        self.dirty = True
+
+    def _run_rule(self, name: str):
+        rule = self.rules[name]
+        # From the minute it was due, the monotonic deadline may come a hair early
+        self._set_timer(("rule", name), self._next_run(name, self.runs[name]))
+
+        logger.info("Running scheduled rule %s", name)
+        segment = rule.get("segment")
+        if rule.get("playlist"):
+            self._play(rule["playlist"], segment)
+        elif rule.get("preset"):
+            self.release(segment)
+            self.start_preset(
+                rule["preset"],
+                rule.get("args"),
+                rule.get("transition"),
+                rule.get("easing"),
+                segment,
+            )
+        elif rule.get("stop"):
+            self.release(segment)
+            self.stop_preset(rule.get("transition"), rule.get("easing"), segment)
+        self.dirty = True
+
+    def _next_run(self, name: str, after: datetime.datetime = None):
+        # Matched in wall clock time, returned as a monotonic deadline
+        now = datetime.datetime.now()
+        run = self.crons[name].next_after(max(now, after) if after else now)
+        self.runs[name] = run
+        return time.monotonic() + run.timestamp() - now.timestamp()
+
+    def _check_clock(self):
+        offset = time.time() - time.monotonic()
+        if abs(offset - self.clock_offset) < CLOCK_STEP:
+            return
+
+        logger.info(
+            "Wall clock moved by %+.0f s, rescheduling the rules",
+            offset - self.clock_offset,
+        )
+        self.clock_offset = offset
+        # Missed runs are skipped rather than all fired at once
+        for name in self.rules:
+            self._set_timer(("rule", name), self._next_run(name))
+
+    def set_playlist(self, name: str, playlist: dict):
+        """
+        Create or replace a playlist. Segments playing it move on to the new
+        entries when their current one ends.
+
+        Raises:
+            ValueError: The playlist has no entries
+        """
+        if not playlist.get("entries"):
+            raise ValueError(f"Playlist {name} has no entries")
+
+        with self.condition:
+            self.playlists[name] = playlist
+            for playing in self.playing.values():
+                if playing["playlist"] == name:
+                    playing["index"] = min(
+                        playing["index"], len(playlist["entries"]) - 1
+                    )
+            self.dirty = True
+        self._notify_changed()
+
+    def remove_playlist(self, name: str):
+        """
+        Raises:
+            KeyError: The playlist doesn't exist
+        """
+        with self.condition:
+            del self.playlists[name]
+            for segment, playing in list(self.playing.items()):
+                if playing["playlist"] == name:
+                    self.release(segment)
+            self.dirty = True
+        self._notify_changed()
+
+    def play(self, name: str, segment: str, index: int = 0):
+        """
+        Play a playlist on a segment from entry `index`.
+
+        Raises:
+            KeyError: The playlist doesn't exist
+        """
+        with self.condition:
+            self._play(name, segment, index)
+            self.dirty = True
+        self._notify_changed()
+
+    def _play(self, name: str, segment: str, index: int = 0):
+        entries = self.playlists[name]["entries"]
+        self.playing[segment] = {"playlist": name, "index": index % len(entries)}
+        self._play_entry(segment)
+
+    def release(self, segment: str = None):
+        """
+        Stop advancing the playlist on a segment (all of them by default),
+        leaving its current preset running.
+        """
+        with self.condition:
+            segments = list(self.playing) if segment is None else [segment]
+            for name in segments:
+                if self.playing.pop(name, None) is not None:
+                    self._cancel_timer(("playlist", name))
+
+    def set_rule(self, name: str, rule: dict):
+        """
+        Create or replace a rule.
+
+        Raises:
+            ValueError: Invalid cron expression
+        """
+        cron = CronRule(rule["when"])
+        with self.condition:
+            self.rules[name] = rule
+            self.crons[name] = cron
+            self._set_timer(("rule", name), self._next_run(name))
+            self.dirty = True
+        self._notify_changed()
+
+    def remove_rule(self, name: str):
+        """
+        Raises:
+            KeyError: The rule doesn't exist
+        """
+        with self.condition:
+            del self.rules[name]
+            del self.crons[name]
+            del self.runs[name]
+            self._cancel_timer(("rule", name))
+            self.dirty = True
+        self._notify_changed()
+
+    def _describe(self, key: tuple, deadline: float):
+        kind, name = key
+        if kind == "rule":
+            when = self.runs[name]
+        else:
+            when = datetime.datetime.fromtimestamp(
+                deadline - time.monotonic() + time.time()
+            )
+        change = {
+            "time": when.isoformat(),
+            "in": round(max(deadline - time.monotonic(), 0.0), 1),
+        }
+        if kind == "rule":
+            return dict(change, rule=name, **self.rules[name])
+
+        playing = self.playing[name]
+        entries = self.playlists[playing["playlist"]]["entries"]
+        index = playing["index"] + 1
+        if index >= len(entries):
+            index = 0 if self.playlists[playing["playlist"]].get("loop", True) else None
+        return dict(
+            change,
+            playlist=playing["playlist"],
+            segment=name,
+            preset=entries[index]["preset"] if index is not None else None,
+        )
+
+    def next_change(self):
+        """
+        Returns:
+            dict: When the next change happens and what it is, None when
+                nothing is scheduled
+        """
+        with self.condition:
+            if not self.timers:
+                return None
+            key, (deadline, _) = min(self.timers.items(), key=lambda item: item[1])
+            return self._describe(key, deadline)
+
+    def state(self):
+        """
+        Returns:
+            dict: The playlists, the rules and the playlist playing on each segment
+        """
+        with self.condition:
+            return {
+                "playlists": {name: dict(p) for name, p in self.playlists.items()},
+                "rules": {name: dict(rule) for name, rule in self.rules.items()},
+                "playing": {name: dict(p) for name, p in self.playing.items()},
+            }
+
+    def next_runs(self):
+        """
+        Returns:
+            dict: The next run of each rule by name, as an ISO 8601 local time
+        """
+        with self.condition:
+            return {name: self.runs[name].isoformat() for name in self.rules}
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.join(timeout=1.0)
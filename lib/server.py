@@ -1,19 +1,144 @@
-from typing import Annotated, List, Dict, Any
-from fastapi import FastAPI, Body, HTTPException, Path
+from typing import Annotated, List, Dict, Any, Literal, Optional
+from fastapi import (
+    FastAPI,
+    Body,
+    HTTPException,
+    Path,
+    Query,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from pydantic import BaseModel, Field, ValidationError
 from pydantic_extra_types.color import Color
-import time
+import asyncio
+import datetime
+import json
+import logging
+import math
+
+from lib import metrics
+from lib.compositor import BLEND_MODES, DEFAULT_BLEND
+from lib.led import LED, EffectBase
+from lib.preview import FORMATS, Previewer
+from lib.stream import FrameEncoder
+from lib.transitions import EASINGS
+
+Easing = Literal[tuple(EASINGS)]
+Blend = Literal[tuple(BLEND_MODES)]
+
+logger = logging.getLogger(__name__)
+
+
+def _json_safe(value):
+    # Infinity and NaN are accepted in request bodies but can't be encoded
+    # back into a JSON response, they are echoed as strings
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    return value
+
+
+class PlaylistEntry(BaseModel):
+    preset: str = Field(description="Name of the preset to start")
+    args: Dict[str, Any] = Field({}, description="Arguments for the effect")
+    duration: float = Field(gt=0.0, description="Seconds to play it for")
+    transition: Optional[float] = Field(
+        None, ge=0.0, le=60.0, description="Crossfade duration in seconds"
+    )
+    easing: Optional[Easing] = Field(None, description="Crossfade easing curve")
 
 
 class LightWave(FastAPI):
-    def __init__(self, led, effect_registry):
+    def __init__(
+        self,
+        control,
+        effect_registry,
+        hot_reload: bool = False,
+        previewer: Previewer = None,
+    ):
+        """
+        Args:
+            control: lib.control.Controller, or lib.owner.RemoteController when
+                a separate process owns the hardware
+            effect_registry (EffectRegistry): Effects to list and describe
+            hot_reload (bool): Watch the effects folder for changes
+            previewer (Previewer): Renders effect previews, defaults to one without cache
+        """
         super().__init__()
-        self.led = led
+        self.control = control
         self.effect_registry = effect_registry
+        self.hot_reload = hot_reload
+        self.previewer = previewer or Previewer()
+
+        @self.exception_handler(ConnectionError)
+        async def engine_unavailable(request, exc):
+            return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+        @self.exception_handler(RequestValidationError)
+        async def invalid_request(request, exc):
+            return JSONResponse(
+                status_code=422,
+                content={"detail": _json_safe(jsonable_encoder(exc.errors()))},
+            )
 
-        self.running = None
+        def validate_args(preset_name: str, args: dict, loc: tuple = ("body", "args")):
+            # Checked against the effect's compiled model before anything
+            # starts, errors are reported like any other invalid field (422)
+            try:
+                return self.effect_registry.validate_config(preset_name, args)
+            except ValidationError as e:
+                raise RequestValidationError(
+                    [
+                        dict(error, loc=(*loc, *error["loc"]))
+                        for error in e.errors(include_url=False, include_context=False)
+                    ]
+                )
+
+        def openapi():
+            """
+            The OpenAPI schema, with the args of the presets described by their
+            compiled models. Rebuilt when the effects change.
+            """
+            models = self.effect_registry.models
+            if self.openapi_schema is not None and self.openapi_models is models:
+                return self.openapi_schema
+
+            self.openapi_schema = None
+            schema = FastAPI.openapi(self)
+            components = schema.setdefault("components", {}).setdefault("schemas", {})
+
+            # Every "args" body field accepts the arguments of any preset
+            for component in components.values():
+                args = component.get("properties", {}).get("args")
+                if args is not None and args.get("type") == "object":
+                    args.pop("type")
+                    args.pop("additionalProperties", None)
+                    args["anyOf"] = [
+                        {"$ref": f"#/components/schemas/{model.__name__}"}
+                        for model in models.values()
+                    ]
+
+            for model in models.values():
+                model_schema = model.model_json_schema(
+                    ref_template="#/components/schemas/{model}"
+                )
+                components.update(model_schema.pop("$defs", {}))
+                components[model.__name__] = model_schema
+
+            self.openapi_models = models
+            return self.openapi_schema
+
+        self.openapi_models = None
+        self.openapi = openapi
 
         @self.get("/presets")
-        def show_presets():
+        async def show_presets():
             """
             Get a list of all available presets
 
@@ -31,29 +156,43 @@ class LightWave(FastAPI):
             }
 
         @self.get("/presets/running")
-        def get_running_preset():
+        async def get_running_preset(
+            segment: Annotated[
+                str, Query(description="Segment to get the running preset of")
+            ] = LED.ALL,
+        ):
             """
             Get information about the currently running preset
 
+            Args:
+                segment (str): Segment to get the running preset of, defaults to the whole strip
+
             Returns:
                 dict: A json object containing information about the currently running preset
             """
-            if not self.running:
+            state = await asyncio.to_thread(self.control.state)
+            running = state["effects"].get(segment)
+            if not running:
                 raise HTTPException(status_code=404, detail="No preset running")
 
+            start_time = datetime.datetime.fromisoformat(running["start_time"])
             return {
-                "name": self.running.__class__.__name__,
-                "description": self.effect_registry.get_description(
-                    self.running.__class__.__name__,
+                "name": running["name"],
+                "description": (
+                    self.effect_registry.get_description(running["name"])
+                    if self.effect_registry.is_effect(running["name"])
+                    else None
                 ),
-                "start_time": self.running.start_time.isoformat(),
-                "duration": (
-                    self.running.start_time.now() - self.running.start_time
-                ).seconds,
+                "start_time": running["start_time"],
+                "duration": (datetime.datetime.now() - start_time).seconds,
+                "target_fps": running["target_fps"],
+                "frames_rendered": running["frames_rendered"],
+                "frames_dropped": running["frames_dropped"],
+                "fps": round(running["fps"], 2),
             }
 
         @self.get("/presets/{preset_name}")
-        def get_preset_info(
+        async def get_preset_info(
             preset_name: Annotated[
                 str, Path(description="Name of the preset to get info about")
             ],
@@ -75,21 +214,138 @@ class LightWave(FastAPI):
                 "args": self.effect_registry.get_config_schema(preset_name),
             }
 
+        @self.get(
+            "/presets/{preset_name}/preview",
+            response_class=Response,
+            responses={200: {"content": {media: {} for media in FORMATS.values()}}},
+        )
+        async def get_preset_preview(
+            preset_name: Annotated[
+                str, Path(description="Name of the preset to preview")
+            ],
+            args: Annotated[
+                Optional[str],
+                Query(description="Arguments for the effect, as a JSON object"),
+            ] = None,
+            leds: Annotated[
+                int, Query(ge=1, le=1000, description="Number of LEDs to render")
+            ] = 60,
+            seconds: Annotated[
+                float, Query(gt=0.0, le=30.0, description="Length of the preview")
+            ] = 3.0,
+            fps: Annotated[
+                float, Query(gt=0.0, le=50.0, description="Frames per second")
+            ] = 25.0,
+            image_format: Annotated[
+                Literal[tuple(FORMATS)],
+                Query(
+                    alias="format",
+                    description="Animated webp or gif, or a png with one row per frame",
+                ),
+            ] = "webp",
+            scale: Annotated[
+                int, Query(ge=1, le=16, description="Pixels per LED of animations")
+            ] = 4,
+        ):
+            """
+            Render a preset headless, faster than real time, into an image.
+            Previews are cached, the same request again costs a file read
+
+            Args:
+                preset_name (str): Name of the preset to preview
+                args (str): Arguments for the effect, as a JSON object
+                leds (int): Number of LEDs to render
+                seconds (float): Length of the preview in seconds
+                fps (float): Frames per second
+                format (str): Animated webp or gif, or a png with one row per frame
+                scale (int): Size in pixels of each LED of webp and gif previews
+
+            Returns:
+                bytes: The image
+            """
+            if not self.effect_registry.is_effect(preset_name):
+                raise HTTPException(status_code=404, detail="Preset not found")
+
+            try:
+                parsed = json.loads(args) if args else {}
+            except ValueError:
+                parsed = None
+            if not isinstance(parsed, dict):
+                raise RequestValidationError(
+                    [
+                        {
+                            "type": "json_invalid",
+                            "loc": ("query", "args"),
+                            "msg": "Input should be a JSON object",
+                            "input": args,
+                        }
+                    ]
+                )
+
+            try:
+                data = await asyncio.to_thread(
+                    self.previewer.render,
+                    preset_name,
+                    self.effect_registry.get_source_hash(preset_name),
+                    validate_args(preset_name, parsed, ("query", "args")),
+                    leds,
+                    seconds,
+                    fps,
+                    image_format,
+                    scale,
+                )
+            except KeyError:
+                raise HTTPException(status_code=404, detail="Preset not found")
+            except ImportError:
+                raise HTTPException(
+                    status_code=501,
+                    detail="Animated previews need Pillow, format=png works without it",
+                )
+            except ConnectionError as e:
+                # The worker crashed, the next request gets a new one
+                raise HTTPException(status_code=503, detail=str(e))
+            except (TypeError, ValueError) as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            return Response(content=data, media_type=FORMATS[image_format])
+
         @self.post("/presets/start")
-        def start_preset(
+        async def start_preset(
             preset_name: Annotated[
                 str, Body(description="Name of the preset to start")
             ],
             args: Annotated[
                 Dict[str, Any], Body(description="Arguments for the effect")
             ] = None,
+            target_fps: Annotated[
+                Optional[float],
+                Body(
+                    ge=EffectBase.MIN_TARGET_FPS,
+                    le=EffectBase.MAX_TARGET_FPS,
+                    description="Frame rate override",
+                ),
+            ] = None,
+            transition: Annotated[
+                Optional[float],
+                Body(ge=0.0, le=60.0, description="Crossfade duration in seconds"),
+            ] = None,
+            easing: Annotated[
+                Optional[Easing], Body(description="Crossfade easing curve")
+            ] = None,
+            segment: Annotated[
+                str, Body(description="Segment to run the preset on")
+            ] = LED.ALL,
         ):
             """
-            Start a preset
+            Start a preset, crossfading from whatever is currently shown
 
             Args:
                 preset_name (str): Name of the preset to start
                 args (dict): Arguments to configure the effect
+                target_fps (float): Frame rate to render the effect at, defaults to the effect's own
+                transition (float): Crossfade duration in seconds, defaults to the server setting
+                easing (str): Crossfade easing curve, defaults to the server setting
+                segment (str): Segment to run the preset on, defaults to the whole strip
 
             Returns:
                 Null
@@ -97,47 +353,107 @@ class LightWave(FastAPI):
             if args is None:
                 args = {}
 
-            if self.running:
-                self.running.stop()
-                # Wait for thread to actually stop?
-                # EffectBase.stop() just sets event. run loop finishes.
-                # We should join ideally, or just wait a bit.
-                # But if we fade out immediately, we might contend.
-                # However, fade_out uses lock. running effect uses lock.
-                # They will serialize.
-                # We want effect to STOP writing.
-                self.running.join(timeout=1.0)
-                self.led.fade_out(0.5)
-                self.running = None
-
             if not self.effect_registry.is_effect(preset_name):
                 raise HTTPException(status_code=404, detail="Preset not found")
 
-            # Ensure brightness is reset to full (or default) before starting new effect
-            self.led.set_brightness(1.0)
+            state = await asyncio.to_thread(self.control.state)
+            if segment not in state["segments"]:
+                raise HTTPException(status_code=404, detail="Segment not found")
+
+            args = validate_args(preset_name, args)
+            if target_fps is not None:
+                args = {**args, "target_fps": target_fps}
+
+            try:
+                await asyncio.to_thread(
+                    self.control.start, preset_name, args, transition, easing, segment
+                )
+            except KeyError:
+                raise HTTPException(status_code=404, detail="Preset not found")
+            except (TypeError, ValueError) as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        @self.patch("/presets/running")
+        async def update_running_preset(
+            args: Annotated[
+                Dict[str, Any], Body(description="Arguments to change")
+            ] = None,
+            target_fps: Annotated[
+                Optional[float],
+                Body(
+                    ge=EffectBase.MIN_TARGET_FPS,
+                    le=EffectBase.MAX_TARGET_FPS,
+                    description="Frame rate override",
+                ),
+            ] = None,
+            segment: Annotated[
+                str, Body(description="Segment the preset runs on")
+            ] = LED.ALL,
+        ):
+            """
+            Change arguments of the running preset from its next frame on,
+            without restarting it or fading
+
+            Args:
+                args (dict): Arguments to change, the others keep their value
+                target_fps (float): Frame rate to render the effect at
+                segment (str): Segment the preset runs on, defaults to the whole strip
+
+            Returns:
+                Null
+            """
+            state = await asyncio.to_thread(self.control.state)
+            running = state["effects"].get(segment)
+            if not running:
+                raise HTTPException(status_code=404, detail="No preset running")
+
+            args = validate_args(running["name"], args)
+            if target_fps is not None:
+                args = {**args, "target_fps": target_fps}
 
-            self.running = self.effect_registry.get(preset_name)(self.led, **args)
-            self.running.start()
+            try:
+                await asyncio.to_thread(self.control.update, args, segment)
+            except KeyError:
+                raise HTTPException(status_code=404, detail="No preset running")
+            except (TypeError, ValueError) as e:
+                raise HTTPException(status_code=400, detail=str(e))
 
         @self.post("/presets/stop")
-        def stop_preset():
+        async def stop_preset(
+            transition: Annotated[
+                Optional[float],
+                Body(ge=0.0, le=60.0, description="Fade out duration in seconds"),
+            ] = None,
+            easing: Annotated[
+                Optional[Easing], Body(description="Fade out easing curve")
+            ] = None,
+            segment: Annotated[
+                Optional[str], Body(description="Only stop the preset on this segment")
+            ] = None,
+        ):
             """
-            Stop the currently running preset
+            Stop the currently running presets, fading them out to black
+
+            Args:
+                transition (float): Fade out duration in seconds, defaults to the server setting
+                easing (str): Fade out easing curve, defaults to the server setting
+                segment (str): Only stop the preset on this segment, defaults to all of them
 
             Returns:
                 Null
             """
-            if not self.running:
+            state = await asyncio.to_thread(self.control.state)
+            if segment is None:
+                running = state["effects"] or state["layers"]
+            else:
+                running = segment in state["effects"]
+            if not running:
                 raise HTTPException(status_code=404, detail="No preset running")
 
-            self.running.stop()
-            self.running.join(timeout=1.0)
-            self.led.fade_out(0.5)
-            self.running = None
-            self.led.clear()
+            await asyncio.to_thread(self.control.stop, transition, easing, segment)
 
         @self.post("/leds/color/set")
-        def set_color_rgb(
+        async def set_color_rgb(
             color: Annotated[
                 Color,
                 Body(
@@ -155,13 +471,14 @@ class LightWave(FastAPI):
             Returns:
                 Null
             """
-            if self.running:
+            state = await asyncio.to_thread(self.control.state)
+            if state["effects"] or state["layers"]:
                 raise HTTPException(status_code=400, detail="Preset already running")
 
-            self.led.set_color(color.as_rgb_tuple())
+            await asyncio.to_thread(self.control.set_color, color.as_rgb_tuple())
 
         @self.post("/leds/color/brightness")
-        def set_brightness(
+        async def set_brightness(
             brightness: Annotated[
                 float,
                 Body(
@@ -182,72 +499,732 @@ class LightWave(FastAPI):
             Returns:
                 Null
             """
-            self.led.set_brightness(brightness)
+            await asyncio.to_thread(self.control.set_brightness, brightness)
+
+        @self.post("/leds/color/gamma")
+        async def set_gamma(
+            gamma: Annotated[
+                float,
+                Body(
+                    ...,
+                    gt=0.0,
+                    le=5.0,
+                    embed=True,
+                    description="Gamma exponent, 1.0 is linear and 2.2-2.8 looks natural on ws281x",
+                ),
+            ],
+        ):
+            """
+            Set the gamma correction of the LEDs
+
+            Args:
+                gamma (float): Gamma exponent
+
+            Returns:
+                Null
+            """
+            await asyncio.to_thread(self.control.set_correction, gamma=gamma)
+
+        @self.post("/leds/color/temperature")
+        async def set_temperature(
+            temperature: Annotated[
+                float,
+                Body(
+                    ...,
+                    ge=1000.0,
+                    le=40000.0,
+                    embed=True,
+                    description="White point in Kelvin, 6600 is neutral and lower is warmer",
+                ),
+            ],
+        ):
+            """
+            Set the color temperature (white balance) of the LEDs
+
+            Args:
+                temperature (float): White point in Kelvin
+
+            Returns:
+                Null
+            """
+            await asyncio.to_thread(
+                self.control.set_correction, temperature=temperature
+            )
+
+        @self.get("/leds/color/correction")
+        async def get_correction():
+            """
+            Get the color correction applied to every frame
+
+            Returns:
+                dict: The gamma, color temperature and brightness
+            """
+            state = await asyncio.to_thread(self.control.state)
+            return {
+                "gamma": state["gamma"],
+                "temperature": state["temperature"],
+                "brightness": state["brightness"],
+            }
 
         @self.post("/leds/color/clear")
-        def clear_color():
+        async def clear_color():
             """
             Clear the color of the LEDs
 
             Returns:
                 Null
             """
-            if self.running:
+            state = await asyncio.to_thread(self.control.state)
+            if state["effects"] or state["layers"]:
                 raise HTTPException(status_code=400, detail="Preset already running")
 
-            self.led.clear()
+            await asyncio.to_thread(self.control.clear)
 
         @self.post("/leds/color/red")
-        def set_red():
+        async def set_red():
             """
             Set the color of the LEDs to red
 
             Returns:
                 Null
             """
-            if self.running:
+            state = await asyncio.to_thread(self.control.state)
+            if state["effects"] or state["layers"]:
                 raise HTTPException(status_code=400, detail="Preset already running")
 
-            self.led.set_color((255, 0, 0))
+            await asyncio.to_thread(self.control.set_color, (255, 0, 0))
 
         @self.post("/leds/color/green")
-        def set_green():
+        async def set_green():
             """
             Set the color of the LEDs to green
 
             Returns:
                 Null
             """
-            if self.running:
+            state = await asyncio.to_thread(self.control.state)
+            if state["effects"] or state["layers"]:
                 raise HTTPException(status_code=400, detail="Preset already running")
 
-            self.led.set_color((0, 255, 0))
+            await asyncio.to_thread(self.control.set_color, (0, 255, 0))
 
         @self.post("/leds/color/blue")
-        def set_blue():
+        async def set_blue():
             """
             Set the color of the LEDs to blue
 
             Returns:
                 Null
             """
-            if self.running:
+            state = await asyncio.to_thread(self.control.state)
+            if state["effects"] or state["layers"]:
                 raise HTTPException(status_code=400, detail="Preset already running")
 
-            self.led.set_color((0, 0, 255))
+            await asyncio.to_thread(self.control.set_color, (0, 0, 255))
 
-        @self.on_event("shutdown")
-        def shutdown_event():
+        @self.get("/layers")
+        async def get_layers():
             """
-            Stop the currently running preset and clear the LEDs on shutdown
+            Get the layers stacked over the segment presets
+
+            Returns:
+                dict: A json array of layers, bottom to top
+            """
+            state = await asyncio.to_thread(self.control.state)
+            return {
+                "layers": [
+                    {
+                        "name": name,
+                        "segment": layer["segment"],
+                        "preset": layer["preset"]["name"],
+                        "blend": layer["blend"],
+                        "opacity": layer["opacity"],
+                        "fps": round(layer["preset"]["fps"], 2),
+                    }
+                    for name, layer in state["layers"].items()
+                ]
+            }
+
+        @self.post("/layers")
+        async def add_layer(
+            preset_name: Annotated[
+                str, Body(description="Name of the preset to render in the layer")
+            ],
+            name: Annotated[
+                Optional[str],
+                Body(description="Name of the layer, defaults to the preset name"),
+            ] = None,
+            args: Annotated[
+                Dict[str, Any], Body(description="Arguments for the effect")
+            ] = None,
+            target_fps: Annotated[
+                Optional[float],
+                Body(
+                    ge=EffectBase.MIN_TARGET_FPS,
+                    le=EffectBase.MAX_TARGET_FPS,
+                    description="Frame rate override",
+                ),
+            ] = None,
+            segment: Annotated[
+                str, Body(description="Segment to stack the layer on")
+            ] = LED.ALL,
+            blend: Annotated[Blend, Body(description="Blend mode")] = DEFAULT_BLEND,
+            opacity: Annotated[
+                float, Body(ge=0.0, le=1.0, description="Layer opacity")
+            ] = 1.0,
+            transition: Annotated[
+                Optional[float],
+                Body(ge=0.0, le=60.0, description="Fade in duration in seconds"),
+            ] = None,
+            easing: Annotated[
+                Optional[Easing], Body(description="Fade in easing curve")
+            ] = None,
+        ):
+            """
+            Stack a preset on top of a segment, replacing the layer with the same name
+
+            Args:
+                preset_name (str): Name of the preset to render in the layer
+                name (str): Name of the layer, defaults to the preset name
+                args (dict): Arguments to configure the effect
+                target_fps (float): Frame rate to render the effect at, defaults to the effect's own
+                segment (str): Segment to stack the layer on, defaults to the whole strip
+                blend (str): How the layer is combined with what is below it: add, max, multiply or alpha
+                opacity (float): Layer opacity in float range 0.0 - 1.0
+                transition (float): Fade in duration in seconds, defaults to the server setting
+                easing (str): Fade in easing curve, defaults to the server setting
+
+            Returns:
+                dict: The name of the layer
+            """
+            if args is None:
+                args = {}
+
+            if not self.effect_registry.is_effect(preset_name):
+                raise HTTPException(status_code=404, detail="Preset not found")
+
+            state = await asyncio.to_thread(self.control.state)
+            if segment not in state["segments"]:
+                raise HTTPException(status_code=404, detail="Segment not found")
+
+            args = validate_args(preset_name, args)
+            if target_fps is not None:
+                args = {**args, "target_fps": target_fps}
+
+            name = name or preset_name
+            try:
+                await asyncio.to_thread(
+                    self.control.add_layer,
+                    name,
+                    preset_name,
+                    args,
+                    blend,
+                    opacity,
+                    transition,
+                    easing,
+                    segment,
+                )
+            except KeyError:
+                raise HTTPException(status_code=404, detail="Preset not found")
+            except (TypeError, ValueError) as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            return {"name": name}
+
+        @self.patch("/layers/{layer_name}")
+        async def update_layer(
+            layer_name: Annotated[str, Path(description="Name of the layer")],
+            blend: Annotated[Optional[Blend], Body(description="Blend mode")] = None,
+            opacity: Annotated[
+                Optional[float], Body(ge=0.0, le=1.0, description="Layer opacity")
+            ] = None,
+        ):
+            """
+            Change the blend mode and/or opacity of a layer
+
+            Args:
+                layer_name (str): Name of the layer
+                blend (str): How the layer is combined with what is below it
+                opacity (float): Layer opacity in float range 0.0 - 1.0
 
             Returns:
                 Null
             """
-            if self.running:
-                self.running.stop()
-                self.running.join(timeout=1.0)
-                self.led.fade_out(0.5)
-                self.running = None
+            try:
+                await asyncio.to_thread(
+                    self.control.update_layer, layer_name, blend, opacity
+                )
+            except KeyError:
+                raise HTTPException(status_code=404, detail="Layer not found")
+
+        @self.delete("/layers/{layer_name}")
+        async def remove_layer(
+            layer_name: Annotated[str, Path(description="Name of the layer")],
+            transition: Annotated[
+                Optional[float],
+                Query(ge=0.0, le=60.0, description="Fade out duration in seconds"),
+            ] = None,
+            easing: Annotated[
+                Optional[Easing], Query(description="Fade out easing curve")
+            ] = None,
+        ):
+            """
+            Fade a layer out and remove it
 
-            self.led.clear()
+            Args:
+                layer_name (str): Name of the layer
+                transition (float): Fade out duration in seconds, defaults to the server setting
+                easing (str): Fade out easing curve, defaults to the server setting
+
+            Returns:
+                Null
+            """
+            try:
+                await asyncio.to_thread(
+                    self.control.remove_layer, layer_name, transition, easing
+                )
+            except KeyError:
+                raise HTTPException(status_code=404, detail="Layer not found")
+
+        @self.get("/segments")
+        async def get_segments():
+            """
+            Get the segments of the strip and the preset running on each of them
+
+            Returns:
+                dict: A json array of segments, drawn in this order
+            """
+            state = await asyncio.to_thread(self.control.state)
+            return {
+                "segments": [
+                    {
+                        "name": name,
+                        **segment,
+                        "preset": (state["effects"].get(name) or {}).get("name"),
+                    }
+                    for name, segment in state["segments"].items()
+                ]
+            }
+
+        @self.put("/segments/{segment_name}")
+        async def set_segment(
+            segment_name: Annotated[str, Path(description="Name of the segment")],
+            start: Annotated[int, Body(ge=0, description="First pixel")],
+            length: Annotated[int, Body(gt=0, description="Number of pixels")],
+            reverse: Annotated[
+                bool, Body(description="Run effects from the last pixel backwards")
+            ] = False,
+        ):
+            """
+            Define or redefine a segment, stopping the preset running on it
+
+            Args:
+                segment_name (str): Name of the segment
+                start (int): First pixel of the segment
+                length (int): Number of pixels in the segment
+                reverse (bool): Run effects from the last pixel backwards
+
+            Returns:
+                Null
+            """
+            try:
+                await asyncio.to_thread(
+                    self.control.define_segment, segment_name, start, length, reverse
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        @self.delete("/segments/{segment_name}")
+        async def delete_segment(
+            segment_name: Annotated[str, Path(description="Name of the segment")],
+        ):
+            """
+            Remove a segment, stopping the preset running on it
+
+            Args:
+                segment_name (str): Name of the segment
+
+            Returns:
+                Null
+            """
+            try:
+                await asyncio.to_thread(self.control.remove_segment, segment_name)
+            except KeyError:
+                raise HTTPException(status_code=404, detail="Segment not found")
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        @self.get("/playlists")
+        async def get_playlists():
+            """
+            Get the playlists and the segments playing them
+
+            Returns:
+                dict: A json array of playlists
+            """
+            schedule = await asyncio.to_thread(self.control.schedule)
+            return {
+                "playlists": [
+                    {
+                        "name": name,
+                        **playlist,
+                        "playing": [
+                            segment
+                            for segment, playing in schedule["playing"].items()
+                            if playing["playlist"] == name
+                        ],
+                    }
+                    for name, playlist in schedule["playlists"].items()
+                ]
+            }
+
+        @self.get("/playlists/{playlist_name}")
+        async def get_playlist(
+            playlist_name: Annotated[str, Path(description="Name of the playlist")],
+        ):
+            """
+            Get the entries of a playlist
+
+            Args:
+                playlist_name (str): Name of the playlist
+
+            Returns:
+                dict: The entries and whether the playlist loops
+            """
+            schedule = await asyncio.to_thread(self.control.schedule)
+            playlist = schedule["playlists"].get(playlist_name)
+            if playlist is None:
+                raise HTTPException(status_code=404, detail="Playlist not found")
+            return playlist
+
+        @self.put("/playlists/{playlist_name}")
+        async def set_playlist(
+            playlist_name: Annotated[str, Path(description="Name of the playlist")],
+            entries: Annotated[
+                List[PlaylistEntry],
+                Body(min_length=1, description="Presets to play, in order"),
+            ],
+            loop: Annotated[
+                bool, Body(description="Start over after the last entry")
+            ] = True,
+        ):
+            """
+            Create or replace a playlist
+
+            Args:
+                playlist_name (str): Name of the playlist
+                entries (list): Presets to play in order, each with its args, duration and transition
+                loop (bool): Start over after the last entry, otherwise keep the last one running
+
+            Returns:
+                Null
+            """
+            for i, entry in enumerate(entries):
+                if not self.effect_registry.is_effect(entry.preset):
+                    raise HTTPException(
+                        status_code=404, detail=f"Preset {entry.preset} not found"
+                    )
+                entry.args = validate_args(
+                    entry.preset, entry.args, ("body", "entries", i, "args")
+                )
+
+            await asyncio.to_thread(
+                self.control.set_playlist,
+                playlist_name,
+                [entry.model_dump(exclude_none=True) for entry in entries],
+                loop,
+            )
+
+        @self.delete("/playlists/{playlist_name}")
+        async def delete_playlist(
+            playlist_name: Annotated[str, Path(description="Name of the playlist")],
+        ):
+            """
+            Remove a playlist, segments playing it keep their current preset
+
+            Args:
+                playlist_name (str): Name of the playlist
+
+            Returns:
+                Null
+            """
+            try:
+                await asyncio.to_thread(self.control.remove_playlist, playlist_name)
+            except KeyError:
+                raise HTTPException(status_code=404, detail="Playlist not found")
+
+        @self.post("/playlists/{playlist_name}/play")
+        async def play_playlist(
+            playlist_name: Annotated[str, Path(description="Name of the playlist")],
+            segment: Annotated[
+                str, Body(description="Segment to play the playlist on")
+            ] = LED.ALL,
+            index: Annotated[int, Body(ge=0, description="Entry to start from")] = 0,
+        ):
+            """
+            Play a playlist on a segment until a preset, a color or another
+            playlist is started on it
+
+            Args:
+                playlist_name (str): Name of the playlist
+                segment (str): Segment to play the playlist on, defaults to the whole strip
+                index (int): Entry to start from
+
+            Returns:
+                Null
+            """
+            schedule = await asyncio.to_thread(self.control.schedule)
+            if playlist_name not in schedule["playlists"]:
+                raise HTTPException(status_code=404, detail="Playlist not found")
+            state = await asyncio.to_thread(self.control.state)
+            if segment not in state["segments"]:
+                raise HTTPException(status_code=404, detail="Segment not found")
+
+            await asyncio.to_thread(
+                self.control.play_playlist, playlist_name, segment, index
+            )
+
+        @self.post("/playlists/stop")
+        async def stop_playlist(
+            segment: Annotated[
+                Optional[str],
+                Body(embed=True, description="Only stop the playlist on this segment"),
+            ] = None,
+        ):
+            """
+            Stop advancing playlists, the presets they started keep running
+
+            Args:
+                segment (str): Only stop the playlist on this segment, defaults to all of them
+
+            Returns:
+                Null
+            """
+            await asyncio.to_thread(self.control.stop_playlist, segment)
+
+        @self.get("/schedule")
+        async def get_schedule():
+            """
+            Get the schedule rules and the next scheduled change
+
+            Returns:
+                dict: A json array of rules with their next run, and the next
+                    change (rule or playlist step) with its time
+            """
+            schedule = await asyncio.to_thread(self.control.schedule)
+            return {
+                "rules": [
+                    {"name": name, **rule} for name, rule in schedule["rules"].items()
+                ],
+                "next": schedule["next"],
+            }
+
+        @self.get("/schedule/next")
+        async def get_next_change():
+            """
+            Get the next scheduled change, a rule or the next step of a playlist
+
+            Returns:
+                dict: When it happens and what it does
+            """
+            schedule = await asyncio.to_thread(self.control.schedule)
+            change = schedule["next"]
+            if change is None:
+                raise HTTPException(status_code=404, detail="Nothing scheduled")
+            return change
+
+        @self.put("/schedule/{rule_name}")
+        async def set_rule(
+            rule_name: Annotated[str, Path(description="Name of the rule")],
+            when: Annotated[
+                str,
+                Body(
+                    description='Cron expression ("minute hour day month weekday") or "HH:MM" for every day',
+                    examples=["0 8 * * 1-5", "22:30"],
+                ),
+            ],
+            playlist: Annotated[
+                Optional[str], Body(description="Playlist to play")
+            ] = None,
+            preset: Annotated[
+                Optional[str], Body(description="Preset to start")
+            ] = None,
+            args: Annotated[
+                Dict[str, Any], Body(description="Arguments for the preset")
+            ] = None,
+            stop: Annotated[bool, Body(description="Stop the presets")] = False,
+            segment: Annotated[
+                Optional[str],
+                Body(description="Segment to act on, defaults to the whole strip"),
+            ] = None,
+            transition: Annotated[
+                Optional[float],
+                Body(ge=0.0, le=60.0, description="Transition duration in seconds"),
+            ] = None,
+            easing: Annotated[
+                Optional[Easing], Body(description="Transition easing curve")
+            ] = None,
+        ):
+            """
+            Create or replace a rule that plays a playlist, starts a preset or
+            stops the presets at given times
+
+            Args:
+                rule_name (str): Name of the rule
+                when (str): Cron expression ("minute hour day month weekday") or "HH:MM" for every day
+                playlist (str): Playlist to play
+                preset (str): Preset to start
+                args (dict): Arguments for the preset
+                stop (bool): Stop the presets (on the segment if one is given)
+                segment (str): Segment to act on, defaults to the whole strip
+                transition (float): Transition duration in seconds, defaults to the server setting
+                easing (str): Transition easing curve, defaults to the server setting
+
+            Returns:
+                dict: The next run of the rule
+            """
+            if sum((playlist is not None, preset is not None, stop)) != 1:
+                raise HTTPException(
+                    status_code=400,
+                    detail="A rule needs exactly one of playlist, preset or stop",
+                )
+            schedule = await asyncio.to_thread(self.control.schedule)
+            state = await asyncio.to_thread(self.control.state)
+            if playlist is not None and playlist not in schedule["playlists"]:
+                raise HTTPException(status_code=404, detail="Playlist not found")
+            if preset is not None:
+                if not self.effect_registry.is_effect(preset):
+                    raise HTTPException(status_code=404, detail="Preset not found")
+                args = validate_args(preset, args) or None
+            if segment is not None and segment not in state["segments"]:
+                raise HTTPException(status_code=404, detail="Segment not found")
+
+            rule = {
+                "when": when,
+                "playlist": playlist,
+                "preset": preset,
+                "args": args,
+                "stop": stop or None,
+                "segment": segment,
+                "transition": transition,
+                "easing": easing,
+            }
+            try:
+                await asyncio.to_thread(
+                    self.control.set_rule,
+                    rule_name,
+                    {k: v for k, v in rule.items() if v is not None},
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            schedule = await asyncio.to_thread(self.control.schedule)
+            return {"next_run": schedule["rules"][rule_name]["next_run"]}
+
+        @self.delete("/schedule/{rule_name}")
+        async def delete_rule(
+            rule_name: Annotated[str, Path(description="Name of the rule")],
+        ):
+            """
+            Remove a schedule rule
+
+            Args:
+                rule_name (str): Name of the rule
+
+            Returns:
+                Null
+            """
+            try:
+                await asyncio.to_thread(self.control.remove_rule, rule_name)
+            except KeyError:
+                raise HTTPException(status_code=404, detail="Rule not found")
+
+        @self.get("/metrics", response_class=PlainTextResponse)
+        async def get_metrics():
+            """
+            Get render loop metrics in the Prometheus text format
+
+            Returns:
+                str: Histograms, counters and gauges in the Prometheus exposition format
+            """
+            return PlainTextResponse(
+                await asyncio.to_thread(self.control.metrics),
+                media_type=metrics.CONTENT_TYPE,
+            )
+
+        @self.websocket("/ws/frames")
+        async def stream_frames(
+            websocket: WebSocket,
+            fps: Annotated[
+                float, Query(gt=0.0, le=60.0, description="Frames per second to send")
+            ] = 30.0,
+        ):
+            """
+            Stream the frames committed to the strip as binary messages
+
+            The committed frame is sampled at `fps` and sent only when it
+            changed, encoded against the previous one (see lib.stream). A slow
+            client just gets fewer frames, the render loop never waits for it.
+
+            Args:
+                fps (float): Frames per second to send
+            """
+            await websocket.accept()
+
+            async def wait_disconnect():
+                # Clients don't send anything, read until they go away as no
+                # frame may be sent (and fail) for a while
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        return
+
+            closed = asyncio.ensure_future(wait_disconnect())
+            encoder = FrameEncoder()
+            interval = 1.0 / fps
+            loop = asyncio.get_running_loop()
+            next_frame = loop.time()
+
+            try:
+                while not closed.done():
+                    message = encoder.encode(
+                        await asyncio.to_thread(self.control.frame)
+                    )
+                    if message is not None:
+                        await websocket.send_bytes(message)
+
+                    # Sampled on a fixed grid, skipping slots missed while sending
+                    now = loop.time()
+                    next_frame = max(next_frame + interval, now)
+                    await asyncio.wait([closed], timeout=next_frame - now)
+            except ConnectionError:
+                await websocket.close(code=1011, reason="Render engine unavailable")
+            except (WebSocketDisconnect, RuntimeError):
+                # Disconnected while sending
+                pass
+            finally:
+                closed.cancel()
+
+        @self.on_event("startup")
+        async def startup_event():
+            """
+            Start watching the effects folder for changes if hot reload is enabled
+
+            Returns:
+                Null
+            """
+            if self.hot_reload:
+                self.effect_registry.watch(self.control.on_effects_reloaded)
+
+        @self.on_event("shutdown")
+        async def shutdown_event():
+            """
+            Stop the currently running preset and clear the LEDs on shutdown (when
+            the strip is owned by this process, otherwise just disconnect)
+
+            Returns:
+                Null
+            """
+            self.effect_registry.stop_watching()
+            self.previewer.close()
+            await asyncio.to_thread(self.control.close)
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore(object):
+    """
+    Keeps the latest Controller snapshot on disk so the strip resumes after a
+    reboot.
+
+    Saves are debounced: the first one after a write starts a timer, and the
+    snapshot is only taken and written when it fires, so a burst of API calls
+    costs one write (and sees changes the render engine applied in between).
+    Files are replaced atomically, a power cut leaves either the previous or
+    the new snapshot.
+    """
+
+    def __init__(self, path: str, delay: float = 1.0):
+        self.path = path
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.pending = None
+        self.written = None
+        self.timer = None
+
+    def load(self):
+        """
+        Returns:
+            dict: The saved snapshot, None if there is none (or it can't be read)
+        """
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable state file %s: %s", self.path, e)
+            return None
+
+        self.written = state
+        return state
+
+    def save(self, snapshot):
+        """
+        Args:
+            snapshot (callable): Returns the dict to save, called when it is written
+        """
+        with self.lock:
+            self.pending = snapshot
+            if self.timer is None:
+                self.timer = threading.Timer(self.delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """
+        Write the pending snapshot now, if it changed.
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            snapshot, self.pending = self.pending, None
+            if snapshot is None:
+                return
+
+            try:
+                data = json.dumps(snapshot())
+                # Compared as it reads back, tuples in memory are lists in JSON
+                state = json.loads(data)
+                if state == self.written:
+                    return
+                self._write(data)
+            except (OSError, TypeError, ValueError) as e:
+                logger.error("Could not save the state to %s: %s", self.path, e)
+            else:
+                self.written = state
+
+    def _write(self, data: str):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+        # Persist the rename itself
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,61 @@
+import struct
+
+import numpy as np
+
+from lib.transitions import as_array
+
+# First byte of every message
+KEYFRAME = 0
+DELTA = 1
+
+# Changed pixel run of a delta frame: first pixel, number of pixels
+RUN = struct.Struct("<II")
+
+
+class FrameEncoder(object):
+    """
+    Encodes successive RGB frames of one subscriber against the previous one.
+
+    Messages are a type byte followed by:
+
+    - KEYFRAME: the whole RGB frame
+    - DELTA: runs of changed pixels, each a RUN header (first pixel, pixel
+      count, little endian uint32) followed by the run's RGB bytes
+
+    Whichever is smaller is sent. The first frame, and any frame after the
+    pixel count changed, is a keyframe.
+    """
+
+    def __init__(self):
+        self.previous = None
+
+    def encode(self, frame):
+        """
+        Returns:
+            bytes: The message for `frame`, None when it didn't change
+        """
+        current = as_array(frame).reshape(-1, 3)
+        previous = self.previous
+        self.previous = current.copy()
+
+        if previous is None or len(previous) != len(current):
+            return bytes([KEYFRAME]) + current.tobytes()
+
+        changed = (previous != current).any(axis=1)
+        changed_count = int(np.count_nonzero(changed))
+        if not changed_count:
+            return None
+
+        # Run boundaries are where the changed mask flips
+        edges = np.flatnonzero(np.diff(changed.astype(np.int8), prepend=0, append=0))
+        starts = edges[::2]
+        ends = edges[1::2]
+
+        if len(starts) * RUN.size + changed_count * 3 >= current.nbytes:
+            return bytes([KEYFRAME]) + current.tobytes()
+
+        parts = [bytes([DELTA])]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            parts.append(RUN.pack(start, end - start))
+            parts.append(current[start:end].tobytes())
+        return b"".join(parts)
@@ -0,0 +1,90 @@
+import math
+
+import numpy as np
+
+EASINGS = {
+    "linear": lambda x: x,
+    "ease_in": lambda x: x * x,
+    "ease_out": lambda x: 1.0 - (1.0 - x) * (1.0 - x),
+    "ease_in_out": lambda x: 0.5 - math.cos(math.pi * x) / 2.0,
+    "smoothstep": lambda x: x * x * (3.0 - 2.0 * x),
+}
+
+DEFAULT_EASING = "ease_in_out"
+
+
+def as_array(frame):
+    """
+    Flat uint8 view over any RGB frame buffer (bytes, memoryview or ndarray).
+    """
+    return np.frombuffer(memoryview(frame).cast("B"), dtype=np.uint8)
+
+
+def blend(a, b, alpha: float):
+    """
+    Blend two RGB frames, alpha 0.0 is all `a` and 1.0 is all `b`.
+    """
+    a = as_array(a)
+    b = as_array(b)
+    return (a + (b.astype(np.float32) - a) * alpha).astype(np.uint8)
+
+
+class Transition(object):
+    def __init__(self, duration: float, easing: str = DEFAULT_EASING):
+        if easing not in EASINGS:
+            raise ValueError(f"Unknown easing {easing}")
+
+        self.duration = max(float(duration), 0.0)
+        self.easing = EASINGS[easing]
+        self.elapsed = 0.0
+
+    @property
+    def done(self):
+        return self.elapsed >= self.duration
+
+    def advance(self, dt: float):
+        """
+        Move the transition forward by dt seconds and return the eased progress.
+        """
+        self.elapsed += dt
+        if self.done:
+            return 1.0
+        return self.easing(self.elapsed / self.duration)
+
+
+class Crossfade(Transition):
+    """
+    Blends from a source to the frames of the effect that owns the transition.
+
+    The source is either a previously running effect, which keeps animating
+    on its own clock until the fade completes, or a fixed RGB frame (e.g. the
+    static color the strip was showing).
+    """
+
+    def __init__(self, source, duration: float, easing: str = DEFAULT_EASING):
+        super().__init__(duration, easing)
+        self.source = source
+
+    def apply(self, frame, dt: float):
+        alpha = self.advance(dt)
+        if self.done:
+            # Drop the source so the old effect can be garbage collected
+            self.source = None
+            return frame
+
+        source = self.source
+        if hasattr(source, "render"):
+            source.clock += dt
+            source = source.render(source.clock, dt)
+
+        return blend(source, frame, alpha)
+
+
+class FadeOut(Transition):
+    """
+    Fades the owning effect's frames to black.
+    """
+
+    def apply(self, frame, dt: float):
+        alpha = self.advance(dt)
+        return (as_array(frame) * (1.0 - alpha)).astype(np.uint8)
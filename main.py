@@ -1,5 +1,75 @@
+import os
+
 from lib.server import LightWave
-from lib.config import LED_COUNT, LED_PIN
+from lib.config import (
+    LED_COUNT,
+    LED_PIN,
+    LED_BACKEND,
+    LED_SEGMENTS,
+    LED_GAMMA,
+    LED_TEMPERATURE,
+    CACHE_DIR,
+    ENGINE_SOCKET,
+    EFFECTS_HOT_RELOAD,
+    EFFECTS_RELOAD_RESTART,
+    TRANSITION_DURATION,
+    TRANSITION_EASING,
+    FRAME_CACHE_SIZE,
+    REALTIME_DDP_PORT,
+    REALTIME_E131_PORT,
+    REALTIME_E131_UNIVERSE,
+    REALTIME_TIMEOUT,
+    AUDIO_SOURCE,
+    AUDIO_SAMPLE_RATE,
+    AUDIO_BLOCK,
+    STATE_FILE,
+    STATE_SAVE_DELAY,
+    PREVIEW_CACHE_DIR,
+    PREVIEW_CACHE_SIZE,
+)
 from lib.led import LED, EffectRegistry
+from lib.preview import PreviewCache, Previewer
+
+effect_registry = EffectRegistry(manifest_path=os.path.join(CACHE_DIR, "effects.json"))
+
+if ENGINE_SOCKET:
+    # The hardware owner process (python -m lib.owner) drives the strip
+    from lib.owner import RemoteController
+
+    control = RemoteController(ENGINE_SOCKET)
+else:
+    from lib.control import Controller
+    from lib.frame_cache import FrameCache
+    from lib.snapshot import StateStore
+
+    control = Controller(
+        LED(
+            LED_PIN,
+            LED_COUNT,
+            backend=LED_BACKEND,
+            segments=LED_SEGMENTS,
+            gamma=LED_GAMMA,
+            temperature=LED_TEMPERATURE,
+        ),
+        effect_registry,
+        transition=TRANSITION_DURATION,
+        easing=TRANSITION_EASING,
+        reload_restart=EFFECTS_RELOAD_RESTART,
+        frame_cache=FrameCache(FRAME_CACHE_SIZE) if FRAME_CACHE_SIZE else None,
+        store=StateStore(STATE_FILE, STATE_SAVE_DELAY) if STATE_FILE else None,
+    )
+    # Before the API is up, so the strip resumes right away
+    control.restore()
+    control.listen_realtime(
+        REALTIME_DDP_PORT, REALTIME_E131_PORT, REALTIME_E131_UNIVERSE, REALTIME_TIMEOUT
+    )
+    if AUDIO_SOURCE:
+        control.listen_audio(AUDIO_SOURCE, AUDIO_SAMPLE_RATE, AUDIO_BLOCK)
+
+previewer = Previewer(
+    PreviewCache(PREVIEW_CACHE_DIR, PREVIEW_CACHE_SIZE) if PREVIEW_CACHE_SIZE else None
+)
 
-app = LightWave(LED(LED_PIN, LED_COUNT), EffectRegistry())
\ No newline at end of file
+app = LightWave(
+    control, effect_registry, hot_reload=EFFECTS_HOT_RELOAD, previewer=previewer
+)